@@ -0,0 +1,339 @@
+"""
+Benchmarks for building the vocabulary and converting data.
+
+Times the schema lookups, codelist parsing, make_graph, ttl() and
+write_docs against the checked-in schemas and against synthetically scaled
+ones (extra $defs and longer codelists), and conversion of generated BODS
+statements. Results are written as JSON, and can be checked against a
+baseline file from an earlier run:
+
+    python benchmark.py run --output bench.json
+    python benchmark.py run --baseline bench.json --tolerance 0.2
+
+Statement streams for benchmarking conversion at scale can be written with:
+
+    python benchmark.py generate 1000000 statements-1m.jsonl
+"""
+import io
+import sys
+import copy
+import contextlib
+import json
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+from time import perf_counter
+
+from helpers import *
+from bodsld import bods_vocab
+from convert import Converter
+
+
+DEFAULT_REPEAT = 3
+DEFAULT_STATEMENTS = 10000
+DEFAULT_DEFS = 300
+DEFAULT_CODES = 200
+RECORD_SCHEMA_FILES = ["entity-record.json", "person-record.json",
+  "relationship-record.json"]
+DEFAULT_TOLERANCE = 0.2
+# Differences smaller than this are timer noise, not regressions
+MIN_SLOWDOWN = 0.001
+
+JURISDICTIONS = [
+    ("United Kingdom", "GB"),
+    ("France", "FR"),
+    ("Kenya", "KE"),
+    ("Brazil", "BR"),
+    ("Indonesia", "ID"),
+]
+PUBLISHERS = [
+    {"name": "Companies House", "url": "https://example.gov.uk/"},
+    {"name": "Open Ownership Register"},
+    {"name": "Profitech Ltd"},
+]
+INTEREST_TYPES = ["shareholding", "votingRights", "appointmentOfBoard",
+  "seniorManagingOfficial", "otherInfluenceOrControl"]
+GIVEN_NAMES = ["Jennifer", "Amadou", "Li", "Maria", "Oluwaseun", "Sven"]
+FAMILY_NAMES = ["Hewitson-Smith", "Diallo", "Wei", "Silva", "Adeyemi"]
+
+
+def timed(fn, repeat=DEFAULT_REPEAT, setup=None):
+    """
+    Run fn repeat times (calling setup first, untimed, each time if given)
+    and return the min and median wall time.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = perf_counter()
+        fn()
+        times.append(perf_counter() - start)
+    return {
+        "min": round(min(times), 6),
+        "median": round(statistics.median(times), 6),
+        "runs": repeat,
+    }
+
+
+def scaled_schemas(schemas, codelists, defs=DEFAULT_DEFS, codes=DEFAULT_CODES):
+    """
+    Copies of the schemas with defs extra $defs in components.json (copies
+    of the existing ones), each referenced by a new property of one of the
+    record schemas, so make_graph maps them, and codes extra codes in every
+    codelist.
+    """
+    schemas = copy.deepcopy(schemas)
+    components = schemas["components.json"]["$defs"]
+    originals = [*components.items()]
+    records = [schemas[fn]["properties"] for fn in RECORD_SCHEMA_FILES]
+    for i in range(defs):
+        name, definition = originals[i % len(originals)]
+        components[f"{name}Synthetic{i}"] = copy.deepcopy(definition)
+        prop = f"{name[:1].lower()}{name[1:]}Synthetic{i}"
+        records[i % len(records)][prop] = {
+            "title": f"{definition.get('title', name)} {i}",
+            "description": definition.get("description", name),
+            "$ref": f"urn:components#/$defs/{name}Synthetic{i}",
+        }
+
+    scaled = {}
+    for fn, text in codelists.items():
+        rows = [f"synthetic{i},Synthetic {i},A generated code number {i}."
+          for i in range(codes)]
+        scaled[fn] = text.rstrip("\n") + "\n" + "\n".join(rows) + "\n"
+    return schemas, scaled
+
+
+def generate_statements(n, seed=0):
+    """
+    Yield n synthetic BODS v0.4 statements: entities, people and the
+    relationships between them, in that order, with a few publishers and
+    jurisdictions shared between them.
+    """
+    rnd = random.Random(seed)
+    for i in range(n):
+        group, kind = divmod(i, 3)
+        jurisdiction = rnd.choice(JURISDICTIONS)
+        date = f"20{rnd.randint(10, 24):02d}-{rnd.randint(1, 12):02d}-" \
+          f"{rnd.randint(1, 28):02d}"
+        statement = {
+            "statementId": f"statement-{i}",
+            "declarationSubject": f"entity-{group}",
+            "declaration": f"declaration-{group}",
+            "statementDate": date,
+            "recordStatus": "new",
+            "publicationDetails": {
+                "publicationDate": date,
+                "bodsVersion": "0.4",
+                "publisher": rnd.choice(PUBLISHERS),
+            },
+            "source": {
+                "type": ["officialRegister"],
+                "retrievedAt": f"{date}T00:00:00Z",
+            },
+        }
+        country = {"name": jurisdiction[0], "code": jurisdiction[1]}
+        if kind == 0:
+            statement["recordId"] = f"entity-{group}"
+            statement["recordType"] = "entity"
+            statement["recordDetails"] = {
+                "isComponent": False,
+                "entityType": {"type": "registeredEntity"},
+                "name": f"Company {group} Ltd",
+                "jurisdiction": country,
+                "foundingDate": date,
+                "identifiers": [{
+                    "id": f"{rnd.randrange(10**8):08d}",
+                    "scheme": f"{jurisdiction[1]}-REG",
+                }],
+                "addresses": [{
+                    "type": "registered",
+                    "address": f"{rnd.randint(1, 200)} High Street",
+                    "country": country,
+                }],
+            }
+        elif kind == 1:
+            given = rnd.choice(GIVEN_NAMES)
+            family = rnd.choice(FAMILY_NAMES)
+            statement["recordId"] = f"person-{group}"
+            statement["recordType"] = "person"
+            statement["recordDetails"] = {
+                "isComponent": False,
+                "personType": "knownPerson",
+                "names": [{
+                    "type": "legal",
+                    "fullName": f"{given} {family}",
+                    "givenName": given,
+                    "familyName": family,
+                }],
+                "nationalities": [country],
+                "birthDate": f"19{rnd.randint(40, 99)}-{rnd.randint(1, 12):02d}",
+            }
+        else:
+            statement["recordId"] = f"relationship-{group}"
+            statement["recordType"] = "relationship"
+            statement["recordDetails"] = {
+                "isComponent": False,
+                "subject": f"entity-{group}",
+                "interestedParty": f"person-{group}",
+                "interests": [{
+                    "type": rnd.choice(INTEREST_TYPES),
+                    "directOrIndirect": "direct",
+                    "beneficialOwnershipOrControl": True,
+                    "startDate": date,
+                    "share": {"exact": rnd.randint(1, 100)},
+                }],
+            }
+        yield statement
+
+
+def write_statements(n, filename, seed=0):
+    with open(filename, "w", encoding="utf-8") as f:
+        for statement in generate_statements(n, seed):
+            f.write(json.dumps(statement) + "\n")
+
+
+def bench_vocab(name, schemas, codelists, repeat, results):
+    index = SchemaIndex(schemas)
+    pointers = [*index.nodes]
+    filenames = [*codelists]
+    store = CodelistStore(codelists)
+
+    def lookups():
+        for pointer in pointers:
+            find_a_bit(index, pointer)
+
+    def codes(codelists):
+        for fn in filenames:
+            get_codes_and_info(codelists, fn)
+
+    def make_graph():
+        vocab = bods_vocab(schemas, codelists)
+        vocab.make_graph()
+        return vocab
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        vocab = make_graph()
+        results[f"{name}/schema_registry"] = timed(
+          lambda: schema_registry(schemas), repeat)
+        results[f"{name}/schema_index"] = timed(
+          lambda: SchemaIndex(schemas), repeat)
+        results[f"{name}/find_a_bit"] = timed(lookups, repeat)
+        results[f"{name}/get_codes_and_info"] = timed(
+          lambda: codes(codelists), repeat)
+        results[f"{name}/get_codes_and_info_store"] = timed(
+          lambda: codes(store), repeat)
+        results[f"{name}/make_graph"] = timed(make_graph, repeat)
+
+        def reset_ttl():
+            vocab._ttl = None
+        results[f"{name}/ttl"] = timed(vocab.ttl, repeat, setup=reset_ttl)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            docs = os.path.join(tmp, "docs.html")
+            results[f"{name}/write_docs"] = timed(
+              lambda: vocab.write_docs(docs), repeat)
+    return vocab
+
+
+def bench_convert(plan, n, repeat, results):
+    statements = [*generate_statements(n)]
+    converter = Converter(plan)
+
+    def convert():
+        out = io.StringIO()
+        for quad in converter.convert(statements):
+            out.write(converter.nquad(quad))
+
+    result = timed(convert, repeat)
+    result["statements_per_second"] = round(n / result["min"])
+    result["term_cache"] = converter.terms.report()
+    results[f"convert/{n}"] = result
+
+
+def run(repeat=DEFAULT_REPEAT, statements=DEFAULT_STATEMENTS,
+  defs=DEFAULT_DEFS, codes=DEFAULT_CODES, schema_dir="schemas"):
+    schemas, codelists = get_schemas_and_codelists(schema_dir)
+    results = {}
+    vocab = bench_vocab("schemas", schemas, codelists, repeat, results)
+    bench_vocab("scaled", *scaled_schemas(schemas, codelists, defs, codes),
+      repeat, results)
+    bench_convert(vocab.mapping_plan(), statements, repeat, results)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "statements": statements,
+        "defs": defs,
+        "codes": codes,
+        "results": results,
+    }
+
+
+def regressions(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Benchmarks whose min time is more than tolerance (a fraction), and
+    MIN_SLOWDOWN seconds, slower than in baseline, as
+    (name, baseline min, new min).
+    """
+    slower = []
+    for name, result in report["results"].items():
+        before = baseline["results"].get(name)
+        if before and result["min"] > before["min"] * (1 + tolerance) and \
+          result["min"] - before["min"] > MIN_SLOWDOWN:
+            slower.append((name, before["min"], result["min"]))
+    return slower
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", help="write the results to this file")
+    run_parser.add_argument("--baseline",
+      help="fail if slower than the results in this file")
+    run_parser.add_argument("--tolerance", type=float,
+      default=DEFAULT_TOLERANCE,
+      help="how much slower than the baseline is allowed (0.2 is 20%%)")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument("--statements", type=int,
+      default=DEFAULT_STATEMENTS, help="statements to convert")
+    run_parser.add_argument("--defs", type=int, default=DEFAULT_DEFS,
+      help="extra $defs in the scaled schemas")
+    run_parser.add_argument("--codes", type=int, default=DEFAULT_CODES,
+      help="extra codes in each of the scaled codelists")
+    run_parser.add_argument("--schema-dir", default="schemas")
+
+    gen_parser = commands.add_parser("generate",
+      help="write synthetic BODS statements as JSON Lines")
+    gen_parser.add_argument("count", type=int)
+    gen_parser.add_argument("output")
+    gen_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        write_statements(args.count, args.output, args.seed)
+        sys.exit()
+
+    report = run(args.repeat, args.statements, args.defs, args.codes,
+      args.schema_dir)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = regressions(report, baseline, args.tolerance)
+        for name, before, after in slower:
+            print(f"{name}: {before:.4f}s -> {after:.4f}s", file=sys.stderr)
+        if slower:
+            sys.exit(1)
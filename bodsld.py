@@ -1,38 +1,185 @@
+import time
+import pstats
+import cProfile
+import argparse
+from contextlib import ExitStack
+from collections import Counter
+from functools import cached_property
+from concurrent.futures import ProcessPoolExecutor
+
 from rdflib import Graph, URIRef, Literal, Namespace
 from rdflib.namespace import RDF, RDFS, XSD, OWL, DCTERMS
-from pylode.profiles.ontpub import OntPub
 
+import helpers
 from helpers import *
-
-
-BODS = Namespace("https://vocab.openownership.org/terms#")
-CODES = Namespace("https://vocab.openownership.org/codelists#")
-ORGID = Namespace("https://org-id.guide/list/")
+from export import export_graph
+from constants import NAMESPACES
+
+
+BODS = Namespace(NAMESPACES["bods"])
+CODES = Namespace(NAMESPACES["codes"])
+ORGID = Namespace(NAMESPACES["orgid"])
+
+
+# Where the script keeps the triples from each step between runs (in the
+# schema directory, so builds of different schemas don't share it)
+BUILD_CACHE = ".bodsld-cache"
+
+# The ontology's metadata, if a build doesn't give its own
+METADATA = {
+    "uri": "https://standard.openownership.org/terms",
+    "label": "Beneficial Ownership Data Standard v0.4",
+    "comment": "The RDF vocabulary for the Beneficial Ownership Data "
+      "Standard v0.4",
+}
+
+# What a build makes, if it isn't given in the manifest (see build). A
+# build with a ref and no schema_dir gets its own directory under
+# schema_dir (see build_spec)
+DEFAULT_BUILD = {
+    "schema_dir": "schemas",
+    "version": "0.4.0",
+}
+
+# File extensions for each of the formats write_formats can write
+EXTENSIONS = {
+    "turtle": ".ttl",
+    "nt": ".nt",
+    "xml": ".rdf",
+    "json-ld": ".jsonld",
+}
+
+# The map_* steps make_graph runs, in order
+MAP_STEPS = [
+    "map_statement",
+    "map_declaration",
+    "map_record",
+    "map_person",
+    "map_entity",
+    "map_relationship",
+    "map_unspecified",
+    "map_interest",
+    "map_address",
+    "map_agent",
+    "map_annotation",
+    "map_jurisdiction",
+    "map_identifier",
+    "map_name",
+    "map_pepstatus",
+    "map_politicalexposure",
+    "map_securitieslisting",
+    "map_source",
+]
+
+# Datatypes JSON values are given, if they're in the property's range
+DATATYPES = [XSD.dateTime, XSD.float, XSD.boolean]
+
+# Where the JSON for statements and records is described in the schemas
+STATEMENT_SCHEMA = "urn:statement#/$defs/Statement"
+RECORD_SCHEMAS = {
+    "entity": "urn:entity",
+    "person": "urn:person",
+    "relationship": "urn:relationship",
+}
+NAME_SCHEMA = "urn:person#/$defs/Name"
+UNSPECIFIED_SCHEMA = "urn:components#/$defs/UnspecifiedRecord"
+
+# Objects whose properties are flattened into their parent, and what those
+# properties are called in the vocabulary if it isn't the usual renaming
+# (see map_statement, map_entity, map_person and map_interest)
+FLATTEN = {
+    "publicationDetails": {},
+    "publicListing": {},
+    "share": {},
+    "formedByStatute": {
+        "name": "formedByStatuteName",
+        "date": "formedByStatuteDate",
+    },
+    "entityType": {
+        "type": "entityType",
+        "subtype": "entitySubtype",
+        "details": "entityTypeDetails",
+    },
+    "politicalExposure": {
+        "status": "pepStatus",
+        "details": "politicalExposure",
+    },
+}
+
+# Agent isn't in the schema (see map_agent)
+AGENT_RENAMES = {
+    "name": "agentName",
+    "url": "agentUri",
+    "uri": "agentUri",
+}
+
+# politicalExposure/status isn't a codelist (see map_pepstatus)
+PEP_STATUS = {
+    "isPep": str(BODS.PEP),
+    "isNotPep": str(BODS.NotPEP),
+    "unknown": str(BODS.PEPMissing),
+}
+
+# Statement properties that need the rest of the statement to convert
+STATEMENT_RULES = {
+    "recordDetails": ["details", str(BODS.recordDetails)],
+    "declaration": ["declaration", str(BODS.declaration)],
+}
+
+
+class VocabGraph(Graph):
+    """
+    A Graph that counts changes to itself, so anything derived from it
+    (like the serialization) can tell when it's out of date.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changes = 0
+
+    def add(self, triple):
+        self.changes += 1
+        return super().add(triple)
+
+    def addN(self, quads):
+        self.changes += 1
+        return super().addN(quads)
+
+    def remove(self, triple):
+        self.changes += 1
+        return super().remove(triple)
 
 
 class BODSVocab:
 
     def __init__(self, schema_files, codelists):
 
-        self.registry = schema_registry(schema_files)
-        self.schemas = schema_resources(schema_files)
-        self.codelists = codelists
+        self.index = SchemaIndex(schema_files)
+        self.schema_files = schema_files
+        self.codelists = codelist_store(codelists)
 
         self.exclude = []
         self.rename = []
         self.rename_map = {}
         self.date_props = []
+        self.uri_props = []
+        self.name_props = []
 
-        self.record_types = get_codes_and_info(self.codelists, "recordType.csv")
-        
-        self.g = Graph()
+        self.g = VocabGraph()
+        # What the map_* steps add to and remove from (see run_step)
+        self.triples = None
+        self._ttl = None
         self.g.bind("bods", BODS)
         self.g.bind("codes", CODES)
         self.g.bind("orgid", ORGID)
 
-        count = len(self.schemas)
+        count = len(schema_files)
         print(f"Found {count} schemas.")
 
+    @cached_property
+    def schemas(self):
+        return schema_resources(self.schema_files)
+
     def exclude_properties(self, exclude):
         self.exclude = exclude
 
@@ -52,27 +199,28 @@ class BODSVocab:
         self.g.add((ont_uri, RDFS.comment, Literal(comment)))
 
     def map_class(self, classname, path):
-        self.g.add((classname, RDF.type, OWL.Class))
+        self.triples.add((classname, RDF.type, OWL.Class))
 
         title = self.get_title(path)
         descr = self.get_description(path)
         # Special case for person/entity/relationship
         if title == None:
+            record_types = self.codelists.info("recordType.csv")
             if "relationship" in path:
-                title = self.record_types.get("relationship")[0]
-                descr = self.record_types.get("relationship")[1]
+                title = record_types.get("relationship")[0]
+                descr = record_types.get("relationship")[1]
             if "person" in path:
-                title = self.record_types.get("person")[0]
-                descr = self.record_types.get("person")[1]
+                title = record_types.get("person")[0]
+                descr = record_types.get("person")[1]
             if "entity" in path:
-                title = self.record_types.get("entity")[0]
-                descr = self.record_types.get("entity")[1]
+                title = record_types.get("entity")[0]
+                descr = record_types.get("entity")[1]
 
-        self.g.add((classname, RDFS.label, Literal(title)))
-        self.g.add((classname, RDFS.comment, Literal(descr)))
+        self.triples.add((classname, RDFS.label, Literal(title)))
+        self.triples.add((classname, RDFS.comment, Literal(descr)))
 
     def map_properties(self, domain, path):
-        properties = get_properties(self.registry, path)
+        properties = get_properties(self.index, path)
         props = {}
         for p in properties:
             if p not in self.exclude:
@@ -87,55 +235,117 @@ class BODSVocab:
 
             title = self.get_title(path) or prop
             description = self.get_description(path) or prop
-            self.g.add((BODS[prop], RDF.type, RDF.Property))
-            self.g.add((BODS[prop], RDFS.domain, domain))
-            self.g.add((BODS[prop], RDFS.label, Literal(title)))
-            self.g.add((BODS[prop], RDFS.comment, Literal(description)))
+            self.triples.add((BODS[prop], RDF.type, RDF.Property))
+            self.triples.add((BODS[prop], RDFS.domain, domain))
+            self.triples.add((BODS[prop], RDFS.label, Literal(title)))
+            self.triples.add((BODS[prop], RDFS.comment, Literal(description)))
 
             if prop_range:
-                self.g.add((BODS[prop], RDFS.range, prop_range))
+                self.triples.add((BODS[prop], RDFS.range, prop_range))
 
     def map_types(self, subclassof, bodstype, codelist):
-        self.g.add((bodstype, RDF.type, OWL.Class))
-        types = get_codes_and_info(self.codelists, codelist)
+        self.triples.add((bodstype, RDF.type, OWL.Class))
+        types = self.codelists.info(codelist)
         
         for code in types:
             t = cap_first(code)
-            self.g.add((BODS[t], RDF.type, OWL.Class))
-            self.g.add((BODS[t], RDFS.subClassOf, subclassof))
-            self.g.add((BODS[t], RDFS.label, Literal(types.get(code)[0])))
-            self.g.add((BODS[t], RDFS.comment, Literal(types.get(code)[1])))
+            self.triples.add((BODS[t], RDF.type, OWL.Class))
+            self.triples.add((BODS[t], RDFS.subClassOf, subclassof))
+            self.triples.add((BODS[t], RDFS.label, Literal(types.get(code)[0])))
+            self.triples.add((BODS[t], RDFS.comment, Literal(types.get(code)[1])))
 
     def map_instances(self, instance_class, codelist):
-        self.g.add((instance_class, RDF.type, OWL.Class))
-        types = get_codes_and_info(self.codelists, codelist)
+        self.triples.add((instance_class, RDF.type, OWL.Class))
+        types = self.codelists.info(codelist)
         
         for code, info in types.items():
             t = cap_first(code)
-            self.g.add((CODES[t], RDF.type, instance_class))
-            self.g.add((CODES[t], RDFS.label, Literal(types.get(code)[0])))
-            self.g.add((CODES[t], RDFS.comment, Literal(types.get(code)[1])))
-
-
-    def make_graph(self):
-        self.map_statement()
-        self.map_declaration()
-        self.map_record()
-        self.map_person()
-        self.map_entity()
-        self.map_relationship()
-        self.map_unspecified()
-        self.map_interest()
-        self.map_address()
-        self.map_agent()
-        self.map_annotation()
-        self.map_jurisdiction()
-        self.map_identifier()
-        self.map_name()
-        self.map_pepstatus()
-        self.map_politicalexposure()
-        self.map_securitieslisting()
-        self.map_source()
+            self.triples.add((CODES[t], RDF.type, instance_class))
+            self.triples.add((CODES[t], RDFS.label, Literal(types.get(code)[0])))
+            self.triples.add((CODES[t], RDFS.comment, Literal(types.get(code)[1])))
+
+
+    def make_graph(self, cache=None):
+        """
+        Run each of the MAP_STEPS to build the graph.
+        If a cache dict is given, steps whose inputs (the schema pointers and
+        codelists they read, the mapping config and the mapping code) haven't
+        changed since it was filled are replayed from it instead, and it is
+        updated with the steps that did run.
+        The steps' triples are collected in a TripleBuffer, checked for
+        conflicting values, and loaded into the graph in one go.
+        """
+        config = self.config_digest()
+        rebuilt = 0
+        triples = TripleBuffer()
+        for step in MAP_STEPS:
+            start = time.perf_counter()
+            entry = cache.get(step) if cache is not None else None
+            replayed = bool(entry) and self.step_unchanged(entry, config)
+            if not replayed:
+                entry = self.run_step(step)
+                entry["config"] = config
+                rebuilt += 1
+                if cache is not None:
+                    cache[step] = entry
+            triples.update(entry["added"], entry["removed"])
+            stats.steps[step] = {
+                "seconds": round(time.perf_counter() - start, 6),
+                "added": len(entry["added"]),
+                "removed": len(entry["removed"]),
+                "replayed": replayed,
+            }
+
+        conflicts = triples.conflicts()
+        stats.conflicts = [[str(s), str(p), sorted(map(str, values))]
+          for (s, p), values in conflicts.items()]
+        if conflicts:
+            print(f"{len(conflicts)} terms have more than one label, "
+              "comment or range.")
+        triples.flush(self.g)
+
+        if cache is not None:
+            print(f"Rebuilt {rebuilt} of {len(MAP_STEPS)} steps.")
+
+    def run_step(self, step):
+        self.index.reads = set()
+        self.codelists.reads = set()
+        self.triples = TripleBuffer()
+        try:
+            getattr(self, step)()
+            return {
+                "schema_reads": {p: self.pointer_digest(p)
+                  for p in self.index.reads},
+                "codelist_reads": {fn: digest(self.codelists.codelists[fn])
+                  for fn in self.codelists.reads},
+                "added": self.triples.added(),
+                "removed": self.triples.removed(),
+            }
+        finally:
+            self.index.reads = None
+            self.codelists.reads = None
+            self.triples = None
+
+    def step_unchanged(self, entry, config):
+        if entry["config"] != config:
+            return False
+        for pointer, d in entry["schema_reads"].items():
+            if self.pointer_digest(pointer) != d:
+                return False
+        for fn, d in entry["codelist_reads"].items():
+            if fn not in self.codelists or \
+              digest(self.codelists.codelists[fn]) != d:
+                return False
+        return True
+
+    def pointer_digest(self, pointer):
+        return digest([self.index.nodes.get(pointer),
+          self.index.refs.get(pointer)])
+
+    def config_digest(self):
+        return digest([self.exclude, self.rename, self.rename_map,
+          self.date_props, self.uri_props, self.name_props,
+          file_digest(__file__, helpers.__file__)])
 
     def map_statement(self):
         path = "/$defs/Statement"
@@ -143,7 +353,6 @@ class BODSVocab:
 
         # Turn recordStatus codelist into classes
         self.map_types(BODS.Statement, BODS.Statement, "recordStatus.csv")
-        record_status = get_codes_and_info(self.codelists, "recordStatus.csv")
 
         # Statement properties
         self.map_properties(BODS.Statement, path)
@@ -152,45 +361,45 @@ class BODSVocab:
 
         # Range fixup
         # TODO: can I automate these ranges from the $ref?
-        self.g.add((BODS.annotation, RDFS.range, BODS.Annotation))
-        self.g.add((BODS.declaration, RDFS.range, BODS.Declaration))
-        self.g.add((BODS.publisher, RDFS.range, BODS.Agent))
-        self.g.add((BODS.source, RDFS.range, BODS.Source))
-        self.g.add((BODS.recordDetails, RDFS.range, BODS.RecordDetails))
+        self.triples.add((BODS.annotation, RDFS.range, BODS.Annotation))
+        self.triples.add((BODS.declaration, RDFS.range, BODS.Declaration))
+        self.triples.add((BODS.publisher, RDFS.range, BODS.Agent))
+        self.triples.add((BODS.source, RDFS.range, BODS.Source))
+        self.triples.add((BODS.recordDetails, RDFS.range, BODS.RecordDetails))
 
     def map_declaration(self):
         # Set label and description as these aren't in the JSON
         label = "Declaration"
         descr = "Each declaration is a set of claims about the entities, people and relationships within the subject’s beneficial ownership network."
 
-        self.g.add((BODS.Declaration, RDF.type, OWL.Class))
-        self.g.add((BODS.Declaration, RDFS.label, Literal(label)))
-        self.g.add((BODS.Declaration, RDFS.comment, Literal(descr)))
+        self.triples.add((BODS.Declaration, RDF.type, OWL.Class))
+        self.triples.add((BODS.Declaration, RDFS.label, Literal(label)))
+        self.triples.add((BODS.Declaration, RDFS.comment, Literal(descr)))
 
         ## Declaration properties
 
-        self.g.add((BODS.declarationIdString, RDF.type, RDF.Property))
-        self.g.add((BODS.declarationIdString, RDFS.domain, BODS.Declaration))
-        self.g.add((BODS.declarationIdString, RDFS.range, RDFS.Literal))
-        self.g.add((BODS.declarationIdString, RDFS.label, Literal(self.get_title("/$defs/Statement/properties/declaration"))))
-        self.g.add((BODS.declarationIdString, RDFS.comment, Literal(self.get_description("/$defs/Statement/properties/declaration"))))
+        self.triples.add((BODS.declarationIdString, RDF.type, RDF.Property))
+        self.triples.add((BODS.declarationIdString, RDFS.domain, BODS.Declaration))
+        self.triples.add((BODS.declarationIdString, RDFS.range, RDFS.Literal))
+        self.triples.add((BODS.declarationIdString, RDFS.label, Literal(self.get_title("/$defs/Statement/properties/declaration"))))
+        self.triples.add((BODS.declarationIdString, RDFS.comment, Literal(self.get_description("/$defs/Statement/properties/declaration"))))
 
-        self.g.add((BODS.declarationSubject, RDF.type, RDF.Property))
-        self.g.add((BODS.declarationSubject, RDFS.domain, BODS.Declaration))
-        self.g.add((BODS.declarationSubject, RDFS.range, BODS.Entity))
-        self.g.add((BODS.declarationSubject, RDFS.range, BODS.Person))
-        self.g.add((BODS.declarationSubject, RDFS.label, Literal(self.get_title("/$defs/Statement/properties/declarationSubject"))))
-        self.g.add((BODS.declarationSubject, RDFS.comment, Literal(self.get_description("/$defs/Statement/properties/declarationSubject"))))
+        self.triples.add((BODS.declarationSubject, RDF.type, RDF.Property))
+        self.triples.add((BODS.declarationSubject, RDFS.domain, BODS.Declaration))
+        self.triples.add((BODS.declarationSubject, RDFS.range, BODS.Entity))
+        self.triples.add((BODS.declarationSubject, RDFS.range, BODS.Person))
+        self.triples.add((BODS.declarationSubject, RDFS.label, Literal(self.get_title("/$defs/Statement/properties/declarationSubject"))))
+        self.triples.add((BODS.declarationSubject, RDFS.comment, Literal(self.get_description("/$defs/Statement/properties/declarationSubject"))))
 
     def map_record(self):
-        self.g.add((BODS.RecordDetails, RDF.type, OWL.Class))
-        self.g.add((BODS.RecordDetails, RDFS.label, Literal(self.get_title("/$defs/Statement/properties/recordDetails"))))
-        self.g.add((BODS.RecordDetails, RDFS.comment, Literal(self.get_description("/$defs/Statement/properties/recordDetails"))))
+        self.triples.add((BODS.RecordDetails, RDF.type, OWL.Class))
+        self.triples.add((BODS.RecordDetails, RDFS.label, Literal(self.get_title("/$defs/Statement/properties/recordDetails"))))
+        self.triples.add((BODS.RecordDetails, RDFS.comment, Literal(self.get_description("/$defs/Statement/properties/recordDetails"))))
 
     def map_entity(self):
         path = "urn:entity"
         self.map_class(BODS.Entity, path)
-        self.g.add((BODS.Entity, RDFS.subClassOf, BODS.RecordDetails))
+        self.triples.add((BODS.Entity, RDFS.subClassOf, BODS.RecordDetails))
 
         # Entity properties
         self.map_properties(BODS.Entity, path)
@@ -198,42 +407,42 @@ class BODSVocab:
         self.map_properties(BODS.Entity, publiclisting_path)
 
         # Flatten entity type properties
-        self.g.add((BODS.entitySubtype, RDF.type, RDF.Property))
-        self.g.add((BODS.entitySubtype, RDFS.domain, BODS.Entity))
-        self.g.add((BODS.entitySubtype, RDFS.label,
+        self.triples.add((BODS.entitySubtype, RDF.type, RDF.Property))
+        self.triples.add((BODS.entitySubtype, RDFS.domain, BODS.Entity))
+        self.triples.add((BODS.entitySubtype, RDFS.label,
           Literal(self.get_title("/properties/entityType/properties/subtype"))))
-        self.g.add((BODS.entitySubtype, RDFS.comment,
+        self.triples.add((BODS.entitySubtype, RDFS.comment,
           Literal(self.get_description("/properties/entityType/properties/subtype"))))
-        self.g.add((BODS.entityTypeDetails, RDF.type, RDF.Property))
-        self.g.add((BODS.entityTypeDetails, RDFS.domain, BODS.Entity))
-        self.g.add((BODS.entityTypeDetails, RDFS.label,
+        self.triples.add((BODS.entityTypeDetails, RDF.type, RDF.Property))
+        self.triples.add((BODS.entityTypeDetails, RDFS.domain, BODS.Entity))
+        self.triples.add((BODS.entityTypeDetails, RDFS.label,
           Literal("Entity Type Details")))
-        self.g.add((BODS.entityTypeDetails, RDFS.comment,
+        self.triples.add((BODS.entityTypeDetails, RDFS.comment,
           Literal(self.get_description("/properties/entityType/properties/details"))))
-        self.g.add((BODS.entityTypeDetails, RDFS.range, RDFS.Literal))
+        self.triples.add((BODS.entityTypeDetails, RDFS.range, RDFS.Literal))
 
         # Flatten formedByStatute
-        self.g.add((BODS.formedByStatuteDate, RDF.type, RDF.Property))
-        self.g.add((BODS.formedByStatuteDate, RDFS.domain, BODS.Entity))
-        self.g.add((BODS.formedByStatuteDate, RDFS.label,
+        self.triples.add((BODS.formedByStatuteDate, RDF.type, RDF.Property))
+        self.triples.add((BODS.formedByStatuteDate, RDFS.domain, BODS.Entity))
+        self.triples.add((BODS.formedByStatuteDate, RDFS.label,
           Literal("Formed by Statute Date")))
-        self.g.add((BODS.formedByStatuteDate, RDFS.comment,
+        self.triples.add((BODS.formedByStatuteDate, RDFS.comment,
           Literal(self.get_description("/properties/formedByStatute/properties/date"))))
-        self.g.add((BODS.formedByStatuteDate, RDFS.range, XSD.dateTime))
-        self.g.add((BODS.formedByStatuteName, RDFS.range, RDFS.Literal))
+        self.triples.add((BODS.formedByStatuteDate, RDFS.range, XSD.dateTime))
+        self.triples.add((BODS.formedByStatuteName, RDFS.range, RDFS.Literal))
 
         # Property ranges that aren't dates or literals
-        self.g.add((BODS.address, RDFS.range, BODS.Address))
-        self.g.add((BODS.name, RDFS.range, BODS.Name))
-        self.g.add((BODS.alternateName, RDFS.range, BODS.Name))
-        self.g.add((BODS.jurisdiction, RDFS.range, BODS.Jurisdiction))
-        self.g.add((BODS.identifier, RDFS.range, BODS.Identifier))
-        self.g.add((BODS.securitiesListing, RDFS.range, BODS.SecuritiesListing))
-        self.g.add((BODS.entityType, RDFS.range, BODS.EntityType))
-        self.g.add((BODS.entitySubtype, RDFS.range, BODS.EntitySubtype))
-        self.g.add((BODS.hasPublicListing, RDFS.range, XSD.boolean))
-        self.g.add((BODS.securitiesListing, RDFS.range, BODS.SecuritiesListing))
-        self.g.add((BODS.companyFilingsURL, RDFS.range, RDFS.Resource))
+        self.triples.add((BODS.address, RDFS.range, BODS.Address))
+        self.triples.add((BODS.name, RDFS.range, BODS.Name))
+        self.triples.add((BODS.alternateName, RDFS.range, BODS.Name))
+        self.triples.add((BODS.jurisdiction, RDFS.range, BODS.Jurisdiction))
+        self.triples.add((BODS.identifier, RDFS.range, BODS.Identifier))
+        self.triples.add((BODS.securitiesListing, RDFS.range, BODS.SecuritiesListing))
+        self.triples.add((BODS.entityType, RDFS.range, BODS.EntityType))
+        self.triples.add((BODS.entitySubtype, RDFS.range, BODS.EntitySubtype))
+        self.triples.add((BODS.hasPublicListing, RDFS.range, XSD.boolean))
+        self.triples.add((BODS.securitiesListing, RDFS.range, BODS.SecuritiesListing))
+        self.triples.add((BODS.companyFilingsURL, RDFS.range, RDFS.Resource))
 
         # Entity type and subtype instances
         self.map_instances(BODS.EntityType, "entityType.csv")
@@ -242,31 +451,31 @@ class BODSVocab:
     def map_person(self):
         path = "urn:person"
         self.map_class(BODS.Person, path)
-        self.g.add((BODS.Person, RDFS.subClassOf, BODS.RecordDetails))
+        self.triples.add((BODS.Person, RDFS.subClassOf, BODS.RecordDetails))
 
         # Person properties
         self.map_properties(BODS.Person, path)
 
         # Property ranges that aren't automatically filled
-        self.g.add((BODS.personType, RDFS.range, BODS.PersonType))
-        self.g.add((BODS.identifier, RDFS.range, BODS.Identifier))
-        self.g.add((BODS.name, RDFS.range, BODS.Name))
-        self.g.add((BODS.nationality, RDFS.range, BODS.Jurisdiction))
-        self.g.add((BODS.placeOfBirth, RDFS.range, BODS.Address))
-        self.g.add((BODS.address, RDFS.range, BODS.Address))
-        self.g.add((BODS.taxResidency, RDFS.range, BODS.Jurisdiction))
-        self.g.add((BODS.politicalExposure, RDFS.range, BODS.PoliticalExposure))
-        self.g.remove((BODS.personType, RDFS.range, RDFS.Literal))
+        self.triples.add((BODS.personType, RDFS.range, BODS.PersonType))
+        self.triples.add((BODS.identifier, RDFS.range, BODS.Identifier))
+        self.triples.add((BODS.name, RDFS.range, BODS.Name))
+        self.triples.add((BODS.nationality, RDFS.range, BODS.Jurisdiction))
+        self.triples.add((BODS.placeOfBirth, RDFS.range, BODS.Address))
+        self.triples.add((BODS.address, RDFS.range, BODS.Address))
+        self.triples.add((BODS.taxResidency, RDFS.range, BODS.Jurisdiction))
+        self.triples.add((BODS.politicalExposure, RDFS.range, BODS.PoliticalExposure))
+        self.triples.remove((BODS.personType, RDFS.range, RDFS.Literal))
 
         # Flatten politicalExposure/status -> PEPStatus
         pepstatus_path = "/properties/politicalExposure/properties/status"
-        self.g.add((BODS.pepStatus, RDF.type, RDF.Property))
-        self.g.add((BODS.pepStatus, RDFS.domain, BODS.Person))
-        self.g.add((BODS.pepStatus, RDFS.label,
+        self.triples.add((BODS.pepStatus, RDF.type, RDF.Property))
+        self.triples.add((BODS.pepStatus, RDFS.domain, BODS.Person))
+        self.triples.add((BODS.pepStatus, RDFS.label,
           Literal(self.get_title(pepstatus_path))))
-        self.g.add((BODS.pepStatus, RDFS.comment,
+        self.triples.add((BODS.pepStatus, RDFS.comment,
           Literal(self.get_description(pepstatus_path))))
-        self.g.add((BODS.pepStatus, RDFS.range, BODS.PEPStatus))
+        self.triples.add((BODS.pepStatus, RDFS.range, BODS.PEPStatus))
 
         # Person types
         self.map_instances(BODS.PersonType, "personType.csv")
@@ -274,27 +483,27 @@ class BODSVocab:
     def map_relationship(self):
         path = "urn:relationship"
         self.map_class(BODS.Relationship, path)
-        self.g.add((BODS.Relationship, RDFS.subClassOf, BODS.RecordDetails))
+        self.triples.add((BODS.Relationship, RDFS.subClassOf, BODS.RecordDetails))
 
         # Relationship properties
         self.map_properties(BODS.Relationship, path)
 
         # Property ranges not autofilled (all of them in this case)
-        self.g.add((BODS.subject, RDFS.range, BODS.Entity))
-        self.g.add((BODS.interestedParty, RDFS.range, BODS.Entity))
-        self.g.add((BODS.interestedParty, RDFS.range, BODS.Person))
-        self.g.add((BODS.interest, RDFS.range, BODS.Interest))
+        self.triples.add((BODS.subject, RDFS.range, BODS.Entity))
+        self.triples.add((BODS.interestedParty, RDFS.range, BODS.Entity))
+        self.triples.add((BODS.interestedParty, RDFS.range, BODS.Person))
+        self.triples.add((BODS.interest, RDFS.range, BODS.Interest))
 
     def map_unspecified(self):
         path = "/$defs/UnspecifiedRecord"
         self.map_class(BODS.Unspecified, path)
-        self.g.add((BODS.Unspecified, RDFS.subClassOf, BODS.RecordDetails))
+        self.triples.add((BODS.Unspecified, RDFS.subClassOf, BODS.RecordDetails))
 
         # Unspecified Record properties
         self.map_properties(BODS.Unspecified, path)
 
         # Range fixup
-        self.g.add((BODS.reason, RDFS.range, BODS.UnspecifiedReason))
+        self.triples.add((BODS.reason, RDFS.range, BODS.UnspecifiedReason))
 
         # Unspecified Reason codelist
         self.map_instances(BODS.UnspecifiedReason, "unspecifiedReason.csv")
@@ -316,14 +525,14 @@ class BODSVocab:
         self.map_instances(CODES.DirectOrIndirect, "directOrIndirect.csv")
         
         # Ranges
-        self.g.add((BODS.beneficialOwnershipOrControl, RDFS.range, XSD.boolean))
-        self.g.add((BODS.shareMaximum, RDFS.range, XSD.float))
-        self.g.add((BODS.shareMinimum, RDFS.range, XSD.float))
-        self.g.add((BODS.shareExact, RDFS.range, XSD.float))
-        self.g.add((BODS.shareExclusiveMaximum, RDFS.range, XSD.float))
-        self.g.add((BODS.shareExclusiveMinimum, RDFS.range, XSD.float))
-        self.g.add((BODS.directOrIndirect, RDFS.range, CODES.DirectOrIndirect))
-        self.g.remove((BODS.directOrIndirect, RDFS.range, RDFS.Literal))
+        self.triples.add((BODS.beneficialOwnershipOrControl, RDFS.range, XSD.boolean))
+        self.triples.add((BODS.shareMaximum, RDFS.range, XSD.float))
+        self.triples.add((BODS.shareMinimum, RDFS.range, XSD.float))
+        self.triples.add((BODS.shareExact, RDFS.range, XSD.float))
+        self.triples.add((BODS.shareExclusiveMaximum, RDFS.range, XSD.float))
+        self.triples.add((BODS.shareExclusiveMinimum, RDFS.range, XSD.float))
+        self.triples.add((BODS.directOrIndirect, RDFS.range, CODES.DirectOrIndirect))
+        self.triples.remove((BODS.directOrIndirect, RDFS.range, RDFS.Literal))
 
     def map_address(self):
         path = "/$defs/Address"
@@ -334,24 +543,24 @@ class BODSVocab:
 
         # Address properties
         self.map_properties(BODS.Address, path)
-        self.g.add((BODS.country, RDFS.range, BODS.Jurisdiction))
+        self.triples.add((BODS.country, RDFS.range, BODS.Jurisdiction))
 
     def map_agent(self):
         """
         Agent is a new class for the RDF vocab, not present in the JSON schema.
         """
-        self.g.add((BODS.Agent, RDF.type, OWL.Class))
-        self.g.add((BODS.agentName, RDF.type, RDF.Property))
-        self.g.add((BODS.agentName, RDFS.domain, BODS.Agent))
-        self.g.add((BODS.agentName, RDFS.range, RDFS.Literal))
-        self.g.add((BODS.agentName, RDFS.label, Literal("Agent name")))
-        self.g.add((BODS.agentName, RDFS.comment,
+        self.triples.add((BODS.Agent, RDF.type, OWL.Class))
+        self.triples.add((BODS.agentName, RDF.type, RDF.Property))
+        self.triples.add((BODS.agentName, RDFS.domain, BODS.Agent))
+        self.triples.add((BODS.agentName, RDFS.range, RDFS.Literal))
+        self.triples.add((BODS.agentName, RDFS.label, Literal("Agent name")))
+        self.triples.add((BODS.agentName, RDFS.comment,
           Literal("The name of the agent responsible for this action")))
-        self.g.add((BODS.agentUri, RDF.type, RDF.Property))
-        self.g.add((BODS.agentUri, RDFS.domain, BODS.Agent))
-        self.g.add((BODS.agentUri, RDFS.range, RDFS.Resource))
-        self.g.add((BODS.agentUri, RDFS.label, Literal("Agent URI")))
-        self.g.add((BODS.agentUri, RDFS.comment,
+        self.triples.add((BODS.agentUri, RDF.type, RDF.Property))
+        self.triples.add((BODS.agentUri, RDFS.domain, BODS.Agent))
+        self.triples.add((BODS.agentUri, RDFS.range, RDFS.Resource))
+        self.triples.add((BODS.agentUri, RDFS.label, Literal("Agent URI")))
+        self.triples.add((BODS.agentUri, RDFS.comment,
           Literal("A globally unique identifier or URL for this agent")))
 
     def map_annotation(self):
@@ -364,9 +573,9 @@ class BODSVocab:
         self.map_properties(BODS.Annotation, path)
 
         # Range fixup
-        self.g.add((BODS.motivation, RDFS.range, BODS.AnnotationMotivation))
-        self.g.remove((BODS.motivation, RDFS.range, RDFS.Literal))
-        self.g.add((BODS.createdBy, RDFS.range, BODS.Agent))
+        self.triples.add((BODS.motivation, RDFS.range, BODS.AnnotationMotivation))
+        self.triples.remove((BODS.motivation, RDFS.range, RDFS.Literal))
+        self.triples.add((BODS.createdBy, RDFS.range, BODS.Agent))
 
         # TODO duplicate property description
 
@@ -398,17 +607,17 @@ class BODSVocab:
         path = "/properties/politicalExposure/properties/status"
         self.map_class(BODS.PEPStatus, path)
 
-        self.g.add((BODS.NotPEP, RDF.type, BODS.PEPStatus))
-        self.g.add((BODS.PEP, RDF.type, BODS.PEPStatus))
-        self.g.add((BODS.PEPMissing, RDF.type, BODS.PEPStatus))
+        self.triples.add((BODS.NotPEP, RDF.type, BODS.PEPStatus))
+        self.triples.add((BODS.PEP, RDF.type, BODS.PEPStatus))
+        self.triples.add((BODS.PEPMissing, RDF.type, BODS.PEPStatus))
 
     def map_politicalexposure(self):
         path = "/$defs/PepStatusDetails"
         self.map_class(BODS.PoliticalExposure, path)
         self.map_properties(BODS.PoliticalExposure, path)
 
-        self.g.add((BODS.source, RDFS.range, BODS.Source))
-        self.g.add((BODS.jurisdiction, RDFS.range, BODS.Jurisdiction))
+        self.triples.add((BODS.source, RDFS.range, BODS.Source))
+        self.triples.add((BODS.jurisdiction, RDFS.range, BODS.Jurisdiction))
 
         # TODO reason and jurisdiction are duplicate properties
 
@@ -416,15 +625,15 @@ class BODSVocab:
         path = "/$defs/SecuritiesListing"
         self.map_class(BODS.SecuritiesListing, path)
         self.map_properties(BODS.SecuritiesListing, path)
-        self.g.add((BODS.securityId, RDFS.range, BODS.SecuritiesIdentifier))
+        self.triples.add((BODS.securityId, RDFS.range, BODS.SecuritiesIdentifier))
 
         # SecuritiesIdentifierSchemes codelist
         self.map_instances(CODES.SecuritiesIdentifierScheme, "securitiesIdentifierSchemes.csv")
-        self.g.add((BODS.idScheme, RDFS.range, CODES.SecuritiesIdentifierScheme))
+        self.triples.add((BODS.idScheme, RDFS.range, CODES.SecuritiesIdentifierScheme))
 
         sec_path = "/$defs/SecuritiesListing/properties/security"
         self.map_class(BODS.SecuritiesIdentifier, sec_path)
-        self.g.add((BODS.SecuritiesIdentifier, RDFS.subClassOf, BODS.Identifier))
+        self.triples.add((BODS.SecuritiesIdentifier, RDFS.subClassOf, BODS.Identifier))
         self.map_properties(BODS.SecuritiesIdentifier, sec_path)
 
     def map_source(self):
@@ -437,25 +646,15 @@ class BODSVocab:
         # Source properties
         self.map_properties(BODS.Source, path)
 
-        self.g.add((BODS.assertedBy, RDFS.range, BODS.Agent))
+        self.triples.add((BODS.assertedBy, RDFS.range, BODS.Agent))
 
         # TODO: description is a duplicate..
 
     def get_title(self, pointer):
-        path = f"{pointer}/title"
-        try:
-            bit = find_a_bit(self.registry, path)
-            return bit.contents
-        except:
-            return
+        return find_a_bit(self.index, f"{pointer}/title")
 
     def get_description(self, pointer):
-        path = f"{pointer}/description"
-        try:
-            bit = find_a_bit(self.registry, path)
-            return bit.contents
-        except:
-            return
+        return find_a_bit(self.index, f"{pointer}/description")
 
     def rename_property(self, prop):
         if prop in self.rename:
@@ -467,47 +666,246 @@ class BODSVocab:
         return prop
 
     def get_property_range(self, path, prop):
-        try:
-            t = get_type(self.registry, path)
-            if t == "string":
-                if prop in self.date_props:
-                    return XSD.dateTime
-                elif prop in self.uri_props:
-                    return RDFS.Resource
-                elif prop in self.name_props:
-                    return BODS.Name
-                else:
-                    return RDFS.Literal
-        except AttributeError:
-            pass
+        t = get_type(self.index, path)
+        if t == "string":
+            if prop in self.date_props:
+                return XSD.dateTime
+            elif prop in self.uri_props:
+                return RDFS.Resource
+            elif prop in self.name_props:
+                return BODS.Name
+            else:
+                return RDFS.Literal
 
     def ttl(self):
-        return self.g.serialize(format="turtle", auto_compact=True)
+        if self._ttl is None or self._ttl[0] != self.g.changes:
+            with stats.timer("serialize_turtle"):
+                ttl = self.g.serialize(format="turtle", auto_compact=True)
+            self._ttl = (self.g.changes, ttl)
+        return self._ttl[1]
 
     def write_ttl(self, filename):
         with open(filename, "w") as f:
             f.write(self.ttl())
 
-    def write_docs(self, filename):
-        od = OntPub(ontology=self.ttl())
-        html = od.make_html(destination=filename)
+    def ttl_unchanged(self, filename):
+        try:
+            with open(filename) as f:
+                return f.read() == self.ttl()
+        except FileNotFoundError:
+            return False
 
+    def write_formats(self, outputs):
+        """
+        Write the vocabulary in several formats in one go. outputs maps
+        each format ("turtle", "nt", "xml" or "json-ld") to a filename.
+        """
+        with ExitStack() as stack:
+            files = {fmt: stack.enter_context(open(fn, "w", encoding="utf-8"))
+              for fmt, fn in outputs.items()}
+            if "turtle" in files:
+                files.pop("turtle").write(self.ttl())
+            with stats.timer("serialize_export"):
+                export_graph(self.g, files, NAMESPACES)
+
+    def docs_graph(self):
+        """
+        A graph for pyLODE, which adds its own inferred triples to whatever
+        it is given, parsed from the cached Turtle. pyLODE picks the title
+        (and so the HTML anchor) of a term with several labels from the
+        order the triples went into the graph, and this is the order the
+        published docs were made from.
+        """
+        g = Graph(bind_namespaces="core")
+        return g.parse(data=self.ttl(), format="turtle")
 
-if __name__ == "__main__":
+    def write_docs(self, filename):
+        with stats.timer("pylode"):
+            from pylode.profiles.ontpub import OntPub
+            od = OntPub(ontology=self.docs_graph())
+            html = od.make_html(destination=filename)
 
-    schemas, codelists = get_schemas_and_codelists()
+    def mapping_plan(self):
+        """
+        How the JSON maps onto the vocabulary, as a plan that convert.py
+        can apply without the schemas or the graph (see PlanCompiler).
+        """
+        with stats.timer("mapping_plan"):
+            return PlanCompiler(self).compile()
+
+    def write_plan(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.mapping_plan(), f, indent=2, sort_keys=True)
+
+
+def local_name(uri):
+    return str(uri).split("#")[-1]
+
+
+class PlanCompiler:
+    """
+    Works out how each property in the JSON maps onto the vocabulary, by
+    walking the schemas and looking up the properties in the vocab graph.
+
+    The plan is a dict of shapes (the kinds of JSON object), each with the
+    class its objects become, which of its properties are arrays, and a
+    rule for each of its properties:
+      ["literal", predicate, datatype or None]
+      ["uri", predicate]
+      ["node", predicate, shape, keys]  keys are the properties objects
+                                        have here, as shapes can be merged
+      ["wrap", predicate, shape, key]  a string is the value of key in shape
+      ["code", predicate, {code: instance}]
+      ["type", {code: class}]
+      ["flatten", shape]
+      ["record", predicate]  a record id, or an unspecified record
+      ["details", predicate]
+      ["declaration", predicate]
+    """
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+        self.g = vocab.g
+        self.index = vocab.index
+        self.shapes = {}
+
+    def compile(self):
+        self.shape("Statement", BODS.Statement, *self.schema(STATEMENT_SCHEMA))
+        records = {}
+        for record_type, ref in RECORD_SCHEMAS.items():
+            cls = BODS[cap_first(record_type)]
+            records[record_type] = self.shape(local_name(cls), cls,
+              *self.schema(ref))
+        self.shape("Unspecified", BODS.Unspecified,
+          *self.schema(UNSPECIFIED_SCHEMA))
+        return {
+            "shapes": self.shapes,
+            "records": records,
+            "statement": "Statement",
+            "unspecified": "Unspecified",
+        }
+
+    def schema(self, ref):
+        root_id = ref.partition("#")[0]
+        return self.index.resolve_ref(root_id, ref), root_id
+
+    def deref(self, node, root_id):
+        while isinstance(node, dict) and "$ref" in node:
+            base = node["$ref"].partition("#")[0]
+            node = self.index.resolve_ref(root_id, node["$ref"])
+            root_id = base or root_id
+        return node, root_id
+
+    def shape(self, name, cls, node, root_id, renames={}):
+        # The same class can come from different bits of schema (eg. Agent
+        # from publisher and from assertedBy), so fields are merged
+        if name not in self.shapes:
+            self.shapes[name] = {
+                "class": str(cls) if cls else None,
+                "fields": {},
+                "arrays": [],
+            }
+        fields = self.shapes[name]["fields"]
+        for key, sub in node.get("properties", {}).items():
+            if key in fields:
+                continue
+            sub, sub_root = self.deref(sub, root_id)
+            rule = self.rule(name, cls, key, sub, sub_root, renames)
+            if rule:
+                fields[key] = rule
+                if sub.get("type") == "array":
+                    self.shapes[name]["arrays"].append(key)
+        return name
+
+    def rule(self, shape, cls, key, sub, root_id, renames):
+        if shape == "Statement" and key in STATEMENT_RULES:
+            return STATEMENT_RULES[key]
+
+        items, items_root = sub, root_id
+        if sub.get("type") == "array" and "items" in sub:
+            items, items_root = self.deref(sub["items"], root_id)
+        codelist = items.get("codelist")
+
+        if key in FLATTEN:
+            return ["flatten", self.shape(f"{shape}.{key}", None, items,
+              items_root, FLATTEN[key])]
+
+        if key not in renames and key in self.vocab.exclude:
+            # Codes that are subclasses, eg. address types
+            if codelist and cls is not None:
+                types = self.code_classes(cls, codelist)
+                if types:
+                    return ["type", types]
+            return
 
+        pred = BODS[renames.get(key) or self.vocab.rename_property(key)]
+        if "oneOf" in sub:
+            return ["record", str(pred)]
+
+        ranges = set(self.g.objects(pred, RDFS.range))
+        classes = [r for r in ranges if r not in DATATYPES and
+          r not in (RDFS.Literal, RDFS.Resource)]
+
+        if items.get("type") == "object" or "properties" in items:
+            range_cls = classes[0] if classes else None
+            if range_cls == BODS.Agent:
+                child = self.shape("Agent", BODS.Agent, items, items_root,
+                  AGENT_RENAMES)
+            else:
+                child = self.shape(local_name(range_cls), range_cls, items,
+                  items_root)
+            return ["node", str(pred), child, [*items.get("properties", {})]]
+
+        if pred == BODS.pepStatus:
+            return ["code", str(pred), PEP_STATUS]
+        if codelist:
+            codes = self.code_instances(classes, codelist)
+            if codes:
+                return ["code", str(pred), codes]
+        if BODS.Name in classes:
+            self.shape("Name", BODS.Name, *self.schema(NAME_SCHEMA))
+            return ["wrap", str(pred), "Name", "fullName"]
+
+        for datatype in DATATYPES:
+            if datatype in ranges:
+                return ["literal", str(pred), str(datatype)]
+        if RDFS.Resource in ranges:
+            return ["uri", str(pred)]
+        return ["literal", str(pred), None]
+
+    def code_classes(self, cls, codelist):
+        types = {}
+        for code in self.vocab.codelists.info(codelist):
+            t = BODS[cap_first(code)]
+            if (t, RDFS.subClassOf, cls) in self.g:
+                types[code] = str(t)
+        return types
+
+    def code_instances(self, classes, codelist):
+        codes = {}
+        for code in self.vocab.codelists.info(codelist):
+            for ns in (CODES, BODS):
+                instance = ns[cap_first(code)]
+                if any((instance, RDF.type, c) in self.g for c in classes):
+                    codes[code] = str(instance)
+                    break
+        return codes
+
+
+def bods_vocab(schemas, codelists, metadata=METADATA):
+    """
+    A BODSVocab set up with the mapping used for the published vocabulary.
+    metadata has the uri, label and comment for the ontology.
+    """
     vocab = BODSVocab(schemas, codelists)
-    vocab.metadata("https://standard.openownership.org/terms",
-      "Beneficial Ownership Data Standard v0.4",
-      "The RDF vocabulary for the Beneficial Ownership Data Standard v0.4")
-    
+    vocab.metadata(metadata["uri"], metadata["label"], metadata["comment"])
+
     # Properties that aren't making it to the RDF model
     vocab.exclude_properties(["publicationDetails",
       "declarationSubject", "recordType",
       "recordStatus", "isComponent", "type", "unspecifiedEntityDetails",
       "publicListing", "unspecifiedPersonDetails", "componentRecords", "share"])
-    
+
     # Properties that need to be renamed (usually from singular to plural)
     rename_map = {
         "addresses": "address",
@@ -536,11 +934,171 @@ if __name__ == "__main__":
       uri_props=["uri", "companyFilingsURL", "url"],
       name_props=["name", "alternateName"]
     )
-    
-    vocab.make_graph()
-    vocab.write_ttl("bods-vocabulary-0.4.0.ttl")
-    vocab.write_docs("bods-vocabulary-0.4.0.html")
 
+    return vocab
+
+
+def build_spec(spec):
+    """
+    spec with the defaults filled in: DEFAULT_BUILD, the schema_dir for its
+    ref (if it has one but no schema_dir) and the cache file.
+    """
+    filled = {**DEFAULT_BUILD, **spec}
+    if "ref" in spec and "schema_dir" not in spec:
+        filled["schema_dir"] = ref_schema_dir(DEFAULT_BUILD["schema_dir"],
+          spec["ref"])
+    filled.setdefault("cache", os.path.join(filled["schema_dir"],
+      BUILD_CACHE))
+    return filled
+
+
+def build(spec):
+    """
+    Build a vocabulary, its HTML docs and mapping plan as described by
+    spec, a dict with any of:
+      schema_dir  where the schemas are, or are fetched to (from ref)
+      ref         the git ref to fetch the schemas from (into a directory
+                  of its own under schemas, if schema_dir isn't given)
+      language    used in the output names, if it isn't "en"
+      version     used in the output names
+      metadata    uri, label and comment for the ontology
+      output_dir  where the outputs go
+      outputs     {format: filename}, instead of the default names
+      docs        filename for the HTML docs
+      plan        filename for the mapping plan
+      cache       filename for the build cache, instead of BUILD_CACHE in
+                  schema_dir
+      ttl_only    only write the Turtle and the mapping plan, leaving out
+                  the other formats and the docs (and not importing pyLODE)
+    Returns the build's stats report.
+    """
+    spec = build_spec(spec)
+    stats.reset()
+    schema_dir = spec["schema_dir"]
+    version = spec["version"]
+    language = spec.get("language", "en")
+    suffix = version if language == "en" else f"{version}-{language}"
+    output_dir = spec.get("output_dir", ".")
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = spec.get("outputs") or {fmt: os.path.join(output_dir,
+      f"bods-vocabulary-{suffix}{ext}") for fmt, ext in EXTENSIONS.items()}
+    docs = spec.get("docs") or os.path.join(output_dir,
+      f"bods-vocabulary-{suffix}.html")
+    plan = spec.get("plan") or os.path.join(output_dir,
+      f"bods-mapping-{suffix}.json")
+    cache_file = spec["cache"]
+    if spec.get("ttl_only"):
+        outputs = {"turtle": outputs["turtle"]}
+        docs = None
+
+    build_cache = load_build_cache(cache_file)
+    with stats.timer("fetch"):
+        schemas, codelists = get_schemas_and_codelists(schema_dir,
+          ref=spec.get("ref", DEFAULT_REF))
+        codelist_schema = os.path.join(schema_dir, "codelist-schema.json")
+        if os.path.isfile(codelist_schema):
+            with open(codelist_schema) as f:
+                schema = json.load(f)
+            # Codelists that were valid last time don't need checking again
+            # (or jsonschema importing)
+            checked = digest([codelists, schema])
+            if build_cache.get("codelists_valid") == checked:
+                schema = None
+            codelists = CodelistStore(codelists, schema=schema)
+            build_cache["codelists_valid"] = checked
+
+    vocab = bods_vocab(schemas, codelists, spec.get("metadata", METADATA))
+
+    with stats.timer("make_graph"):
+        vocab.make_graph(build_cache)
+    save_build_cache(cache_file, build_cache)
+
+    # Only write the outputs that weren't built from this Turtle. The cache
+    # records which Turtle each output was last written from, so outputs
+    # left out of a --ttl-only build, or not written because an earlier
+    # one failed, are caught up.
+    ttl_digest = digest(vocab.ttl())
+    built = build_cache.setdefault("outputs", {})
+
+    def stale(fmt, fn):
+        if not os.path.isfile(fn):
+            return True
+        if fmt == "turtle":
+            return not vocab.ttl_unchanged(fn)
+        return built.get(fn) != ttl_digest
+
+    todo = {fmt: fn for fmt, fn in outputs.items() if stale(fmt, fn)}
+    if docs and stale("html", docs):
+        todo["html"] = docs
+    if not todo:
+        print("Vocabulary unchanged.")
+    formats = {fmt: fn for fmt, fn in todo.items() if fmt != "html"}
+    if formats:
+        vocab.write_formats(formats)
+        built.update(dict.fromkeys(formats.values(), ttl_digest))
+        save_build_cache(cache_file, build_cache)
+    if "html" in todo:
+        vocab.write_docs(docs)
+        built[docs] = ttl_digest
+        save_build_cache(cache_file, build_cache)
+    vocab.write_plan(plan)
+    return stats.report()
+
+
+def build_all(specs, workers=None):
+    """
+    Build each of specs (see build) in a pool of worker processes, which
+    share the modules and mapping configuration already loaded here.
+    Returns {name: report}, where name is the spec's name if it has one.
+    Builds that would share a cache file (ie. have the same schema_dir)
+    get one each, so they don't overwrite each other's.
+    """
+    names = [spec.get("name") or f"{spec.get('language', 'en')}-"
+      f"{spec.get('version', DEFAULT_BUILD['version'])}" for spec in specs]
+    specs = [build_spec(spec) for spec in specs]
+    caches = Counter(spec["cache"] for spec in specs)
+    specs = [{**spec, "cache": f"{spec['cache']}-{name}"}
+      if caches[spec["cache"]] > 1 else spec
+      for spec, name in zip(specs, names)]
+    with ProcessPoolExecutor(workers) as pool:
+        reports = pool.map(build, specs)
+        return dict(zip(names, reports))
 
 
+if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(
+      description="Build the BODS RDF vocabulary from the BODS schema.")
+    parser.add_argument("--manifest",
+      help="JSON file with a list of builds (see build) to run in parallel")
+    parser.add_argument("--workers", type=int,
+      help="processes to run the manifest's builds in")
+    parser.add_argument("--ttl-only", action="store_true",
+      help="only write the Turtle and mapping plan, not the other formats "
+        "or the HTML docs")
+    parser.add_argument("--report",
+      help="write timings and counts for the build to this JSON file")
+    parser.add_argument("--profile",
+      help="run the build under cProfile and write its stats to this file")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if args.manifest:
+        with open(args.manifest) as f:
+            specs = json.load(f)
+        if args.ttl_only:
+            specs = [{**spec, "ttl_only": True} for spec in specs]
+        report = build_all(specs, args.workers)
+    else:
+        report = build({**DEFAULT_BUILD, "ttl_only": args.ttl_only})
+
+    if args.profile:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
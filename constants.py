@@ -0,0 +1,22 @@
+"""
+Namespaces and N-Quads patterns, for modules that don't need rdflib (such
+as quadfile.py) to import without it.
+"""
+import re
+
+
+# Prefixes used when writing the vocabulary out (eg. the JSON-LD @context)
+NAMESPACES = {
+    "bods": "https://vocab.openownership.org/terms#",
+    "codes": "https://vocab.openownership.org/codelists#",
+    "orgid": "https://org-id.guide/list/",
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "owl": "http://www.w3.org/2002/07/owl#",
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+}
+
+# A term, and a triple or quad, in N-Triples or N-Quads
+TERM = r'<[^>]*>|_:\S+|"(?:[^"\\]|\\.)*"(?:\^\^<[^>]*>|@[A-Za-z0-9-]+)?'
+QUAD = re.compile(
+  rf"\s*({TERM})\s+({TERM})\s+({TERM})(?:\s+({TERM}))?\s*\.\s*$")
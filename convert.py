@@ -0,0 +1,893 @@
+"""
+Convert BODS v0.4 JSON data to RDF, using the mapping from the schema to
+the vocabulary that BODSVocab builds.
+
+Each statement becomes a named graph, as in docs/_pages/4_convertingdata.md.
+Statements are read one at a time from a JSON array or JSON Lines file
+(which can be compressed with gzip, zip or zstandard) and their quads are
+yielded as they're made, so memory use doesn't depend on the size of the
+input.
+"""
+import io
+import os
+import re
+import gzip
+import json
+import heapq
+import queue
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+import zipfile
+import tempfile
+import threading
+from contextlib import ExitStack
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+from rdflib import URIRef, BNode, Literal
+from rdflib.namespace import RDF, XSD
+
+from helpers import *
+from bodsld import BODS, bods_vocab
+from export import nt_term, escape_iri
+from quadfile import write_quadfile
+
+
+# BODS dates can be partial (eg. "1978-07"), which rdflib warns about when
+# they're given the xsd:dateTime datatype from the vocabulary
+logging.getLogger("rdflib.term").setLevel(logging.ERROR)
+
+
+DEFAULT_BASE = "https://example.org/"
+READ_SIZE = 1 << 16
+READ_AHEAD = 8
+STATEMENT_BATCH = 256
+CHUNK_SIZE = 1 << 22
+INDEX_BATCH = 1000
+RUN_SIZE = 100000
+MERGE_FAN_IN = 256
+TERM_CACHE_SIZE = 1 << 14
+SEEN_SIZE = 1 << 16
+
+# Shapes whose nodes are the same wherever they turn up, so get IRIs from
+# the triples they map to and are kept out of the statements' graphs
+SHARED_SHAPES = ["Jurisdiction", "Agent", "Address", "Identifier", "Name"]
+# Where the IRIs of shared nodes go under base, as in
+# https://www.w3.org/TR/rdf11-concepts/#section-skolemization
+SKOLEM_PATH = ".well-known/genid"
+# The scheme an IRI (as opposed to a relative reference) starts with
+IRI_SCHEME = re.compile(r"[A-Za-z][A-Za-z0-9+.-]*:")
+
+
+def lexical(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def load_plan(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+class TermCache:
+    """
+    Interned terms, and their N-Triples. Vocabulary terms (the predicates,
+    classes and codes in the plan) are made once and kept. Terms from the
+    data (dates, codes, record ids, names and so on) are kept in LRU caches
+    of size entries, so a value that's already been seen is the same
+    object, and isn't escaped again to write it out.
+    """
+
+    def __init__(self, size=TERM_CACHE_SIZE):
+        self.size = size
+        self.vocab = {}
+        self.vocab_nt = {}
+        self.caches = {}
+        self.uri = self.cached("uri", self.data_uri)
+        self.literal = self.cached("literal", self.make_literal)
+        self.data_nt = self.cached("nt", nt_term)
+
+    def cached(self, name, fn):
+        """
+        fn with an LRU cache, whose hit rate is reported as name.
+        """
+        cache = self.caches[name] = lru_cache(self.size)(fn)
+        return cache
+
+    def data_uri(self, value):
+        """
+        A URI from the data, with the characters N-Triples doesn't allow in
+        IRIs percent-encoded, or an xsd:anyURI literal if it has no scheme
+        (so isn't an IRI).
+        """
+        value = str(value)
+        if not IRI_SCHEME.match(value):
+            return self.make_literal(value, XSD.anyURI)
+        return URIRef(escape_iri(value))
+
+    def make_literal(self, value, datatype=None):
+        return Literal(value, datatype=datatype, normalize=False)
+
+    def intern(self, uri):
+        """
+        The vocabulary term for uri.
+        """
+        term = self.vocab.get(str(uri))
+        if term is None:
+            term = self.vocab[str(uri)] = URIRef(uri)
+            self.vocab_nt[term] = nt_term(term)
+        return term
+
+    def nt(self, term):
+        if type(term) is BNode:
+            return f"_:{term}"
+        text = self.vocab_nt.get(term)
+        return text if text is not None else self.data_nt(term)
+
+    def nquad(self, quad):
+        s, p, o, g = quad
+        nt = self.nt
+        if g is None:
+            return f"{nt(s)} {nt(p)} {nt(o)} .\n"
+        return f"{nt(s)} {nt(p)} {nt(o)} {nt(g)} .\n"
+
+    def report(self):
+        """
+        Hits, misses and the hit rate of each of the data caches.
+        """
+        report = {}
+        for name, cache in self.caches.items():
+            info = cache.cache_info()
+            lookups = info.hits + info.misses
+            report[name] = {
+                "hits": info.hits,
+                "misses": info.misses,
+                "hit_rate": round(info.hits / lookups, 4) if lookups else None,
+            }
+        return report
+
+
+class Converter:
+    """
+    Turns BODS statements into quads, using a plan from
+    BODSVocab.mapping_plan.
+    Statements, records and declarations get URIs under base.
+
+    Blank nodes are labelled from the statement and their place in it, so
+    the same input always gives the same output. Nodes of the shared shapes
+    (eg. jurisdictions, publishers and names) get skolem IRIs from a hash
+    of the triples they map to and go in the default graph, so the same
+    node from different statements, or different shards, is the same IRI.
+    The last seen_size of them written are remembered, so each is only
+    written once unless it's been a long time since it was last seen.
+    """
+
+    def __init__(self, plan, base=DEFAULT_BASE, shared=SHARED_SHAPES,
+      cache_size=TERM_CACHE_SIZE, seen_size=SEEN_SIZE):
+        self.base = base
+        self.seen = OrderedDict()
+        self.seen_size = seen_size
+        self.terms = TermCache(cache_size)
+        self.nquad = self.terms.nquad
+        self.uri = self.terms.cached("node_uri", self.make_uri)
+        for term in [RDF.type, BODS.Statement, BODS.Declaration,
+          BODS.declarationIdString, BODS.declarationSubject]:
+            self.terms.intern(term)
+        self.shapes = {}
+        for name, shape in plan["shapes"].items():
+            cls = self.terms.intern(shape["class"]) if shape["class"] else None
+            fields = {key: self.load_rule(rule)
+              for key, rule in shape["fields"].items()}
+            self.shapes[name] = (cls, fields)
+        self.records = plan["records"]
+        self.statement_shape = plan["statement"]
+        self.unspecified_shape = plan["unspecified"]
+        self.shared = set(shared)
+
+    def load_rule(self, rule):
+        kind = rule[0]
+        intern = self.terms.intern
+        if kind == "literal":
+            return (kind, intern(rule[1]), rule[2] and intern(rule[2]))
+        if kind in ("code", "type"):
+            table = rule[-1]
+            return (kind, *map(intern, rule[1:-1]),
+              {code: intern(uri) for code, uri in table.items()})
+        if kind == "flatten":
+            return (kind, rule[1])
+        return (kind, intern(rule[1]), *rule[2:])
+
+    def make_uri(self, kind, id):
+        return URIRef(f"{self.base}{kind}/{quote(str(id), safe='')}")
+
+    def convert(self, statements):
+        for statement in statements:
+            yield from self.statement(statement)
+
+    def statement(self, statement):
+        s = self.uri("statements", statement["statementId"])
+        triples = [(s, RDF.type, BODS.Statement)]
+        shared = []
+        scope = [label_digest(statement["statementId"]), 0]
+        self.apply(s, self.statement_shape, statement, triples,
+          (statement, shared), scope)
+        return ([(t[0], t[1], t[2], s) for t in triples] +
+          [(t[0], t[1], t[2], None) for t in shared])
+
+    def node(self, shape, triples, scope):
+        node = BNode(f"{scope[0]}x{scope[1]}")
+        scope[1] += 1
+        cls = self.shapes[shape][0]
+        if cls is not None:
+            triples.append((node, RDF.type, cls))
+        return node
+
+    def child(self, shape, obj, triples, context, scope):
+        if shape not in self.shared:
+            child = self.node(shape, triples, scope)
+            self.apply(child, shape, obj, triples, context, scope)
+            return child
+        digest = self.content_digest(shape, obj)
+        child = self.uri(SKOLEM_PATH, digest)
+        if digest in self.seen:
+            self.seen.move_to_end(digest)
+            return child
+        self.seen[digest] = True
+        if len(self.seen) > self.seen_size:
+            self.seen.popitem(last=False)
+        shared = context[1]
+        cls = self.shapes[shape][0]
+        if cls is not None:
+            shared.append((child, RDF.type, cls))
+        self.apply(child, shape, obj, shared, context, [digest, 0])
+        return child
+
+    def content_digest(self, shape, obj):
+        """
+        A digest of the triples obj maps to as a node of shape, so JSON
+        that maps to the same triples (such as an agent with a url, and
+        one with the same uri) gives the same node.
+        """
+        return label_digest([shape, sorted(set(self.content(shape, obj)))])
+
+    def content(self, shape, obj):
+        """
+        Yield the (predicate, object) N-Triples of what obj maps to, with
+        the digests of child nodes for their objects.
+        """
+        nt = self.terms.nt
+        fields = self.shapes[shape][1]
+        for key, value in obj.items():
+            rule = fields.get(key)
+            if rule is None or value is None:
+                continue
+            if rule[0] == "flatten":
+                yield from self.content(rule[1], value)
+                continue
+            kind = rule[0]
+            for v in value if isinstance(value, list) else [value]:
+                if kind == "literal":
+                    o = nt(self.terms.literal(lexical(v), rule[2]))
+                elif kind == "uri":
+                    o = nt(self.terms.uri(v))
+                elif kind == "node":
+                    o = self.content_digest(rule[2], v)
+                elif kind == "wrap":
+                    o = self.content_digest(rule[2], {rule[3]: v})
+                elif kind == "code":
+                    o = nt(rule[2].get(v) or self.terms.literal(v))
+                elif kind == "type":
+                    if v in rule[1]:
+                        yield nt(RDF.type), nt(rule[1][v])
+                    continue
+                else:
+                    # Records and declarations aren't in shared shapes
+                    o = json.dumps(v, sort_keys=True)
+                yield nt(rule[1]), o
+
+    def apply(self, node, shape, obj, triples, context, scope):
+        fields = self.shapes[shape][1]
+        for key, value in obj.items():
+            rule = fields.get(key)
+            if rule is None or value is None:
+                continue
+            if rule[0] == "flatten":
+                self.apply(node, rule[1], value, triples, context, scope)
+                continue
+            for v in value if isinstance(value, list) else [value]:
+                self.value(node, rule, v, triples, context, scope)
+
+    def value(self, node, rule, v, triples, context, scope):
+        kind = rule[0]
+        statement = context[0]
+        if kind == "literal":
+            triples.append((node, rule[1],
+              self.terms.literal(lexical(v), rule[2])))
+        elif kind == "uri":
+            triples.append((node, rule[1], self.terms.uri(v)))
+        elif kind == "node":
+            child = self.child(rule[2], v, triples, context, scope)
+            triples.append((node, rule[1], child))
+        elif kind == "wrap":
+            child = self.child(rule[2], {rule[3]: v}, triples, context, scope)
+            triples.append((node, rule[1], child))
+        elif kind == "code":
+            code = rule[2].get(v)
+            triples.append((node, rule[1], code or self.terms.literal(v)))
+        elif kind == "type":
+            if v in rule[1]:
+                triples.append((node, RDF.type, rule[1][v]))
+        elif kind == "record":
+            if isinstance(v, dict):
+                child = self.child(self.unspecified_shape, v, triples,
+                  context, scope)
+            else:
+                child = self.uri("records", v)
+            triples.append((node, rule[1], child))
+        elif kind == "details":
+            record = self.uri("records", statement.get("recordId"))
+            shape = self.records.get(statement.get("recordType"))
+            triples.append((node, rule[1], record))
+            if shape:
+                triples.append((record, RDF.type, self.shapes[shape][0]))
+                self.apply(record, shape, v, triples, context, scope)
+        elif kind == "declaration":
+            declaration = self.uri("declarations", v)
+            triples.append((node, rule[1], declaration))
+            triples.append((declaration, RDF.type, BODS.Declaration))
+            triples.append((declaration, BODS.declarationIdString,
+              self.terms.literal(v)))
+            subject = statement.get("declarationSubject")
+            if subject:
+                triples.append((declaration, BODS.declarationSubject,
+                  self.uri("records", subject)))
+
+
+def label_digest(value):
+    data = json.dumps(value, sort_keys=True).encode()
+    return hashlib.sha1(data).hexdigest()[:20]
+
+
+def read_statements(f, read_size=READ_SIZE):
+    """
+    Yield statements one at a time from a file of JSON Lines, or a JSON
+    array of statements, without reading the whole file in.
+    """
+    buf = f.read(read_size).lstrip()
+    if not buf.startswith("["):
+        for line in (buf + f.readline()).splitlines():
+            if line.strip():
+                yield json.loads(line)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+        return
+
+    decoder = json.JSONDecoder()
+    pos = 1
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            more = f.read(read_size)
+            if not more:
+                raise
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+        yield obj
+        pos = end
+
+
+def is_compressed(filename):
+    return os.path.splitext(filename)[1].lower() in (".gz", ".zip", ".zst")
+
+
+def open_input(filename):
+    """
+    Open a BODS data file as text, decompressing .gz, .zip (the first file
+    in the archive) and .zst (if zstandard is installed) files as they're
+    read.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".gz":
+        return io.TextIOWrapper(gzip.open(filename), encoding="utf-8")
+    if ext == ".zip":
+        # The archive's file is closed when its member is
+        with zipfile.ZipFile(filename) as archive:
+            names = [n for n in archive.namelist() if not n.endswith("/")]
+            if not names:
+                raise ValueError(f"{filename} has no files in it")
+            return io.TextIOWrapper(archive.open(names[0]), encoding="utf-8")
+    if ext == ".zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+              f"zstandard needs installing to read {filename}") from None
+        reader = zstandard.ZstdDecompressor().stream_reader(
+          open(filename, "rb"), closefd=True)
+        return io.TextIOWrapper(io.BufferedReader(reader, READ_SIZE),
+          encoding="utf-8")
+    return open(filename, encoding="utf-8")
+
+
+def read_input(filename, read_ahead=READ_AHEAD, batch=STATEMENT_BATCH):
+    """
+    Yield the statements in filename (see open_input and read_statements).
+    The file is decompressed and parsed in a background thread, which
+    keeps up to read_ahead batches of statements ready, so decompressing
+    (which releases the GIL) overlaps with converting.
+    """
+    batches = queue.Queue(read_ahead)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read():
+        try:
+            with open_input(filename) as f:
+                statements = []
+                for statement in read_statements(f):
+                    statements.append(statement)
+                    if len(statements) >= batch:
+                        if not put(statements):
+                            return
+                        statements = []
+                if statements and not put(statements):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+    finally:
+        # Stop the thread if the statements aren't all wanted
+        stop.set()
+        thread.join()
+
+
+def convert_file(converter, infile, outfile):
+    with open(outfile, "w", encoding="utf-8") as out:
+        for quad in converter.convert(read_input(infile)):
+            out.write(converter.nquad(quad))
+
+
+class StatementIndex:
+    """
+    An SQLite index of the statements that have been converted, and the
+    latest statement (by statementDate) for each record, so a feed can be
+    converted a day at a time without going over its history again.
+    """
+
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS statements (
+                statement_id TEXT PRIMARY KEY,
+                record_id TEXT,
+                statement_date TEXT,
+                record_status TEXT
+            );
+            CREATE TABLE IF NOT EXISTS records (
+                record_id TEXT PRIMARY KEY,
+                statement_id TEXT,
+                statement_date TEXT,
+                record_status TEXT
+            );
+        """)
+
+    def seen(self, statement_ids):
+        """
+        Which of statement_ids are already in the index.
+        """
+        seen = set()
+        ids = [*statement_ids]
+        # Keep under SQLite's limit on the number of parameters
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self.db.execute("SELECT statement_id FROM statements "
+              f"WHERE statement_id IN ({','.join('?' * len(chunk))})", chunk)
+            seen.update(row[0] for row in rows)
+        return seen
+
+    def add(self, statements):
+        rows = [(s["statementId"], s.get("recordId"), s.get("statementDate"),
+          s.get("recordStatus")) for s in statements]
+        self.db.executemany("INSERT OR IGNORE INTO statements "
+          "VALUES (?, ?, ?, ?)", rows)
+        self.db.executemany("""
+            INSERT INTO records VALUES (?2, ?1, ?3, ?4)
+            ON CONFLICT(record_id) DO UPDATE SET
+                statement_id = excluded.statement_id,
+                statement_date = excluded.statement_date,
+                record_status = excluded.record_status
+            WHERE coalesce(excluded.statement_date, '') >=
+                coalesce(records.statement_date, '')
+        """, [r for r in rows if r[1] is not None])
+
+    def latest(self, record_id):
+        """
+        (statementId, statementDate, recordStatus) of the latest statement
+        for record_id, or None.
+        """
+        return self.db.execute("SELECT statement_id, statement_date, "
+          "record_status FROM records WHERE record_id = ?",
+          (record_id,)).fetchone()
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def record_change(index, latest, statement):
+    """
+    How statement changes its record, from the latest statement for the
+    record in index (or in latest, the batch's statements so far, which
+    aren't in index yet): "new records", "updated records", "closed records
+    updated" if the record had been closed, or "out of date" if there's
+    already a later statement for it.
+    """
+    record_id = statement.get("recordId")
+    if record_id is None:
+        return
+    date = statement.get("statementDate") or ""
+    if record_id in latest:
+        previous = latest[record_id]
+    else:
+        previous = index.latest(record_id)
+        if previous is not None:
+            previous = (previous[1] or "", previous[2])
+    if previous is not None and date < previous[0]:
+        return "out of date"
+    latest[record_id] = (date, statement.get("recordStatus"))
+    if previous is None:
+        return "new records"
+    if previous[1] == "closed":
+        return "closed records updated"
+    return "updated records"
+
+
+def convert_delta(converter, infile, outfile, index, batch=INDEX_BATCH):
+    """
+    Convert the statements in infile that aren't in index yet, appending
+    them to outfile and adding them to index.
+    Returns counts of statements skipped and converted, of converted
+    statements by recordStatus, and of how they change the records in the
+    index (see record_change). Shared nodes are only remembered for this
+    run, so ones written by earlier runs are written again when they're
+    used.
+    """
+    counts = Counter()
+
+    def flush(statements, out):
+        seen = index.seen(s["statementId"] for s in statements)
+        new = {}
+        for s in statements:
+            if s["statementId"] not in seen:
+                new.setdefault(s["statementId"], s)
+        counts["skipped"] += len(statements) - len(new)
+        latest = {}
+        for s in new.values():
+            out.writelines(map(converter.nquad, converter.statement(s)))
+            counts["converted"] += 1
+            counts[s.get("recordStatus") or "no recordStatus"] += 1
+            change = record_change(index, latest, s)
+            if change:
+                counts[change] += 1
+        # Only mark them as converted once they're written
+        out.flush()
+        index.add(new.values())
+        index.commit()
+
+    with open(outfile, "a", encoding="utf-8") as out:
+        statements = []
+        for statement in read_input(infile):
+            statements.append(statement)
+            if len(statements) >= batch:
+                flush(statements, out)
+                statements = []
+        if statements:
+            flush(statements, out)
+    return counts
+
+
+def is_json_lines(filename):
+    with open(filename, "rb") as f:
+        return not f.read(READ_SIZE).lstrip().startswith(b"[")
+
+
+def byte_ranges(filename, chunk_size=CHUNK_SIZE):
+    """
+    Split a JSON Lines file into (start, end) ranges of about chunk_size
+    bytes, which start and end on line boundaries.
+    """
+    size = os.path.getsize(filename)
+    start = 0
+    with open(filename, "rb") as f:
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            yield start, end
+            start = end
+
+
+converter = None
+
+
+def init_worker(plan, base):
+    global converter
+    converter = Converter(plan, base)
+
+
+def convert_range(infile, start, end, shard):
+    """
+    Convert the statements between start and end in infile and write their
+    quads to shard, sorted and without duplicates, so shards can be merged.
+    """
+    quads = set()
+    with open(infile, "rb") as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            if line.strip():
+                quads.update(map(converter.nquad,
+                  converter.statement(json.loads(line))))
+    with open(shard, "w", encoding="utf-8") as out:
+        out.writelines(sorted(quads))
+    return len(quads)
+
+
+def convert_parallel(plan, base, infile, shard_dir, workers,
+  chunk_size=CHUNK_SIZE):
+    """
+    Convert a JSON Lines file in a pool of worker processes, a chunk at a
+    time, writing a sorted N-Quads shard for each chunk to shard_dir.
+    Returns the shards' filenames, in the order of the input.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    shards, futures = [], []
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+      initargs=(plan, base)) as pool:
+        for i, (start, end) in enumerate(byte_ranges(infile, chunk_size)):
+            shard = os.path.join(shard_dir, f"shard-{i:06d}.nq")
+            futures.append(pool.submit(convert_range, infile, start, end,
+              shard))
+            shards.append(shard)
+        total = sum(f.result() for f in futures)
+    print(f"Wrote {total} quads to {len(shards)} shards.")
+    return shards
+
+
+def merged_lines(filenames):
+    """
+    Yield the lines of sorted files in order, without duplicates.
+    """
+    with ExitStack() as stack:
+        files = [stack.enter_context(open(fn, encoding="utf-8"))
+          for fn in filenames]
+        for line, _ in groupby(heapq.merge(*files)):
+            yield line
+
+
+def merge_files(filenames, outfile):
+    with open(outfile, "w", encoding="utf-8") as out:
+        out.writelines(merged_lines(filenames))
+
+
+def reduce_shards(shards, fan_in=MERGE_FAN_IN):
+    """
+    Merge sorted shards fan_in at a time until there are no more than
+    fan_in of them, so there aren't too many files open at once.
+    """
+    n = 0
+    while len(shards) > fan_in:
+        merged = []
+        for i in range(0, len(shards), fan_in):
+            fn = os.path.join(os.path.dirname(shards[0]), f"merge-{n:06d}.nq")
+            merge_files(shards[i:i + fan_in], fn)
+            merged.append(fn)
+            n += 1
+        shards = merged
+    return shards
+
+
+def merge_shards(shards, outfile, fan_in=MERGE_FAN_IN):
+    """
+    Merge sorted shards into outfile, dropping quads that are in more than
+    one shard, such as shared nodes.
+    """
+    merge_files(reduce_shards(shards, fan_in), outfile)
+
+
+def record_line(statement, seq):
+    """
+    A statement as a line that sorts by recordId, then statementDate, then
+    publicationDate, then its place in the input (seq).
+    """
+    publication = statement.get("publicationDetails") or {}
+    return "\t".join([
+        json.dumps(statement.get("recordId")),
+        statement.get("statementDate") or "",
+        publication.get("publicationDate") or "",
+        f"{seq:012d}",
+        json.dumps(statement),
+    ]) + "\n"
+
+
+def sorted_runs(statements, run_dir, run_size=RUN_SIZE):
+    """
+    Write statements to files of run_size lines each, sorted with
+    record_line, and return their filenames.
+    """
+    runs = []
+    lines = []
+
+    def spill():
+        fn = os.path.join(run_dir, f"run-{len(runs):06d}.txt")
+        with open(fn, "w", encoding="utf-8") as f:
+            f.writelines(sorted(lines))
+        runs.append(fn)
+
+    for seq, statement in enumerate(statements):
+        if statement.get("recordId") is None:
+            continue
+        lines.append(record_line(statement, seq))
+        if len(lines) >= run_size:
+            spill()
+            lines = []
+    if lines:
+        spill()
+    return runs
+
+
+def convert_latest(converter, infile, outfile, tmp_dir=None,
+  run_size=RUN_SIZE):
+    """
+    Write the current state of each record in infile to outfile as
+    N-Triples: the triples from its latest statement (by statementDate,
+    then publicationDate, then the order of the input), or nothing if that
+    statement closed the record.
+    Statements are sorted by record with an external sort, spilling runs
+    of run_size statements to tmp_dir, so the input can be bigger than
+    memory. Returns counts of records written and closed.
+    """
+    counts = Counter(records=0, closed=0)
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir, \
+      open(outfile, "w", encoding="utf-8") as out:
+        runs = sorted_runs(read_input(infile), run_dir, run_size)
+        lines = merged_lines(reduce_shards(runs))
+        for _, group in groupby(lines, key=lambda l: l.partition("\t")[0]):
+            latest = deque(group, maxlen=1)[0]
+            statement = json.loads(latest.split("\t", 4)[4])
+            if statement.get("recordStatus") == "closed":
+                counts["closed"] += 1
+                continue
+            counts["records"] += 1
+            for s, p, o, _ in converter.statement(statement):
+                out.write(converter.nquad((s, p, o, None)))
+    return counts
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+      description="Convert BODS v0.4 JSON or JSON Lines to N-Quads.")
+    parser.add_argument("input",
+      help="BODS JSON array or JSON Lines file, which can be .gz, .zip or "
+        ".zst compressed")
+    parser.add_argument("output",
+      help="N-Quads file to write, or packed quad file if it ends with .bq "
+        "(see quadfile.py)")
+    parser.add_argument("--base", default=DEFAULT_BASE,
+      help="base URI for statements, records and declarations")
+    parser.add_argument("--schema-dir", default="schemas")
+    parser.add_argument("--plan",
+      help="mapping plan written by bodsld.py, instead of building the "
+        "vocabulary from the schemas")
+    parser.add_argument("--index",
+      help="SQLite file of statements already converted: only statements "
+        "that aren't in it are converted, and appended to OUTPUT")
+    parser.add_argument("--latest", action="store_true",
+      help="write only the current state of each record, as N-Triples")
+    parser.add_argument("--tmp-dir",
+      help="where --latest keeps the statements it sorts")
+    parser.add_argument("--workers", type=int, default=1,
+      help="convert JSON Lines input in this many processes")
+    parser.add_argument("--no-merge", action="store_true",
+      help="with --workers, leave the shards in OUTPUT.shards "
+        "instead of merging them into OUTPUT")
+    parser.add_argument("--cache-size", type=int, default=TERM_CACHE_SIZE,
+      help="how many of each kind of term from the data to keep")
+    parser.add_argument("--cache-stats", action="store_true",
+      help="print the term caches' hit rates")
+    parser.add_argument("--seen-size", type=int, default=SEEN_SIZE,
+      help="how many shared nodes (jurisdictions, publishers, addresses, "
+        "identifiers and names) to remember having written")
+    args = parser.parse_args()
+
+    if args.workers > 1 and (is_compressed(args.input) or
+      not is_json_lines(args.input)):
+        parser.error("--workers needs uncompressed JSON Lines input")
+    if sum([args.workers > 1, bool(args.index), args.latest]) > 1:
+        parser.error("only one of --workers, --index and --latest can be used")
+    packed = args.output.endswith(".bq")
+    if packed and (args.index or args.latest or args.no_merge):
+        parser.error("--index, --latest and --no-merge write N-Quads")
+
+    if args.plan:
+        plan = load_plan(args.plan)
+    else:
+        schemas, codelists = get_schemas_and_codelists(args.schema_dir)
+        vocab = bods_vocab(schemas, codelists)
+        vocab.make_graph()
+        plan = vocab.mapping_plan()
+
+    converter = Converter(plan, args.base, cache_size=args.cache_size,
+      seen_size=args.seen_size)
+    if args.latest:
+        counts = convert_latest(converter, args.input, args.output,
+          args.tmp_dir)
+        print(f"{counts['records']} records, {counts['closed']} closed.")
+    elif args.index:
+        index = StatementIndex(args.index)
+        counts = convert_delta(converter, args.input, args.output, index)
+        index.close()
+        print(", ".join(f"{n} {k}" for k, n in counts.items()))
+    elif args.workers > 1:
+        shard_dir = f"{args.output}.shards"
+        shards = convert_parallel(plan, args.base, args.input, shard_dir,
+          args.workers)
+        if packed:
+            write_quadfile(args.output, merged_lines(reduce_shards(shards)))
+            shutil.rmtree(shard_dir)
+        elif not args.no_merge:
+            merge_shards(shards, args.output)
+            shutil.rmtree(shard_dir)
+    elif packed:
+        write_quadfile(args.output,
+          map(converter.nquad, converter.convert(read_input(args.input))))
+    else:
+        convert_file(converter, args.input, args.output)
+
+    if args.cache_stats and args.workers <= 1:
+        for name, cache in converter.terms.report().items():
+            print(f"{name}: {cache['hits']} hits, {cache['misses']} misses "
+              f"({cache['hit_rate']:.1%})")
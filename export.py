@@ -0,0 +1,182 @@
+"""
+Streaming writers for exporting a graph in several RDF formats at once.
+
+The graph is sorted and walked once, a subject at a time, and each writer
+writes that subject's triples straight to its file handle, so the output
+is the same from one build to the next and no format is built up as one
+big string first.
+"""
+import re
+import json
+from itertools import groupby
+from operator import itemgetter
+from xml.sax.saxutils import escape, quoteattr
+
+from rdflib import BNode, Literal
+from rdflib.namespace import RDF, split_uri
+
+
+NT_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    '"': '\\"',
+    "\n": "\\n",
+    "\r": "\\r",
+})
+
+# What N-Triples doesn't allow in an IRI
+IRI_ILLEGAL = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+
+
+def escape_iri(iri):
+    """
+    iri with the characters N-Triples doesn't allow in IRIs (such as
+    spaces) percent-encoded.
+    """
+    return IRI_ILLEGAL.sub(lambda m: f"%{ord(m.group()):02X}", iri)
+
+
+def nt_term(term):
+    if isinstance(term, Literal):
+        s = f'"{str(term).translate(NT_ESCAPES)}"'
+        if term.language:
+            return f"{s}@{term.language}"
+        if term.datatype:
+            return f"{s}^^<{term.datatype}>"
+        return s
+    if isinstance(term, BNode):
+        return f"_:{term}"
+    return f"<{escape_iri(term)}>"
+
+
+class NTriplesWriter:
+
+    def __init__(self, f, namespaces):
+        self.f = f
+
+    def start(self):
+        pass
+
+    def subject(self, subject, triples):
+        for s, p, o in triples:
+            self.f.write(f"{nt_term(s)} {nt_term(p)} {nt_term(o)} .\n")
+
+    def end(self):
+        pass
+
+
+class JSONLDWriter:
+
+    def __init__(self, f, namespaces):
+        self.f = f
+        self.namespaces = sorted(namespaces.items(),
+          key=lambda n: len(n[1]), reverse=True)
+        self.context = dict(namespaces)
+        self.first = True
+
+    def compact(self, uri):
+        for prefix, ns in self.namespaces:
+            if uri.startswith(ns):
+                return f"{prefix}:{uri[len(ns):]}"
+        return str(uri)
+
+    def node_id(self, term):
+        if isinstance(term, BNode):
+            return f"_:{term}"
+        return self.compact(term)
+
+    def value(self, term):
+        if isinstance(term, Literal):
+            v = {"@value": str(term)}
+            if term.language:
+                v["@language"] = term.language
+            elif term.datatype:
+                v["@type"] = self.compact(term.datatype)
+            return v
+        return {"@id": self.node_id(term)}
+
+    def start(self):
+        self.f.write('{\n  "@context": ')
+        self.f.write(json.dumps(self.context, sort_keys=True))
+        self.f.write(',\n  "@graph": [')
+
+    def subject(self, subject, triples):
+        node = {"@id": self.node_id(subject)}
+        for p, objects in groupby(triples, key=itemgetter(1)):
+            if p == RDF.type:
+                node["@type"] = [self.node_id(o) for _, _, o in objects]
+            else:
+                node[self.compact(p)] = [self.value(o) for _, _, o in objects]
+        self.f.write("\n    " if self.first else ",\n    ")
+        self.f.write(json.dumps(node, ensure_ascii=False))
+        self.first = False
+
+    def end(self):
+        self.f.write("\n  ]\n}\n")
+
+
+class RDFXMLWriter:
+
+    def __init__(self, f, namespaces):
+        self.f = f
+        self.namespaces = {"rdf": str(RDF), **namespaces}
+        self.prefixes = {ns: prefix for prefix, ns in self.namespaces.items()}
+
+    def qname(self, uri):
+        ns, local = split_uri(uri)
+        if ns in self.prefixes:
+            return f"{self.prefixes[ns]}:{local}", ""
+        return f"ns0:{local}", f" xmlns:ns0={quoteattr(ns)}"
+
+    def node_attr(self, attr, term):
+        if isinstance(term, BNode):
+            return f"rdf:nodeID={quoteattr(str(term))}"
+        return f"rdf:{attr}={quoteattr(str(term))}"
+
+    def start(self):
+        self.f.write('<?xml version="1.0" encoding="utf-8"?>\n<rdf:RDF')
+        for prefix, ns in sorted(self.namespaces.items()):
+            self.f.write(f"\n  xmlns:{prefix}={quoteattr(ns)}")
+        self.f.write(">\n")
+
+    def subject(self, subject, triples):
+        self.f.write(f"  <rdf:Description {self.node_attr('about', subject)}>\n")
+        for _, p, o in triples:
+            tag, xmlns = self.qname(p)
+            if isinstance(o, Literal):
+                attrs = xmlns
+                if o.language:
+                    attrs += f" xml:lang={quoteattr(o.language)}"
+                elif o.datatype:
+                    attrs += f" rdf:datatype={quoteattr(str(o.datatype))}"
+                self.f.write(f"    <{tag}{attrs}>{escape(str(o))}</{tag}>\n")
+            else:
+                self.f.write(
+                  f"    <{tag}{xmlns} {self.node_attr('resource', o)}/>\n")
+        self.f.write("  </rdf:Description>\n")
+
+    def end(self):
+        self.f.write("</rdf:RDF>\n")
+
+
+WRITERS = {
+    "nt": NTriplesWriter,
+    "json-ld": JSONLDWriter,
+    "xml": RDFXMLWriter,
+}
+
+
+def export_graph(g, files, namespaces):
+    """
+    Write g to each of files, which maps a format in WRITERS to an open
+    file handle, in one sorted pass over the graph.
+    """
+    namespaces = {prefix: str(ns) for prefix, ns in namespaces.items()}
+    writers = [WRITERS[fmt](f, namespaces) for fmt, f in files.items()]
+    for w in writers:
+        w.start()
+    for subject, triples in groupby(sorted(g), key=itemgetter(0)):
+        triples = [*triples]
+        for w in writers:
+            w.subject(subject, triples)
+    for w in writers:
+        w.end()
@@ -1,20 +1,27 @@
 import os
 import csv
 import json
-import requests
+import time
+import pickle
+import hashlib
 import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple, Counter
 
-from referencing import Registry, Resource, exceptions
-from referencing.jsonschema import DRAFT202012
 from rdflib.namespace import Namespace, RDF, RDFS, XSD, OWL, DCTERMS
-from pylode.profiles.ontpub import OntPub
 
 
 logger = logging.getLogger(__name__)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 
-REMOTE_SCHEMA_DIR = "https://raw.githubusercontent.com/openownership/data-standard/refs/heads/main/schema/"
+REMOTE_SCHEMA_URL = "https://raw.githubusercontent.com/openownership/data-standard/{ref}/schema/"
+DEFAULT_REF = "refs/heads/main"
+REMOTE_SCHEMA_DIR = REMOTE_SCHEMA_URL.format(ref=DEFAULT_REF)
+MANIFEST_FILE = ".fetch-manifest.json"
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 30
 SCHEMA_FILES = [
   "components.json",
   "entity-record.json",
@@ -39,117 +46,471 @@ CODELIST_FILES = [
 ]
 
 
+class BuildStats:
+    """
+    Timings and counters for a vocabulary build, as a dict for writing out
+    as JSON. timings are in seconds and add up if a name is timed twice;
+    steps has the time and number of triples added and removed by each
+    map_* step.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.timings = {}
+        self.counters = Counter()
+        self.steps = {}
+        self.conflicts = []
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + \
+              time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def report(self):
+        return {
+            "timings": {k: round(v, 6) for k, v in self.timings.items()},
+            "counters": dict(sorted(self.counters.items())),
+            "steps": self.steps,
+            "conflicts": self.conflicts,
+        }
+
+
+stats = BuildStats()
+
+
+# Predicates a term should only have one value for
+CONFLICT_PREDICATES = [RDFS.label, RDFS.comment, RDFS.range]
+
+
+class TripleBuffer:
+    """
+    Collects triples to be added to or removed from a graph, keeping only
+    the last thing done to each (True for added, False for removed), so
+    duplicates cost nothing and the result can be loaded in one addN.
+    """
+
+    def __init__(self):
+        self.ops = {}
+
+    def add(self, triple):
+        self.ops[triple] = True
+
+    def addN(self, quads):
+        for s, p, o, _ in quads:
+            self.ops[(s, p, o)] = True
+
+    def remove(self, triple):
+        self.ops[triple] = False
+
+    def update(self, added, removed):
+        for triple in removed:
+            self.ops[triple] = False
+        for triple in added:
+            self.ops[triple] = True
+
+    def added(self):
+        return [t for t, added in self.ops.items() if added]
+
+    def removed(self):
+        return [t for t, added in self.ops.items() if not added]
+
+    def __contains__(self, triple):
+        return self.ops.get(triple, False)
+
+    def __iter__(self):
+        return iter(self.added())
+
+    def __len__(self):
+        return len(self.added())
+
+    def conflicts(self, predicates=CONFLICT_PREDICATES):
+        """
+        Subjects with more than one value for any of predicates, as
+        {(subject, predicate): [values]}.
+        """
+        predicates = set(predicates)
+        values = {}
+        for s, p, o in self.added():
+            if p in predicates:
+                values.setdefault((s, p), []).append(o)
+        return {k: v for k, v in values.items() if len(v) > 1}
+
+    def flush(self, g):
+        """
+        Apply the removals to g, add everything else in one addN, and
+        empty the buffer.
+        """
+        for triple in self.removed():
+            g.remove(triple)
+        g.addN((s, p, o, g) for s, p, o in self.added())
+        self.ops = {}
+
+
 def cap_first(s):
     return s[:1].upper() + s[1:]
 
 
-def get_remote_schemas():
-    schema_files = {}
-    for fn in SCHEMA_FILES:
-        r = requests.get(os.path.join(REMOTE_SCHEMA_DIR, fn))
-        j = r.json()
-        schema_files[fn] = j
-    return schema_files
+def digest(value):
+    data = json.dumps(value, sort_keys=True, default=list)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def file_digest(*filenames):
+    h = hashlib.sha256()
+    for fn in filenames:
+        with open(fn, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def load_build_cache(filename):
+    try:
+        with open(filename, "rb") as f:
+            return pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return {}
+
+
+def save_build_cache(filename, cache):
+    with open(filename, "wb") as f:
+        pickle.dump(cache, f)
+
+
+def get_remote_schemas(ref=DEFAULT_REF, session=None,
+      remote=REMOTE_SCHEMA_URL):
+    texts = fetch_texts(remote_schema_dir(ref, remote), SCHEMA_FILES, session)
+    return {fn: json.loads(t) for fn, t in texts.items()}
+
+
+def get_remote_codelists(ref=DEFAULT_REF, session=None,
+      remote=REMOTE_SCHEMA_URL):
+    paths = [f"codelists/{fn}" for fn in CODELIST_FILES]
+    texts = fetch_texts(remote_schema_dir(ref, remote), paths, session)
+    return {fn: texts[f"codelists/{fn}"] for fn in CODELIST_FILES}
+
+
+def remote_schema_dir(ref=DEFAULT_REF, remote=REMOTE_SCHEMA_URL):
+    return remote.format(ref=ref)
 
 
-def get_remote_codelists():
-    codelist_files = {}
-    for fn in CODELIST_FILES:
-        r = requests.get(os.path.join(REMOTE_SCHEMA_DIR, "codelists", fn))
-        t = r.text
-        codelist_files[fn] = t
-    return codelist_files
+def ref_schema_dir(base_dir, ref):
+    return os.path.join(base_dir, ref.replace("/", "-"))
 
 
-def get_schemas_and_codelists(schema_dir="schemas", overwrite=False):
+def fetch_session(workers=FETCH_WORKERS):
+    """
+    A requests session with a connection pool big enough for every worker
+    to keep its connection open between files.
+    """
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=workers,
+      pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_texts(base_url, paths, session=None, workers=FETCH_WORKERS):
+    session = session or fetch_session(workers)
+
+    def fetch(path):
+        r = session.get(base_url + path, timeout=FETCH_TIMEOUT)
+        r.raise_for_status()
+        return r.text
+
+    with ThreadPoolExecutor(workers) as pool:
+        return dict(zip(paths, pool.map(fetch, paths)))
+
+
+def read_manifest(schema_dir):
+    try:
+        with open(os.path.join(schema_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(schema_dir, manifest):
+    with open(os.path.join(schema_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def fetch_file(session, url, fp, cached=None, revalidate=False):
+    """
+    Return the text of a schema or codelist file and its manifest entry.
+    A file on disc is used as-is unless revalidate is set, in which case
+    a conditional request is made with the ETag/Last-Modified from the
+    manifest, and the file on disc is kept if the server says 304. A file
+    the manifest says came from another URL (eg. another ref) is fetched
+    again.
+    """
+    moved = bool(cached) and cached.get("url") != url
+    if moved:
+        cached = None
+
+    if os.path.isfile(fp):
+        if not revalidate and not moved:
+            logger.info(f"Using {fp} from cache")
+            with open(fp) as f:
+                return f.read(), cached
+    else:
+        cached = None
+
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    r = session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+    if r.status_code == 304:
+        logger.info(f"{fp} not modified")
+        with open(fp) as f:
+            return f.read(), cached
+    r.raise_for_status()
+
+    logger.info(f"Fetched {url}")
+    os.makedirs(os.path.dirname(fp), exist_ok=True)
+    with open(fp, "w") as f:
+        f.write(r.text)
+    return r.text, {
+        "url": url,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+    }
+
+
+def get_refs_schemas_and_codelists(refs, base_dir="schemas", overwrite=False,
+      remote=REMOTE_SCHEMA_URL, workers=FETCH_WORKERS):
+    """
+    Fetch schemas and codelists for several refs (branches or tags) of the
+    standard at once, each into its own directory under base_dir.
+    Returns {ref: (schemas, codelists)}.
+    """
+    dirs = {ref: ref_schema_dir(base_dir, ref) for ref in refs}
+    return fetch_schemas_and_codelists(dirs, overwrite, remote, workers)
+
+
+def fetch_schemas_and_codelists(dirs, overwrite=False,
+      remote=REMOTE_SCHEMA_URL, workers=FETCH_WORKERS):
+    """
+    dirs maps each ref to the directory its files are cached in.
+    All the files are fetched concurrently over one pooled session.
+    """
+    paths = SCHEMA_FILES + [f"codelists/{fn}" for fn in CODELIST_FILES]
+    manifests = {ref: read_manifest(d) for ref, d in dirs.items()}
+    # Only set up requests if something needs fetching
+    def on_disc(ref, path):
+        entry = manifests[ref].get(path)
+        return os.path.isfile(os.path.join(dirs[ref], path)) and \
+          (not entry or entry.get("url") == remote_schema_dir(ref, remote) +
+          path)
+    local = not overwrite and all(on_disc(ref, path)
+      for ref in dirs for path in paths)
+    session = None if local else fetch_session(workers)
+
+    with ThreadPoolExecutor(workers) as pool:
+        futures = {}
+        for ref, schema_dir in dirs.items():
+            base_url = remote_schema_dir(ref, remote)
+            for path in paths:
+                futures[(ref, path)] = pool.submit(fetch_file, session,
+                  base_url + path, os.path.join(schema_dir, path),
+                  manifests[ref].get(path), overwrite)
+
+        results = {}
+        for ref, schema_dir in dirs.items():
+            schemas = {}
+            codelists = {}
+            manifest = dict(manifests[ref])
+            for path in paths:
+                text, entry = futures[(ref, path)].result()
+                if entry:
+                    manifest[path] = entry
+                if path in SCHEMA_FILES:
+                    schemas[path] = json.loads(text)
+                else:
+                    codelists[os.path.basename(path)] = text
+            if manifest != manifests[ref]:
+                write_manifest(schema_dir, manifest)
+            results[ref] = (schemas, codelists)
+
+    if session:
+        session.close()
+    return results
+
+
+def get_schemas_and_codelists(schema_dir="schemas", overwrite=False,
+      ref=DEFAULT_REF, remote=REMOTE_SCHEMA_URL):
     """
     Fetch schema and codelist files from disc.
     If they're not there, fetch from github and store them.
-    If overwrite = True, re-fetch them from github.
-    """
-    schemas = {}
-    codelists = {}
-
-    for fn in SCHEMA_FILES:
-        fp = os.path.join(schema_dir, fn)
-        if not os.path.isfile(fp) or overwrite:
-            logger.info(f"Fetching {fn} from github")
-            r = requests.get(os.path.join(REMOTE_SCHEMA_DIR, fn))
-            schemas[fn] = r.json()
-            with open(fp, "w") as f:
-                f.write(r.json())
-        else:
-            logger.info(f"Using {fn} from cache")
-            with open(fp) as f:
-                schemas[fn] = json.load(f)
-
-    for fn in CODELIST_FILES:
-        fp = os.path.join(schema_dir, "codelists", fn)
-        if not os.path.isfile(fp) or overwrite:
-            logger.info(f"Fetching {fn} from github")
-            r = requests.get(os.path.join(REMOTE_SCHEMA_DIR, "codelists", fn))
-            codelists[fn] = r.text
-            with open(fp, "w") as f:
-                f.write(r.text)
-        else:
-            logger.info(f"Using {fn} from cache")
-            with open(fp) as f:
-                codelists[fn] = f.read()
-    
-    return (schemas, codelists)
+    If overwrite = True, check github for newer versions of them.
+    """
+    return fetch_schemas_and_codelists({ref: schema_dir}, overwrite,
+      remote)[ref]
+
+
+CodeInfo = namedtuple("CodeInfo", ["title", "description"])
+
+
+def parse_codelist(text):
+    stats.count("codelist_parses")
+    return [*csv.DictReader(text.splitlines())]
+
+
+class CodelistStore:
+    """
+    Codelists parsed once, keyed by filename, then code -> CodeInfo.
+    If a codelist schema is given every file is validated against it first.
+    """
+
+    def __init__(self, codelist_files, schema=None):
+        if schema is not None:
+            from jsonschema import Draft202012Validator
+            validator = Draft202012Validator(schema)
+
+        self.codelists = {}
+        # Set to a set to record which codelists are looked at
+        self.reads = None
+        for fn, text in codelist_files.items():
+            rows = parse_codelist(text)
+            if schema is not None:
+                validator.validate(rows)
+            self.codelists[fn] = {row.get("code"):
+              CodeInfo(row.get("title"), row.get("description"))
+              for row in rows}
+
+    def __contains__(self, filename):
+        return filename in self.codelists
+
+    def codes(self, filename):
+        return [*self.codelists[filename]]
+
+    def info(self, filename):
+        if self.reads is not None:
+            self.reads.add(filename)
+        return self.codelists[filename]
+
+
+def codelist_store(codelists):
+    if isinstance(codelists, CodelistStore):
+        return codelists
+    return CodelistStore(codelists)
 
 
 def get_codes(codelist_files, filename):
-    codes = []
-    cl = codelist_files.get(filename)
-    csvfile = cl.split("\n")
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        codes.append(row.get('code'))
-    return codes
+    return [*get_codes_and_info(codelist_files, filename)]
 
 
 def get_codes_and_info(codelist_files, filename):
-    codes = {}
-    cl = codelist_files.get(filename)
-    csvfile = cl.split("\n")
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        codes[row.get('code')] = (row.get('title'), row.get('description'))
-    return codes
-
-
-def find_a_bit(registry, pointer):
-    # looks through all the schemas to resolve the pointer
-    # not smart enough to search subresources, so needs a full json pointer
-    if "urn:" in pointer:
-        # Get the root
-        schema = registry.get_or_retrieve(pointer)
-        return schema.value.pointer("", registry.resolver())
-    else:
-        for urn in registry:
-            schema = registry.get_or_retrieve(urn)
+    if not isinstance(codelist_files, CodelistStore):
+        codelist_files = CodelistStore(
+          {filename: codelist_files.get(filename)})
+    return codelist_files.info(filename)
+
+
+class SchemaIndex:
+    """
+    All the loaded schemas flattened into a table of JSON pointer -> node,
+    so a pointer can be looked up without trying every schema in turn.
+
+    A pointer that exists in more than one schema resolves to the last
+    schema it's in (in the order of schema_files), so the properties
+    entities and people share get the person record's descriptions, as in
+    the published vocabulary (docs/terms). Each schema root
+    is also stored under its $id, and nodes that are just a {"$ref": ...}
+    have their targets resolved up front (in refs), so the build cache can
+    tell when what a pointer refers to has changed.
+    """
+
+    def __init__(self, schema_files):
+        self.nodes = {}
+        self.refs = {}
+        self.roots = {}
+        # Set to a set to record which pointers are looked up
+        self.reads = None
+        for schema in schema_files.values():
+            self.roots[schema.get("$id")] = schema
+
+        pending = []
+        for schema in reversed(schema_files.values()):
+            root_id = schema.get("$id")
+            self.nodes.setdefault(root_id, schema)
+            self._flatten(schema, "", root_id, pending)
+
+        for pointer, root_id, ref in pending:
+            self.refs.setdefault(pointer, self.resolve_ref(root_id, ref))
+
+    def _flatten(self, node, pointer, root_id, pending):
+        if isinstance(node, dict):
+            items = node.items()
+            if isinstance(node.get("$ref"), str):
+                pending.append((pointer, root_id, node["$ref"]))
+        elif isinstance(node, list):
+            items = enumerate(node)
+        else:
+            return
+        for key, value in items:
+            segment = str(key).replace("~", "~0").replace("/", "~1")
+            child = f"{pointer}/{segment}"
+            self.nodes.setdefault(child, value)
+            self._flatten(value, child, root_id, pending)
+
+    def resolve_ref(self, root_id, ref):
+        base, _, fragment = ref.partition("#")
+        node = self.roots.get(base or root_id)
+        for segment in fragment.split("/")[1:]:
+            segment = segment.replace("~1", "/").replace("~0", "~")
+            if isinstance(node, list):
+                segment = int(segment)
             try:
-                return schema.value.pointer(pointer, registry.resolver())
-            except exceptions.PointerToNowhere:
-                pass
+                node = node[segment]
+            except (LookupError, TypeError, ValueError):
+                return
+        return node
+
+    def get(self, pointer):
+        if self.reads is not None:
+            self.reads.add(pointer)
+        return self.nodes.get(pointer)
+
+
+def find_a_bit(index, pointer):
+    # needs a full json pointer, or the $id of a schema to get its root
+    r = index.get(pointer)
+    stats.count("schema_lookups")
+    if r is None:
+        stats.count("schema_misses")
+    return r
 
 
-def get_properties(registry, pointer):
-    r = find_a_bit(registry, pointer)
+def get_properties(index, pointer):
+    r = find_a_bit(index, pointer)
     try:
-        return [*r.contents.get("properties")]
-    except AttributeError:
+        return [*r.get("properties")]
+    except (AttributeError, TypeError):
         return
 
 
-def get_type(registry, pointer):
-    path = f"{pointer}/type"
-    bit = find_a_bit(registry, path)
-    return bit.contents
+def get_type(index, pointer):
+    return find_a_bit(index, f"{pointer}/type")
 
 
 def schema_registry(schema_files):
+    from referencing import Registry, Resource
+    from referencing.jsonschema import DRAFT202012
     schemas = []
     for schema in schema_files.values():
         schemas.append((schema.get("$id"),
@@ -160,6 +521,8 @@ def schema_registry(schema_files):
 
 
 def schema_resources(schema_files):
+    from referencing import Resource
+    from referencing.jsonschema import DRAFT202012
     schemas = []
     for schema in schema_files:
         schemas.append(Resource(contents=schema, specification=DRAFT202012))
@@ -0,0 +1,313 @@
+"""
+Work out who owns what from converted relationship records.
+
+Relationships (bods:subject, bods:interestedParty and the shares of their
+bods:interest nodes) are read from N-Quads or N-Triples, such as the
+current state written by convert.py --latest, and turned into an adjacency
+index: each record gets an integer id, and the owners of each record are a
+slice of flat arrays, so walking up ownership chains is array lookups
+rather than graph queries.
+
+For each entity this gives its effective share held by every owner up the
+chain (the product of the shares along each path, summed over the paths),
+its ultimate owners (those that nobody owns, usually people or unspecified
+owners), and any ownership cycles it's part of.
+
+    python ownership.py current.nt > owners.jsonl
+"""
+import sys
+import json
+import math
+import argparse
+from array import array
+
+from rdflib.namespace import RDF
+
+from bodsld import BODS, CODES
+from validate import parse_quad
+
+
+MAX_DEPTH = 100
+
+TYPES = ["unknown", "Entity", "Person", "Unspecified"]
+TYPE_IDS = {str(BODS[t]): i for i, t in enumerate(TYPES) if i}
+SHARE_PREDICATES = {str(BODS[p]): p for p in ["shareExact", "shareMinimum",
+  "shareMaximum", "shareExclusiveMinimum", "shareExclusiveMaximum"]}
+INDIRECT = str(CODES.Indirect)
+
+
+def interest_share(interest):
+    """
+    The share (a percentage) an interest's bods:share* values give, taking
+    the middle of a range, or None if it has none.
+    """
+    if "shareExact" in interest:
+        return interest["shareExact"]
+    low = interest.get("shareMinimum", interest.get("shareExclusiveMinimum"))
+    high = interest.get("shareMaximum", interest.get("shareExclusiveMaximum"))
+    if low is not None and high is not None:
+        return (low + high) / 2
+    return low if low is not None else high
+
+
+class OwnershipIndex:
+    """
+    Records by integer id, with the owners of record i at
+    owners[offsets[i]:offsets[i + 1]], holding shares (fractions, or nan if
+    not known) of it.
+    """
+
+    def __init__(self, edges, types):
+        """
+        edges is a list of (owned, owner, share) URIs and percentages,
+        types maps URIs to one of TYPES.
+        """
+        self.ids = {}
+        self.names = []
+        for owned, owner, _ in edges:
+            self.id(owned)
+            self.id(owner)
+        self.types = array("b", (TYPES.index(types.get(name, "unknown"))
+          for name in self.names))
+
+        # Only sorted by ids, as shares can be None
+        edges = sorted(((self.ids[owned], self.ids[owner], share)
+          for owned, owner, share in edges), key=lambda e: e[:2])
+        self.offsets = array("q", [0] * (len(self.names) + 1))
+        self.owners = array("q", (owner for _, owner, _ in edges))
+        self.shares = array("d", (math.nan if share is None else share / 100
+          for _, _, share in edges))
+        for owned, _, _ in edges:
+            self.offsets[owned + 1] += 1
+        for i in range(len(self.names)):
+            self.offsets[i + 1] += self.offsets[i]
+
+        self.memo = {}
+        self.cycles = set()
+
+    def id(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def ancestors(self, node):
+        """
+        {owner id: effective share} for everyone up the chains above node.
+        Results are kept for every node, so chains shared by several
+        entities, and chains above cycles, are only walked once.
+        """
+        if node not in self.memo:
+            for component in self.components(node):
+                self.resolve(component)
+        return self.memo[node]
+
+    def components(self, start):
+        """
+        The strongly connected components (cycles and the records in them,
+        or single records) above start that haven't been resolved yet, each
+        after the components above it. This is Tarjan's algorithm, with a
+        stack of (node, next owner) rather than recursion, so long chains
+        don't hit the recursion limit.
+        """
+        order = {start: 0}
+        low = {start: 0}
+        stack = [start]
+        on_stack = {start}
+        work = [(start, self.offsets[start])]
+        components = []
+        while work:
+            node, k = work[-1]
+            if k < self.offsets[node + 1]:
+                work[-1] = (node, k + 1)
+                owner = self.owners[k]
+                if owner in self.memo:
+                    continue
+                if owner not in order:
+                    order[owner] = low[owner] = len(order)
+                    stack.append(owner)
+                    on_stack.add(owner)
+                    work.append((owner, self.offsets[owner]))
+                elif owner in on_stack:
+                    low[node] = min(low[node], order[owner])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == order[node]:
+                component = []
+                while not component or component[-1] != node:
+                    component.append(stack.pop())
+                    on_stack.discard(component[-1])
+                components.append(component)
+        return components
+
+    def resolve(self, component):
+        """
+        Work out ancestors for each node in a component, once everything
+        above it has been. Within the component the simple paths (which
+        stop short of going round a cycle again) are walked; everything
+        outside it is the memoized results of the records it leads to.
+        """
+        members = set(component)
+        # What each member's owners outside the component add, per unit
+        exits = {}
+        for node in component:
+            above = {}
+            for k in range(self.offsets[node], self.offsets[node + 1]):
+                owner, share = self.owners[k], self.shares[k]
+                if owner in members:
+                    continue
+                above[owner] = above.get(owner, 0) + share
+                for o, s in self.memo[owner].items():
+                    above[o] = above.get(o, 0) + share * s
+            exits[node] = above
+        for node in component:
+            result = {}
+            for inner, weight in self.inner_paths(node, members).items():
+                if inner != node:
+                    result[inner] = result.get(inner, 0) + weight
+                for o, s in exits[inner].items():
+                    result[o] = result.get(o, 0) + weight * s
+            self.memo[node] = result
+
+    def inner_paths(self, node, members):
+        """
+        {member: the shares multiplied along each simple path from node to
+        it within members, summed}, with node itself as 1. The cycles found
+        on the way are added to cycles.
+        """
+        weights = {node: 1.0}
+        paths = [(node, 1.0, (node,))]
+        while paths:
+            last, weight, path = paths.pop()
+            for k in range(self.offsets[last], self.offsets[last + 1]):
+                owner = self.owners[k]
+                if owner not in members:
+                    continue
+                if owner in path:
+                    cycle = path[path.index(owner):]
+                    # The same cycle from wherever it was entered
+                    turn = cycle.index(min(cycle))
+                    self.cycles.add(cycle[turn:] + cycle[:turn])
+                    continue
+                w = weight * self.shares[k]
+                weights[owner] = weights.get(owner, 0) + w
+                if len(path) < MAX_DEPTH:
+                    paths.append((owner, w, path + (owner,)))
+        return weights
+
+    def is_top(self, node):
+        return self.offsets[node] == self.offsets[node + 1]
+
+    def ownership(self, name):
+        """
+        The owners of the record called name, and the cycles above it, as
+        a dict ready for writing out as JSON. Raises ValueError if name
+        isn't in any of the relationships.
+        """
+        node = self.ids.get(name)
+        if node is None:
+            raise ValueError(f"{name} isn't the subject or interested party "
+              "of any relationship")
+        result = self.ancestors(node)
+        owners = []
+        for owner, share in sorted(result.items(),
+          key=lambda o: -o[1] if not math.isnan(o[1]) else 0):
+            owners.append({
+                "owner": self.names[owner],
+                "type": TYPES[self.types[owner]],
+                "share": None if math.isnan(share) else round(share * 100, 6),
+                "ultimate": self.is_top(owner),
+            })
+        reachable = set(result) | {node}
+        return {
+            "entity": name,
+            "owners": owners,
+            "ultimate_owners": [o["owner"] for o in owners if o["ultimate"]],
+            "cycles": [[self.names[n] for n in cycle]
+              for cycle in sorted(self.cycles) if reachable & set(cycle)],
+        }
+
+    def all_ownership(self):
+        """
+        ownership for every owned entity, in id order.
+        """
+        for node, name in enumerate(self.names):
+            if not self.is_top(node) and TYPES[self.types[node]] != "Person":
+                yield self.ownership(name)
+
+
+def load_relationships(lines):
+    """
+    Read relationship records from N-Quads or N-Triples lines and return
+    (edges, types) for OwnershipIndex. Relationships whose interests are all
+    indirect are left out, as the chains they summarize are walked anyway.
+    """
+    types = {}
+    relationships = {}
+    interests = {}
+    rdf_type = str(RDF.type)
+    wanted = {f"<{p}>" for p in [rdf_type, BODS.subject, BODS.interestedParty,
+      BODS.interest, BODS.directOrIndirect, *SHARE_PREDICATES]}
+    for line in lines:
+        # Subjects and predicates have no spaces, so most lines can be
+        # skipped without parsing them
+        terms = line.split(" ", 2)
+        if len(terms) > 2 and terms[1] not in wanted:
+            continue
+        quad = parse_quad(line)
+        if quad is None:
+            continue
+        (_, s), (_, p), (kind, o), _ = quad
+        if p == rdf_type and o in TYPE_IDS:
+            types[s] = TYPES[TYPE_IDS[o]]
+        elif p == str(BODS.subject) or p == str(BODS.interestedParty):
+            relationships.setdefault(s, {})[p] = o
+        elif p == str(BODS.interest):
+            relationships.setdefault(s, {}).setdefault("interests", []) \
+              .append(o)
+        elif p in SHARE_PREDICATES:
+            interests.setdefault(s, {})[SHARE_PREDICATES[p]] = float(o[0])
+        elif p == str(BODS.directOrIndirect):
+            interests.setdefault(s, {})["indirect"] = o == INDIRECT
+
+    edges = []
+    for rel in relationships.values():
+        owned = rel.get(str(BODS.subject))
+        owner = rel.get(str(BODS.interestedParty))
+        if owned is None or owner is None:
+            continue
+        direct = [interests.get(i, {}) for i in rel.get("interests", [])]
+        direct = [i for i in direct if not i.get("indirect")]
+        if rel.get("interests") and not direct:
+            continue
+        shares = [s for s in map(interest_share, direct) if s is not None]
+        edges.append((owned, owner, max(shares) if shares else None))
+    return edges, types
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+      description="Work out the owners of each entity in converted BODS "
+        "data, as JSON Lines.")
+    parser.add_argument("input", help="N-Quads or N-Triples file")
+    parser.add_argument("--entity", action="append",
+      help="only this entity's record URI (can be given more than once)")
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as f:
+        index = OwnershipIndex(*load_relationships(f))
+
+    if args.entity:
+        try:
+            results = [index.ownership(e) for e in args.entity]
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        results = index.all_ownership()
+    for result in results:
+        sys.stdout.write(json.dumps(result) + "\n")
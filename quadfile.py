@@ -0,0 +1,340 @@
+"""
+A compact binary format for converted data: a dictionary of terms and
+arrays of term ids.
+
+Each term (in its N-Triples form) is stored once, in a sorted string
+table, and each quad is four integer ids (subject, predicate, object and
+graph, with 0 for the default graph). The quads are sorted by predicate,
+then subject, object and graph, with a table of where each predicate's
+quads start and end, and a second ordering by subject. The file is
+memory-mapped when it's opened, so opening it doesn't depend on its size,
+and scanning or filtering by predicate or subject reads ids out of the
+arrays (as NumPy arrays, if NumPy is installed) without making rdflib
+terms.
+
+Packing keeps the term dictionary and the ids in memory, so the input
+should fit in memory as four ids a quad plus its distinct terms.
+
+    python quadfile.py pack statements.nq statements.bq
+    python quadfile.py stats statements.bq
+    python quadfile.py scan statements.bq --predicate bods:fullName
+    python quadfile.py unpack statements.bq statements.nq
+"""
+import sys
+import mmap
+import struct
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+
+from constants import NAMESPACES, QUAD
+
+
+MAGIC = b"BODSQF1\n"
+# magic, id width, terms, quads, predicates, then the offsets of the term
+# offsets, term text, subject, predicate, object and graph ids, the order
+# by subject and the predicate table
+HEADER = struct.Struct("<8sQQQQ8Q")
+ALIGN = 8
+DEFAULT_GRAPH = ""
+
+
+def sort_order(keys, n):
+    """
+    The positions 0..n-1 in the order of keys, a list of arrays (the
+    first is the most significant).
+    """
+    try:
+        import numpy
+    except ImportError:
+        return sorted(range(n), key=lambda i: tuple(k[i] for k in keys))
+    return numpy.lexsort([numpy.asarray(k) for k in reversed(keys)]) \
+      .tolist()
+
+
+def split_quad(line):
+    """
+    The N-Triples text of a line's subject, predicate, object and graph
+    (DEFAULT_GRAPH for a triple), or None for blank lines and comments.
+    """
+    m = QUAD.match(line)
+    if not m:
+        if line.strip() and not line.lstrip().startswith("#"):
+            raise ValueError(f"not a triple or quad: {line.strip()[:200]}")
+        return
+    s, p, o, g = m.groups()
+    return s, p, o, g or DEFAULT_GRAPH
+
+
+def write_quadfile(filename, lines):
+    """
+    Pack N-Quads or N-Triples lines into filename. Returns the number of
+    quads.
+    """
+    ids = {DEFAULT_GRAPH: 0}
+    columns = [array("Q") for _ in range(4)]
+    for line in lines:
+        quad = split_quad(line)
+        if quad is None:
+            continue
+        for column, term in zip(columns, quad):
+            i = ids.get(term)
+            if i is None:
+                i = ids[term] = len(ids)
+            column.append(i)
+
+    # Number the terms in sorted order, so they can be looked up by
+    # binary search
+    terms = sorted(ids, key=lambda t: t.encode("utf-8"))
+    renumber = array("Q", bytes(8 * len(terms)))
+    for new, term in enumerate(terms):
+        renumber[ids[term]] = new
+    del ids
+    width = 4 if len(terms) < 1 << 32 else 8
+    code = "I" if width == 4 else "Q"
+    s, p, o, g = [array(code, (renumber[i] for i in column))
+      for column in columns]
+    del columns
+    n = len(s)
+
+    order = sort_order([p, s, o, g], n)
+    s, p, o, g = [array(code, (c[i] for i in order)) for c in (s, p, o, g)]
+    by_subject = array(code, sort_order([s, p, o, g], n))
+
+    predicates = array("Q")
+    start = 0
+    while start < n:
+        end = bisect_right(p, p[start], start)
+        predicates.extend([p[start], start, end])
+        start = end
+
+    blob = bytearray()
+    term_offsets = array("Q", [0])
+    for term in terms:
+        blob += term.encode("utf-8")
+        term_offsets.append(len(blob))
+
+    sections = [term_offsets.tobytes(), bytes(blob), s.tobytes(),
+      p.tobytes(), o.tobytes(), g.tobytes(), by_subject.tobytes(),
+      predicates.tobytes()]
+    offsets = []
+    pos = HEADER.size
+    for section in sections:
+        pos += -pos % ALIGN
+        offsets.append(pos)
+        pos += len(section)
+    with open(filename, "wb") as f:
+        f.write(HEADER.pack(MAGIC, width, len(terms), n,
+          len(predicates) // 3, *offsets))
+        for offset, section in zip(offsets, sections):
+            f.write(bytes(offset - f.tell()))
+            f.write(section)
+    return n
+
+
+class TermTable:
+    """
+    The term dictionary of a QuadFile, as a sorted sequence of UTF-8 term
+    texts, read from the file as they're asked for.
+    """
+
+    def __init__(self, buf, offsets, blob):
+        self.buf = buf
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.buf[self.blob + self.offsets[i]:
+          self.blob + self.offsets[i + 1]])
+
+
+class SubjectColumn:
+    """
+    Subject ids in subject order, for bisecting.
+    """
+
+    def __init__(self, s, by_subject):
+        self.s = s
+        self.by_subject = by_subject
+
+    def __len__(self):
+        return len(self.by_subject)
+
+    def __getitem__(self, i):
+        return self.s[self.by_subject[i]]
+
+
+class QuadFile:
+    """
+    A packed quad file, memory-mapped. s, p, o and g are the id columns,
+    in predicate order, and by_subject the positions in subject order.
+    """
+
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, width, n_terms, n, n_predicates, *offsets = \
+          HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} isn't a packed quad file")
+        self.n = n
+        code = "I" if width == 4 else "Q"
+        (term_offsets, blob, s, p, o, g, by_subject, predicates) = offsets
+        term_offsets = self.column(term_offsets, "Q", n_terms + 1)
+        self.terms = TermTable(self.mm, term_offsets, blob)
+        self.s, self.p, self.o, self.g, self.by_subject = [
+          self.column(offset, code, n)
+          for offset in (s, p, o, g, by_subject)]
+        table = self.column(predicates, "Q", 3 * n_predicates)
+        self.predicates = {int(table[i]): (int(table[i + 1]),
+          int(table[i + 2])) for i in range(0, len(table), 3)}
+        self.subjects = SubjectColumn(self.s, self.by_subject)
+
+    def column(self, offset, code, count):
+        try:
+            import numpy
+        except ImportError:
+            size = count * struct.calcsize(code)
+            return memoryview(self.mm)[offset:offset + size].cast(code)
+        dtype = numpy.uint32 if code == "I" else numpy.uint64
+        return numpy.frombuffer(self.mm, dtype, count, offset)
+
+    def close(self):
+        # Views of the map have to go before it can be closed
+        self.s = self.p = self.o = self.g = self.by_subject = None
+        self.terms = self.subjects = None
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.n
+
+    def term(self, i):
+        """
+        The N-Triples text of term i ("" for the default graph).
+        """
+        return self.terms[i].decode("utf-8")
+
+    def id(self, term):
+        """
+        The id of a term's N-Triples text, or None if it isn't in the
+        file.
+        """
+        key = term.encode("utf-8")
+        i = bisect_left(self.terms, key)
+        if i < len(self.terms) and self.terms[i] == key:
+            return i
+
+    def predicate_counts(self):
+        return {self.term(p): end - start
+          for p, (start, end) in sorted(self.predicates.items())}
+
+    def positions(self, predicate=None, subject=None):
+        """
+        The positions of the quads with predicate and subject (N-Triples
+        text), or all of them if neither is given.
+        """
+        p = None if predicate is None else self.id(predicate)
+        s = None if subject is None else self.id(subject)
+        if (predicate is not None and p is None) or \
+          (subject is not None and s is None):
+            return range(0)
+        if p is not None:
+            start, end = self.predicates.get(p, (0, 0))
+            if s is not None:
+                # Within a predicate, quads are in subject order
+                start, end = (bisect_left(self.s, s, start, end),
+                  bisect_right(self.s, s, start, end))
+            return range(start, end)
+        if s is not None:
+            start = bisect_left(self.subjects, s)
+            end = bisect_right(self.subjects, s, start)
+            return (int(i) for i in self.by_subject[start:end])
+        return range(self.n)
+
+    def scan(self, predicate=None, subject=None):
+        """
+        Yield (s, p, o, g) ids of the quads with predicate and subject.
+        """
+        s, p, o, g = self.s, self.p, self.o, self.g
+        for i in self.positions(predicate, subject):
+            yield int(s[i]), int(p[i]), int(o[i]), int(g[i])
+
+    def nquads(self, predicate=None, subject=None):
+        """
+        Yield the quads with predicate and subject as N-Quads lines.
+        """
+        term = self.term
+        for s, p, o, g in self.scan(predicate, subject):
+            if g:
+                yield f"{term(s)} {term(p)} {term(o)} {term(g)} .\n"
+            else:
+                yield f"{term(s)} {term(p)} {term(o)} .\n"
+
+
+def expand(term):
+    """
+    N-Triples text for a CURIE, URI or N-Triples term.
+    """
+    if term[0] in '<_"':
+        return term
+    prefix, _, local = term.partition(":")
+    if prefix in NAMESPACES:
+        return f"<{NAMESPACES[prefix]}{local}>"
+    return f"<{term}>"
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+      description="Pack N-Quads into a binary quad file, and read them back.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = commands.add_parser("pack",
+      help="pack an N-Quads or N-Triples file")
+    pack_parser.add_argument("input")
+    pack_parser.add_argument("output")
+
+    unpack_parser = commands.add_parser("unpack",
+      help="write a packed file out as N-Quads")
+    unpack_parser.add_argument("input")
+    unpack_parser.add_argument("output")
+
+    stats_parser = commands.add_parser("stats",
+      help="count the terms, quads and quads for each predicate")
+    stats_parser.add_argument("input")
+
+    scan_parser = commands.add_parser("scan",
+      help="write the quads with a predicate and/or subject as N-Quads")
+    scan_parser.add_argument("input")
+    scan_parser.add_argument("--predicate",
+      help="a CURIE (eg. bods:fullName) or URI")
+    scan_parser.add_argument("--subject", help="a URI or blank node")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        with open(args.input, encoding="utf-8") as f:
+            n = write_quadfile(args.output, f)
+        print(f"Packed {n} quads.")
+    elif args.command == "unpack":
+        with QuadFile(args.input) as qf, \
+          open(args.output, "w", encoding="utf-8") as out:
+            out.writelines(qf.nquads())
+    elif args.command == "stats":
+        with QuadFile(args.input) as qf:
+            print(f"{len(qf.terms)} terms, {len(qf)} quads")
+            for p, count in qf.predicate_counts().items():
+                print(f"{count:12d} {p}")
+    else:
+        predicate = args.predicate and expand(args.predicate)
+        subject = args.subject and expand(args.subject)
+        with QuadFile(args.input) as qf:
+            sys.stdout.writelines(qf.nquads(predicate, subject))
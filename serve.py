@@ -0,0 +1,326 @@
+"""
+Serve the vocabulary locally, with content negotiation.
+
+The vocabulary is built once at startup, and the whole document is
+serialized up front as Turtle, N-Triples, JSON-LD, RDF/XML and HTML (the
+pyLODE docs), each compressed with gzip (and brotli, if it's installed) and
+given a strong ETag, so requests are dict lookups. Terms can be looked up
+by their path under the namespaces (eg. /terms/Person for bods:Person);
+their descriptions are serialized the first time they're asked for and
+kept.
+
+    python serve.py --port 8000
+    curl -H "Accept: text/turtle" http://localhost:8000/terms/Person
+"""
+import io
+import gzip
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from rdflib import Graph, BNode
+
+from helpers import *
+from bodsld import BODS, CODES, NAMESPACES, bods_vocab
+from export import export_graph
+
+
+MEDIA_TYPES = {
+    "turtle": "text/turtle",
+    "nt": "application/n-triples",
+    "json-ld": "application/ld+json",
+    "xml": "application/rdf+xml",
+    "html": "text/html",
+}
+EXTENSIONS = {
+    ".ttl": "turtle",
+    ".nt": "nt",
+    ".jsonld": "json-ld",
+    ".rdf": "xml",
+    ".html": "html",
+}
+# Formats in order of preference when the Accept header doesn't say
+FORMATS = ["html", "turtle", "json-ld", "nt", "xml"]
+ALIASES = {
+    "application/x-turtle": "turtle",
+    "text/plain": "nt",
+    "application/json": "json-ld",
+    "application/xml": "xml",
+    "application/xhtml+xml": "html",
+}
+TERM_PATHS = {urlsplit(str(ns)).path: str(ns) for ns in [BODS, CODES]}
+
+
+def brotli_compress(body):
+    """
+    body compressed with brotli, or None if brotli isn't installed.
+    """
+    try:
+        import brotli
+    except ImportError:
+        return
+    return brotli.compress(body)
+
+
+class Representation:
+    """
+    One serialization of a document, with its compressed variants and an
+    ETag for each, as {encoding: (body, etag)}.
+    """
+
+    def __init__(self, text, fmt):
+        self.fmt = fmt
+        self.media_type = MEDIA_TYPES[fmt]
+        body = text.encode("utf-8")
+        tag = hashlib.sha1(body).hexdigest()[:20]
+        self.variants = {"identity": (body, f'"{tag}"')}
+        # mtime=0, so the same body always compresses to the same bytes
+        self.variants["gzip"] = (gzip.compress(body, mtime=0), f'"{tag}-gz"')
+        br = brotli_compress(body)
+        if br is not None:
+            self.variants["br"] = (br, f'"{tag}-br"')
+
+
+def parse_header(value):
+    """
+    (token, q) for each item of an Accept or Accept-Encoding header, in
+    the order given.
+    """
+    items = []
+    for item in (value or "").split(","):
+        token, *params = [p.strip() for p in item.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, v = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        items.append((token.lower(), q))
+    return items
+
+
+def negotiate_format(accept, formats=FORMATS):
+    """
+    The best of formats for an Accept header, or None if none of them are
+    acceptable. Each format gets the q of the most specific media range
+    that matches it, so "text/turtle;q=0, */*" rules out Turtle.
+    """
+    if not accept:
+        return formats[0]
+    # {format: (specificity, q, position in the header)}
+    ranked = {}
+    for pos, (media_type, q) in enumerate(parse_header(accept)):
+        if media_type == "*/*":
+            matches, specificity = formats, 0
+        elif media_type in ("text/*", "application/*"):
+            prefix = media_type[:-1]
+            matches = [f for f in formats if MEDIA_TYPES[f].startswith(prefix)]
+            specificity = 1
+        else:
+            fmt = ALIASES.get(media_type) or next((f for f in formats
+              if MEDIA_TYPES[f] == media_type), None)
+            matches, specificity = [fmt] if fmt in formats else [], 2
+        for fmt in matches:
+            if fmt not in ranked or ranked[fmt][0] < specificity:
+                ranked[fmt] = (specificity, q, pos)
+    # Ties go to the type listed first, wildcards to the preferred one
+    acceptable = [(q, -pos, -formats.index(fmt), fmt)
+      for fmt, (_, q, pos) in ranked.items() if q > 0]
+    return max(acceptable)[3] if acceptable else None
+
+
+def negotiate_encoding(accept_encoding, variants):
+    """
+    The encoding to send from variants for an Accept-Encoding header.
+    """
+    accepted = dict(parse_header(accept_encoding))
+    for encoding in ["br", "gzip"]:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in variants and q > 0:
+            return encoding
+    return "identity"
+
+
+def term_index(g):
+    """
+    {term: [triples]} for each URI subject in g, with the triples of any
+    blank nodes they refer to.
+    """
+    index = {}
+    for s, p, o in sorted(g):
+        if not isinstance(s, BNode):
+            index.setdefault(str(s), []).append((s, p, o))
+    for triples in index.values():
+        nodes = [o for _, _, o in triples if isinstance(o, BNode)]
+        seen = set()
+        while nodes:
+            node = nodes.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            for t in g.triples((node, None, None)):
+                triples.append(t)
+                if isinstance(t[2], BNode):
+                    nodes.append(t[2])
+    return index
+
+
+def serialize(triples, fmt):
+    if fmt == "turtle":
+        g = Graph(bind_namespaces="core")
+        for prefix, ns in NAMESPACES.items():
+            g.bind(prefix, ns)
+        g.addN((s, p, o, g) for s, p, o in triples)
+        return g.serialize(format="turtle")
+    f = io.StringIO()
+    g = Graph()
+    g.addN((s, p, o, g) for s, p, o in triples)
+    export_graph(g, {fmt: f}, NAMESPACES)
+    return f.getvalue()
+
+
+class VocabSite:
+    """
+    The representations of a built vocabulary (a BODSVocab after
+    make_graph), and of each of its terms.
+    """
+
+    def __init__(self, vocab, docs=True):
+        self.documents = {"turtle": Representation(vocab.ttl(), "turtle")}
+        for fmt in ["nt", "json-ld", "xml"]:
+            self.documents[fmt] = Representation(serialize(vocab.g, fmt), fmt)
+        if docs:
+            from pylode.profiles.ontpub import OntPub
+            html = OntPub(ontology=vocab.docs_graph()).make_html()
+            self.documents["html"] = Representation(html, "html")
+        self.terms = term_index(vocab.g)
+        self.term_documents = {}
+        self.lock = threading.Lock()
+
+    def document(self, fmt):
+        return self.documents.get(fmt)
+
+    def term(self, uri, fmt):
+        """
+        The representation of one term's description, or None if there
+        isn't a term called uri.
+        """
+        triples = self.terms.get(uri)
+        if triples is None:
+            return
+        key = (uri, fmt)
+        with self.lock:
+            if key not in self.term_documents:
+                self.term_documents[key] = Representation(
+                  serialize(triples, fmt), fmt)
+            return self.term_documents[key]
+
+
+class VocabHandler(BaseHTTPRequestHandler):
+    """
+    Serves a VocabSite (the server's site attribute):
+      /                        the vocabulary
+      /terms, /codelists       the vocabulary
+      /terms/Person            the description of bods:Person
+    Any of these can end with a file extension (.ttl, .nt, .jsonld, .rdf
+    or .html) to ask for a format, instead of using the Accept header. HTML
+    for a term redirects to its place in the docs.
+    """
+    server_version = "bodsld"
+
+    def do_GET(self):
+        self.respond(head=False)
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def respond(self, head):
+        site = self.server.site
+        path = urlsplit(self.path).path.rstrip("/") or "/"
+        fmt = None
+        for ext, f in EXTENSIONS.items():
+            if path.endswith(ext):
+                path, fmt = path[:-len(ext)] or "/", f
+                break
+
+        ns, _, name = path.rpartition("/")
+        uri = TERM_PATHS[ns] + name if ns in TERM_PATHS and name else None
+        if uri is None and path not in ("/", *TERM_PATHS):
+            return self.send_error(404)
+        formats = [f for f in FORMATS if f in site.documents]
+        if fmt is None:
+            fmt = negotiate_format(self.headers.get("Accept"), formats)
+        if fmt not in formats:
+            return self.send_error(406)
+
+        if uri is not None:
+            if uri not in site.terms:
+                return self.send_error(404)
+            if fmt == "html":
+                self.send_response(303)
+                self.send_header("Location", f"/#{name}")
+                self.send_header("Vary", "Accept")
+                self.end_headers()
+                return
+            rep = site.term(uri, fmt)
+        else:
+            rep = site.document(fmt)
+
+        encoding = negotiate_encoding(self.headers.get("Accept-Encoding"),
+          rep.variants)
+        body, etag = rep.variants[encoding]
+        match = [t.strip() for t in
+          self.headers.get("If-None-Match", "").split(",")]
+        if etag in match or "*" in match:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept, Accept-Encoding")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", f"{rep.media_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept, Accept-Encoding")
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+def make_server(site, host="127.0.0.1", port=8000):
+    server = ThreadingHTTPServer((host, port), VocabHandler)
+    server.site = site
+    return server
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+      description="Serve the BODS RDF vocabulary locally.")
+    parser.add_argument("--schema-dir", default="schemas")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--no-docs", action="store_true",
+      help="don't serve the HTML docs (and don't import pyLODE)")
+    args = parser.parse_args()
+
+    schemas, codelists = get_schemas_and_codelists(args.schema_dir)
+    vocab = bods_vocab(schemas, codelists)
+    vocab.make_graph()
+    site = VocabSite(vocab, docs=not args.no_docs)
+
+    server = make_server(site, args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# The modules are at the top of the repo, not in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def vocab():
+    from helpers import get_schemas_and_codelists
+    from bodsld import bods_vocab
+    schemas, codelists = get_schemas_and_codelists(
+      os.path.join(ROOT, "schemas"))
+    vocab = bods_vocab(schemas, codelists)
+    vocab.make_graph()
+    return vocab
+
+
+@pytest.fixture(scope="session")
+def plan(vocab):
+    return vocab.mapping_plan()
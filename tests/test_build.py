@@ -0,0 +1,135 @@
+import os
+import re
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bodsld import (build, build_all, build_spec, BUILD_CACHE,
+  EXTENSIONS)
+
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.dirname(
+  os.path.abspath(__file__))), "schemas")
+
+
+@pytest.fixture
+def spec(tmp_path):
+    schema_dir = str(tmp_path / "schemas")
+    shutil.copytree(SCHEMA_DIR, schema_dir,
+      ignore=shutil.ignore_patterns(".bodsld-cache"))
+    return {"schema_dir": schema_dir, "output_dir": str(tmp_path / "out")}
+
+
+def output(spec, ext):
+    return os.path.join(spec["output_dir"], f"bods-vocabulary-0.4.0{ext}")
+
+
+def read(spec, ext):
+    with open(output(spec, ext), encoding="utf-8") as f:
+        return f.read()
+
+
+def describe_founding_date(spec, description):
+    fn = os.path.join(spec["schema_dir"], "entity-record.json")
+    with open(fn) as f:
+        schema = json.load(f)
+    schema["properties"]["foundingDate"]["description"] = description
+    with open(fn, "w") as f:
+        json.dump(schema, f, indent=2)
+
+
+def test_full_build_after_ttl_only(spec):
+    build(spec)
+    describe_founding_date(spec, "When the entity was founded, changed.")
+    build({**spec, "ttl_only": True})
+    assert "founded, changed" in read(spec, ".ttl")
+    assert "founded, changed" not in read(spec, ".nt")
+
+    build(spec)
+    for ext in [*EXTENSIONS.values(), ".html"]:
+        assert "founded, changed" in read(spec, ext), ext
+
+
+def test_docs_rebuilt_after_failing(spec, monkeypatch):
+    build(spec)
+    describe_founding_date(spec, "When the entity was founded, changed.")
+
+    def fail(self, filename):
+        raise RuntimeError("pyLODE fell over")
+
+    monkeypatch.setattr("bodsld.BODSVocab.write_docs", fail)
+    with pytest.raises(RuntimeError):
+        build(spec)
+    assert "founded, changed" in read(spec, ".nt")
+    assert "founded, changed" not in read(spec, ".html")
+    monkeypatch.undo()
+
+    build(spec)
+    assert "founded, changed" in read(spec, ".html")
+
+
+def test_incremental_build_same_as_clean(spec, tmp_path):
+    build({**spec, "ttl_only": True})
+
+    # Change a schema fragment, a codelist and a $ref'd definition
+    describe_founding_date(spec, "When the entity was founded, changed.")
+    fn = os.path.join(spec["schema_dir"], "codelists", "entityType.csv")
+    with open(fn, encoding="utf-8") as f:
+        text = f.read()
+    with open(fn, "w", encoding="utf-8") as f:
+        f.write(text.replace("Legal entity,", "Legal body,"))
+    fn = os.path.join(spec["schema_dir"], "components.json")
+    with open(fn) as f:
+        schema = json.load(f)
+    schema["$defs"]["Address"]["description"] = "Where, changed."
+    with open(fn, "w") as f:
+        json.dump(schema, f, indent=2)
+
+    build({**spec, "ttl_only": True})
+    clean = {**spec, "output_dir": str(tmp_path / "clean"),
+      "cache": str(tmp_path / "clean-cache"), "ttl_only": True}
+    build(clean)
+    incremental = read(spec, ".ttl")
+    for changed in ["founded, changed", "Legal body", "Where, changed"]:
+        assert changed in incremental
+    assert incremental == read(clean, ".ttl")
+    name = "bods-mapping-0.4.0.json"
+    with open(os.path.join(spec["output_dir"], name)) as f, \
+      open(os.path.join(clean["output_dir"], name)) as g:
+        assert f.read() == g.read()
+
+
+def test_build_spec():
+    assert build_spec({})["schema_dir"] == "schemas"
+    assert build_spec({})["cache"] == os.path.join("schemas", BUILD_CACHE)
+    spec = build_spec({"ref": "refs/tags/0.3.0"})
+    assert spec["schema_dir"] == os.path.join("schemas", "refs-tags-0.3.0")
+    assert spec["cache"] == os.path.join(spec["schema_dir"], BUILD_CACHE)
+    assert build_spec({"ref": "0.3.0", "schema_dir": "s"})["schema_dir"] \
+      == "s"
+
+
+def test_build_all_separates_caches(monkeypatch):
+    monkeypatch.setattr("bodsld.ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr("bodsld.build", lambda spec: spec["cache"])
+    caches = build_all([{"language": "en"}, {"language": "es"},
+      {"name": "other", "schema_dir": "other"}])
+    shared = os.path.join("schemas", BUILD_CACHE)
+    assert caches == {
+        "en-0.4.0": f"{shared}-en-0.4.0",
+        "es-0.4.0": f"{shared}-es-0.4.0",
+        "other": os.path.join("other", BUILD_CACHE),
+    }
+
+
+def test_docs_anchors(vocab, tmp_path):
+    # pyLODE names a term's anchor after one of its labels, depending on
+    # the order the triples are in. These are the published docs' anchors
+    fn = str(tmp_path / "docs.html")
+    vocab.write_docs(fn)
+    with open(fn, encoding="utf-8") as f:
+        anchors = set(re.findall(r'id="([^"]*)"', f.read()))
+    assert {"EntityName", "ID", "Name", "Identifier"} <= anchors
+    assert not {"name", "idString"} & anchors
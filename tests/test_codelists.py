@@ -0,0 +1,58 @@
+import json
+import os
+
+import pytest
+from jsonschema import ValidationError
+
+from conftest import ROOT
+from helpers import (CodelistStore, CodeInfo, codelist_store,
+  get_codes_and_info, get_codes, get_schemas_and_codelists)
+
+CSV = """code,title,description
+new,New Record,"The first Statement, for the record."
+closed,Closed Record,Closes the record.
+"""
+
+
+@pytest.fixture(scope="module")
+def codelist_schema():
+    with open(os.path.join(ROOT, "schemas", "codelist-schema.json")) as f:
+        return json.load(f)
+
+
+def test_parse():
+    store = CodelistStore({"recordStatus.csv": CSV})
+    assert "recordStatus.csv" in store
+    assert "other.csv" not in store
+    assert store.codes("recordStatus.csv") == ["new", "closed"]
+    assert store.info("recordStatus.csv")["new"] == CodeInfo("New Record",
+      "The first Statement, for the record.")
+    assert codelist_store(store) is store
+
+
+def test_reads():
+    store = CodelistStore({"a.csv": CSV, "b.csv": CSV})
+    store.reads = set()
+    store.info("a.csv")
+    store.codes("b.csv")
+    assert store.reads == {"a.csv"}
+
+
+def test_same_as_without_store():
+    _, codelists = get_schemas_and_codelists(os.path.join(ROOT, "schemas"))
+    store = CodelistStore(codelists)
+    for fn in codelists:
+        assert get_codes_and_info(codelists, fn) == store.info(fn)
+        assert get_codes(store, fn) == [*store.info(fn)]
+
+
+def test_validate(codelist_schema):
+    _, codelists = get_schemas_and_codelists(os.path.join(ROOT, "schemas"))
+    CodelistStore(codelists, schema=codelist_schema)
+
+    bad = CSV + " padded,Padded,Codes can't start with a space.\n"
+    with pytest.raises(ValidationError):
+        CodelistStore({"recordStatus.csv": bad}, schema=codelist_schema)
+    with pytest.raises(ValidationError):
+        CodelistStore({"recordStatus.csv": "code,title\nnew,New\n"},
+          schema=codelist_schema)
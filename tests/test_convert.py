@@ -0,0 +1,193 @@
+import json
+import re
+import zipfile
+
+import pytest
+
+from convert import Converter, open_input, read_input
+
+
+def statement(publisher, statement_id="s1"):
+    return {
+        "statementId": statement_id,
+        "recordId": "r1",
+        "recordType": "person",
+        "recordDetails": {"personType": "knownPerson"},
+        "publicationDetails": {"publicationDate": "2020-03-04",
+          "bodsVersion": "0.4", "publisher": publisher},
+    }
+
+
+@pytest.fixture
+def converter(plan):
+    return Converter(plan)
+
+
+def publisher_node(converter, publisher, statement_id="s1"):
+    return next(str(q[2]) for q in
+      converter.statement(statement(publisher, statement_id))
+      if str(q[1]).endswith("#publisher"))
+
+
+def test_shared_nodes_from_mapped_content(converter):
+    by_url = publisher_node(converter, {"name": "A", "url": "https://a.org"})
+    by_uri = publisher_node(converter, {"uri": "https://a.org", "name": "A"})
+    assert by_url == by_uri
+    assert "/.well-known/genid/" in by_url
+    # Keys the plan doesn't map don't make a different node
+    assert publisher_node(converter, {"name": "A", "url": "https://a.org",
+      "unmapped": 1}) == by_url
+    assert publisher_node(converter, {"name": "B", "url": "https://a.org"}) \
+      != by_url
+
+
+def test_shared_nodes_written_once(converter):
+    first = converter.statement(statement({"name": "A", "url": "https://a"}))
+    second = converter.statement(statement({"name": "A", "uri": "https://a"},
+      "s2"))
+    assert [q for q in first if q[3] is None]
+    assert not [q for q in second if q[3] is None]
+
+
+def test_zip_input(tmp_path):
+    filename = str(tmp_path / "statements.zip")
+    with zipfile.ZipFile(filename, "w") as archive:
+        archive.writestr("data/", "")
+        archive.writestr("data/statements.jsonl",
+          json.dumps(statement({"name": "A"})) + "\n")
+    assert [s["statementId"] for s in read_input(filename)] == ["s1"]
+
+
+def test_empty_zip_input(tmp_path):
+    filename = str(tmp_path / "empty.zip")
+    with zipfile.ZipFile(filename, "w") as archive:
+        archive.writestr("data/", "")
+    with pytest.raises(ValueError, match="empty.zip"):
+        open_input(filename)
+    with pytest.raises(ValueError, match="empty.zip"):
+        list(read_input(filename))
+
+
+def test_uris_from_data(converter):
+    from rdflib import Dataset
+    url = 'https://a.org/a b<c>"d{e}|f^g`h\\i'
+    quads = converter.statement(statement({"name": "A", "url": url}))
+    quads += converter.statement(statement({"name": "B", "url": "www.b.org"},
+      "s2"))
+    text = "".join(map(converter.nquad, quads))
+    assert "<https://a.org/a%20b%3Cc%3E%22d%7Be%7D%7Cf%5Eg%60h%5Ci>" in text
+    assert '"www.b.org"^^<http://www.w3.org/2001/XMLSchema#anyURI>' in text
+    dataset = Dataset()
+    dataset.parse(data=text, format="nquads")
+    assert len(list(dataset.quads())) == len(set(quads))
+
+
+def test_term_cache():
+    from rdflib import BNode, Literal, URIRef
+    from convert import TermCache
+    from export import nt_term
+    terms = TermCache(size=2)
+    pred = terms.intern("https://vocab.openownership.org/terms#fullName")
+    assert terms.intern(str(pred)) is pred
+    assert terms.literal("a\tb") is terms.literal("a\tb")
+    assert terms.uri("https://a.org") == URIRef("https://a.org")
+
+    quads = [
+      (URIRef("https://a.org/s"), pred, Literal('a "b"\n', lang="en"),
+        URIRef("https://a.org/g")),
+      (BNode("b1"), pred, Literal("1", datatype=URIRef(
+        "http://www.w3.org/2001/XMLSchema#integer")), None),
+    ]
+    assert [terms.nquad(q) for q in quads] == [
+      " ".join(nt_term(t) for t in q if t is not None) + " .\n"
+      for q in quads]
+
+    # The LRU caches only keep size entries, so b has gone when it's
+    # looked up again
+    terms = TermCache(size=2)
+    for value in ["a", "b", "a", "c", "b"]:
+        terms.literal(value)
+    assert terms.report()["literal"] == {"hits": 1, "misses": 4,
+      "hit_rate": 0.2}
+
+
+def delta_statement(statement_id, record_id, date, status):
+    s = statement({"name": "A"}, statement_id)
+    s.update(recordId=record_id, statementDate=date, recordStatus=status)
+    return s
+
+
+def test_statement_index(tmp_path, converter):
+    from convert import StatementIndex, convert_delta
+    infile = tmp_path / "day1.jsonl"
+    outfile = str(tmp_path / "out.nq")
+    index = StatementIndex(str(tmp_path / "index.sqlite"))
+
+    day1 = [delta_statement("s1", "r1", "2024-01-01", "new"),
+      delta_statement("s2", "r2", "2024-01-01", "new"),
+      delta_statement("s3", "r1", "2024-01-02", "updated")]
+    infile.write_text("".join(json.dumps(s) + "\n" for s in day1))
+    counts = convert_delta(converter, str(infile), outfile, index)
+    assert counts["converted"] == 3
+    assert counts["new records"] == 2
+    assert counts["updated records"] == 1
+    assert index.latest("r1") == ("s3", "2024-01-02", "updated")
+
+    day2 = day1 + [delta_statement("s4", "r2", "2024-01-03", "closed"),
+      delta_statement("s5", "r1", "2023-12-01", "updated")]
+    infile.write_text("".join(json.dumps(s) + "\n" for s in day2))
+    counts = convert_delta(converter, str(infile), outfile, index)
+    assert counts["skipped"] == 3
+    assert counts["converted"] == 2
+    assert counts["updated records"] == 1
+    assert counts["out of date"] == 1
+    assert index.latest("r2") == ("s4", "2024-01-03", "closed")
+    # An earlier statement that turns up late doesn't replace the latest
+    assert index.latest("r1") == ("s3", "2024-01-02", "updated")
+    assert index.latest("r3") is None
+
+    infile.write_text(json.dumps(
+      delta_statement("s6", "r2", "2024-01-04", "updated")) + "\n")
+    counts = convert_delta(converter, str(infile), outfile, index)
+    assert counts["closed records updated"] == 1
+    index.close()
+
+    from rdflib import Dataset
+    dataset = Dataset()
+    dataset.parse(outfile, format="nquads")
+    graphs = {str(q[3]) for q in dataset.quads()}
+    assert len([g for g in graphs if "/statements/" in g]) == 6
+
+
+def test_latest(tmp_path, converter):
+    from convert import convert_latest
+    statements = [
+      delta_statement("s1", "r1", "2024-01-01", "new"),
+      delta_statement("s2", "r2", "2024-01-01", "new"),
+      delta_statement("s3", "r1", "2024-01-03", "updated"),
+      delta_statement("s4", "r2", "2024-01-02", "closed"),
+      # Out of order, so s3 is still the latest for r1
+      delta_statement("s5", "r1", "2024-01-02", "updated"),
+      # The same statementDate, so the later publicationDate wins (s7),
+      # then the later in the input (s10)
+      delta_statement("s6", "r3", "2024-01-01", "new"),
+      delta_statement("s7", "r3", "2024-01-01", "updated"),
+      delta_statement("s8", "r3", "2024-01-01", "updated"),
+      delta_statement("s9", "r4", "2024-01-01", "new"),
+      delta_statement("s10", "r4", "2024-01-01", "updated"),
+    ]
+    statements[6]["publicationDetails"]["publicationDate"] = "2024-02-01"
+    infile = tmp_path / "statements.jsonl"
+    infile.write_text("".join(json.dumps(s) + "\n" for s in statements))
+    outfile = str(tmp_path / "current.nt")
+
+    # Small runs, so the merge is tested
+    counts = convert_latest(converter, str(infile), outfile, str(tmp_path),
+      run_size=3)
+    assert counts == {"records": 3, "closed": 1}
+    with open(outfile, encoding="utf-8") as f:
+        text = f.read()
+    written = set(re.findall(r"<[^>]*/statements/(\w+)>", text))
+    assert written == {"s3", "s7", "s10"}
+    # N-Triples, with no graphs
+    assert all(line.count(" <") < 4 for line in text.splitlines())
@@ -0,0 +1,31 @@
+import io
+
+from rdflib import Graph, Literal, BNode, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import XSD
+
+from export import export_graph, nt_term
+
+
+EX = "https://example.org/"
+
+
+def test_nt_term():
+    assert nt_term(Literal("1.5", datatype=XSD.float)) == \
+      f'"1.5"^^<{XSD.float}>'
+    assert nt_term(Literal("a", lang="en")) == '"a"@en'
+    assert nt_term(Literal('a "b"\n')) == '"a \\"b\\"\\n"'
+
+
+def test_nt_round_trip():
+    g = Graph()
+    node = BNode()
+    s = URIRef(f"{EX}a")
+    g.add((s, URIRef(f"{EX}date"), Literal("2020-03-04", datatype=XSD.date)))
+    g.add((s, URIRef(f"{EX}share"), Literal("25.5", datatype=XSD.float)))
+    g.add((s, URIRef(f"{EX}name"), Literal("Tab\there \"q\" \\", lang="en")))
+    g.add((s, URIRef(f"{EX}address"), node))
+    g.add((node, URIRef(f"{EX}postCode"), Literal("N1 1AA")))
+    f = io.StringIO()
+    export_graph(g, {"nt": f}, {"ex": EX})
+    assert isomorphic(Graph().parse(data=f.getvalue(), format="nt"), g)
@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from helpers import (SCHEMA_FILES, CODELIST_FILES, MANIFEST_FILE,
+  get_schemas_and_codelists, fetch_texts, remote_schema_dir)
+
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.dirname(
+  os.path.abspath(__file__))), "schemas")
+PATHS = SCHEMA_FILES + [f"codelists/{fn}" for fn in CODELIST_FILES]
+
+
+class SchemaHandler(BaseHTTPRequestHandler):
+    """
+    Serves the server's files ({path: bytes}) under /<ref>/schema/, with
+    ETags, and logs (path, status) for each request.
+    """
+
+    def do_GET(self):
+        path = self.path.split("/schema/", 1)[-1]
+        body = self.server.files.get(path)
+        if body is None:
+            status = 404
+        else:
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            status = 304 if self.headers.get("If-None-Match") == etag else 200
+        self.server.requests.append((path, status))
+        self.send_response(status)
+        if body is not None:
+            self.send_header("ETag", etag)
+        if status == 200:
+            self.send_header("Content-Length", str(len(body)))
+        else:
+            self.send_header("Content-Length", "0")
+        self.end_headers()
+        if status == 200:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SchemaHandler)
+    server.files = {}
+    for path in PATHS:
+        with open(os.path.join(SCHEMA_DIR, path), "rb") as f:
+            server.files[path] = f.read()
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_address[1]
+    server.remote = f"http://127.0.0.1:{port}/{{ref}}/schema/"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def read_manifest(schema_dir):
+    with open(os.path.join(schema_dir, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def test_fetch_and_revalidate(server, tmp_path):
+    schema_dir = str(tmp_path / "schemas")
+    schemas, codelists = get_schemas_and_codelists(schema_dir,
+      remote=server.remote)
+    assert sorted(schemas) == sorted(SCHEMA_FILES)
+    assert sorted(codelists) == sorted(CODELIST_FILES)
+    assert sorted(server.requests) == sorted((p, 200) for p in PATHS)
+    manifest = read_manifest(schema_dir)
+    assert sorted(manifest) == sorted(PATHS)
+    assert all(entry["etag"] for entry in manifest.values())
+
+    # Files on disc are used without asking the server
+    server.requests.clear()
+    get_schemas_and_codelists(schema_dir, remote=server.remote)
+    assert server.requests == []
+
+    # Revalidating unchanged files gets 304s and leaves the manifest alone
+    get_schemas_and_codelists(schema_dir, overwrite=True,
+      remote=server.remote)
+    assert sorted(server.requests) == sorted((p, 304) for p in PATHS)
+    assert read_manifest(schema_dir) == manifest
+
+    # A changed file is fetched again, and its new ETag recorded
+    server.requests.clear()
+    changed = "codelists/addressType.csv"
+    server.files[changed] += b'extra,Extra,"An extra code"\n'
+    schemas, codelists = get_schemas_and_codelists(schema_dir,
+      overwrite=True, remote=server.remote)
+    assert dict(server.requests)[changed] == 200
+    assert [p for p, status in server.requests if status == 200] == [changed]
+    assert codelists["addressType.csv"].endswith('"An extra code"\n')
+    with open(os.path.join(schema_dir, changed), "rb") as f:
+        assert f.read() == server.files[changed]
+    updated = read_manifest(schema_dir)
+    assert updated[changed]["etag"] != manifest[changed]["etag"]
+    assert {p: e for p, e in updated.items() if p != changed} == \
+      {p: e for p, e in manifest.items() if p != changed}
+
+
+def test_fetch_texts(server):
+    texts = fetch_texts(remote_schema_dir("main", server.remote), PATHS)
+    assert {p: t.encode("utf-8") for p, t in texts.items()} == server.files
+    assert sorted(server.requests) == sorted((p, 200) for p in PATHS)
+
+
+def test_other_ref_fetched_again(server, tmp_path):
+    schema_dir = str(tmp_path / "schemas")
+    get_schemas_and_codelists(schema_dir, ref="v0.3", remote=server.remote)
+    server.requests.clear()
+    get_schemas_and_codelists(schema_dir, ref="v0.4", remote=server.remote)
+    assert sorted(server.requests) == sorted((p, 200) for p in PATHS)
+    assert all("/v0.4/" in entry["url"]
+      for entry in read_manifest(schema_dir).values())
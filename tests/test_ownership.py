@@ -0,0 +1,75 @@
+import pytest
+
+from ownership import OwnershipIndex
+
+
+def test_ownership_chain():
+    index = OwnershipIndex([("a", "b", 50), ("b", "c", 40), ("a", "d", 50)],
+      {"a": "Entity", "b": "Entity", "c": "Person", "d": "Person"})
+    result = index.ownership("a")
+    shares = {o["owner"]: o["share"] for o in result["owners"]}
+    assert shares == {"b": 50, "c": 20, "d": 50}
+    assert sorted(result["ultimate_owners"]) == ["c", "d"]
+    assert result["cycles"] == []
+
+
+def test_cycle():
+    index = OwnershipIndex([("a", "b", 100), ("b", "a", 100)], {})
+    assert index.ownership("a")["cycles"] == [["a", "b"]]
+
+
+def test_unknown_entity():
+    index = OwnershipIndex([("a", "b", 50)], {})
+    with pytest.raises(ValueError, match="nobody"):
+        index.ownership("nobody")
+
+
+def simple_path_shares(edges, start):
+    # Every simple path up from start, the slow way
+    shares = {}
+
+    def walk(node, share, path):
+        for owned, owner, s in edges:
+            if owned == node and owner not in path:
+                shares[owner] = shares.get(owner, 0) + share * s / 100
+                walk(owner, share * s / 100, path + [owner])
+
+    walk(start, 1, [start])
+    return shares
+
+
+def test_dense_cycles():
+    names = "abcde"
+    edges = [(x, y, 10 + 5 * i + j) for i, x in enumerate(names)
+      for j, y in enumerate(names) if x != y]
+    edges += [("z", "a", 60), ("e", "p", 50)]
+    index = OwnershipIndex(edges, {})
+    for name in ["z", *names]:
+        result = index.ownership(name)
+        shares = {o["owner"]: o["share"] for o in result["owners"]}
+        expected = simple_path_shares(edges, name)
+        assert shares.keys() == expected.keys()
+        for owner, share in expected.items():
+            assert shares[owner] == pytest.approx(share * 100)
+        assert result["ultimate_owners"] == ["p"]
+    # Every simple cycle through the five, counted once
+    assert len(index.ownership("z")["cycles"]) == 10 + 20 + 30 + 24
+
+
+def test_chains_above_a_cycle_walked_once():
+    # Each level is owned by both records of the level above, so there are
+    # 2 ** 40 paths from the bottom to the cycle at the top
+    levels = 40
+    edges = [(f"{x}{i}", f"{y}{i + 1}", 50) for i in range(levels)
+      for x in "ab" for y in "ab"]
+    edges += [(f"a{levels}", "top", 50), ("top", f"a{levels}", 50)]
+    result = OwnershipIndex(edges, {}).ownership("a0")
+    assert len(result["owners"]) == 2 * levels + 1
+    assert result["cycles"] == [[f"a{levels}", "top"]]
+
+
+def test_long_chain():
+    edges = [(str(i), str(i + 1), 100) for i in range(2000)]
+    result = OwnershipIndex(edges, {}).ownership("0")
+    assert len(result["owners"]) == 2000
+    assert result["ultimate_owners"] == ["2000"]
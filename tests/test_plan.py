@@ -0,0 +1,33 @@
+import json
+import os
+
+from conftest import ROOT
+from convert import load_plan
+
+# Written with BODSVocab.write_plan. If a change to the mapping is meant to
+# change the plan, write it again and check the diff.
+SNAPSHOT = os.path.join(ROOT, "tests", "data", "bods-mapping-0.4.0.json")
+BODS = "https://vocab.openownership.org/terms#"
+
+
+def test_plan_snapshot(plan):
+    assert json.loads(json.dumps(plan)) == load_plan(SNAPSHOT)
+
+
+def test_plan_rules(plan):
+    shapes = plan["shapes"]
+    assert plan["records"] == {"entity": "Entity", "person": "Person",
+      "relationship": "Relationship"}
+    statement = shapes["Statement"]["fields"]
+    assert statement["statementId"] == ["literal", f"{BODS}statementIdString",
+      None]
+    assert statement["publicationDetails"] == ["flatten",
+      "Statement.publicationDetails"]
+    assert statement["recordStatus"][0] == "type"
+    assert shapes["Entity"]["class"] == f"{BODS}Entity"
+    assert "identifiers" in shapes["Entity"]["arrays"]
+    # An entity's name is a string, which becomes a Name's fullName
+    assert shapes["Entity"]["fields"]["name"] == ["wrap", f"{BODS}name",
+      "Name", "fullName"]
+    assert shapes["Person"]["fields"]["names"][:3] == ["node",
+      f"{BODS}name", "Name"]
@@ -0,0 +1,84 @@
+import pytest
+
+from quadfile import QuadFile, write_quadfile, expand
+
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+BODS = "https://vocab.openownership.org/terms#"
+
+LINES = [
+    f'<https://example.org/records/a> <{BODS}fullName> "Tab\\there \\"q\\" \\\\ \\u00E9\\U0001F600" <https://example.org/statements/1> .\n',
+    f'<https://example.org/records/a> <{BODS}fullName> "Raw\ttab é" <https://example.org/statements/1> .\n',
+    f'<https://example.org/records/a> <{BODS}foundingDate> "2019-09-03"^^<{XSD}date> <https://example.org/statements/1> .\n',
+    f'<https://example.org/records/a> <{BODS}name> "Profitech"@en-GB <https://example.org/statements/1> .\n',
+    f'<https://example.org/records/a> <{BODS}address> _:b0 <https://example.org/statements/1> .\n',
+    f'_:b0 <{BODS}postCode> "N1 1AA" <https://example.org/statements/1> .\n',
+    f'<https://example.org/records/b> <{BODS}fullName> "Someone" <https://example.org/statements/2> .\n',
+    f'<https://example.org/records/b> <{BODS}fullName> "Someone" .\n',
+    f'<https://example.org/.well-known/genid/x> <{BODS}shareExact> "25.5"^^<{XSD}float> .\n',
+    "\n",
+    "# a comment\n",
+]
+
+
+@pytest.fixture
+def packed(tmp_path):
+    filename = str(tmp_path / "quads.bq")
+    assert write_quadfile(filename, LINES) == 9
+    with QuadFile(filename) as qf:
+        yield qf
+
+
+def test_round_trip(packed):
+    quads = [l for l in LINES if l.strip() and not l.startswith("#")]
+    assert sorted(packed.nquads()) == sorted(quads)
+    assert len(packed) == len(quads)
+
+
+def test_default_and_named_graphs(packed):
+    graphs = {packed.term(g) for _, _, _, g in packed.scan()}
+    assert graphs == {"", "<https://example.org/statements/1>",
+      "<https://example.org/statements/2>"}
+    assert '<https://example.org/records/b> <https://vocab.openownership' \
+      '.org/terms#fullName> "Someone" .\n' in packed.nquads()
+
+
+def test_scan_by_predicate(packed):
+    lines = list(packed.nquads(predicate=f"<{BODS}fullName>"))
+    assert sorted(lines) == sorted(l for l in LINES if "#fullName>" in l)
+    p = packed.id(f"<{BODS}fullName>")
+    assert {quad[1] for quad in packed.scan(predicate=f"<{BODS}fullName>")} \
+      == {p}
+    assert list(packed.nquads(predicate=f"<{BODS}missing>")) == []
+
+
+def test_scan_by_subject(packed):
+    subject = "<https://example.org/records/a>"
+    lines = list(packed.nquads(subject=subject))
+    assert sorted(lines) == sorted(l for l in LINES if l.startswith(subject))
+    assert list(packed.nquads(subject="_:b0")) == [LINES[5]]
+    both = list(packed.nquads(predicate=f"<{BODS}fullName>",
+      subject="<https://example.org/records/b>"))
+    assert sorted(both) == sorted(LINES[6:8])
+    assert list(packed.nquads(subject="<https://example.org/nobody>")) == []
+
+
+def test_bad_line(tmp_path):
+    with pytest.raises(ValueError):
+        write_quadfile(str(tmp_path / "bad.bq"), ["not a quad\n"])
+
+
+def test_expand():
+    assert expand("bods:fullName") == f"<{BODS}fullName>"
+    assert expand("_:b0") == "_:b0"
+    assert expand("https://example.org/a") == "<https://example.org/a>"
+
+
+def test_imports_without_rdflib():
+    import subprocess
+    import sys
+    from conftest import ROOT
+    code = "import sys, quadfile; print('rdflib' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+      capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
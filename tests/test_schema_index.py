@@ -0,0 +1,59 @@
+import os
+
+from referencing import exceptions
+
+from conftest import ROOT
+from helpers import (SchemaIndex, get_schemas_and_codelists, schema_registry,
+  get_properties, get_type)
+
+
+def registry_lookup(registry, urn, pointer):
+    # How helpers.find_a_bit looked pointers up before the index
+    schema = registry.get_or_retrieve(urn)
+    try:
+        return schema.value.pointer(pointer, registry.resolver()).contents
+    except exceptions.PointerToNowhere:
+        return
+
+
+def test_lookups_match_registry():
+    schemas, _ = get_schemas_and_codelists(os.path.join(ROOT, "schemas"))
+    index = SchemaIndex(schemas)
+    registry = schema_registry(schemas)
+    urns = [schema.get("$id") for schema in schemas.values()]
+
+    pointers = [p for p in index.nodes if p.startswith("/")]
+    assert len(pointers) > 500
+    for pointer in pointers:
+        found = [registry_lookup(registry, urn, pointer) for urn in urns]
+        found = [node for node in found if node is not None]
+        assert found, pointer
+        # A pointer in more than one schema gets the last one's node
+        assert index.get(pointer) == found[-1], pointer
+
+    for urn in urns:
+        assert index.get(urn) == registry.get_or_retrieve(urn).value.contents
+    assert index.get("/$defs/Nothing") is None
+
+
+def test_property_and_type_lookups():
+    schemas, _ = get_schemas_and_codelists(os.path.join(ROOT, "schemas"))
+    index = SchemaIndex(schemas)
+    assert "statementId" in get_properties(index, "/$defs/Statement")
+    assert get_type(index, "/$defs/Statement/properties/statementId") == \
+      "string"
+    assert get_properties(index, "/$defs/Nothing") is None
+
+
+def test_refs_resolved():
+    index = SchemaIndex({
+      "a.json": {"$id": "urn:a", "$defs": {
+        "X": {"type": "string"},
+        "Y": {"$ref": "#/$defs/X"},
+        "Z": {"$ref": "urn:b#/$defs/W"},
+      }},
+      "b.json": {"$id": "urn:b", "$defs": {"W": {"type": "number"}}},
+    })
+    assert index.get("/$defs/Y") == {"$ref": "#/$defs/X"}
+    assert index.refs["/$defs/Y"] == {"type": "string"}
+    assert index.refs["/$defs/Z"] == {"type": "number"}
@@ -0,0 +1,110 @@
+import gzip
+import threading
+from http.client import HTTPConnection
+
+import pytest
+
+from serve import negotiate_format, negotiate_encoding, VocabSite, make_server
+
+
+@pytest.mark.parametrize("accept, fmt", [
+    (None, "html"),
+    ("text/turtle", "turtle"),
+    ("application/ld+json, text/turtle", "json-ld"),
+    ("text/turtle;q=0.5, application/ld+json", "json-ld"),
+    ("*/*", "html"),
+    ("application/*", "json-ld"),
+    ("text/plain", "nt"),
+    ("image/png", None),
+    # An explicit q=0 rules a type out, whatever the wildcards say
+    ("text/turtle;q=0, */*", "html"),
+    ("text/html;q=0, */*", "turtle"),
+    ("text/html;q=0, text/turtle;q=0, text/*", None),
+    ("*/*;q=0.1, text/html;q=0, text/turtle;q=0.5", "turtle"),
+    ("text/*;q=0, text/turtle", "turtle"),
+])
+def test_negotiate_format(accept, fmt):
+    assert negotiate_format(accept) == fmt
+
+
+def test_negotiate_format_of_formats():
+    formats = ["turtle", "nt"]
+    assert negotiate_format(None, formats) == "turtle"
+    assert negotiate_format("text/html", formats) is None
+    assert negotiate_format("text/turtle;q=0, */*", formats) == "nt"
+
+
+def test_negotiate_encoding():
+    variants = {"identity": None, "gzip": None}
+    assert negotiate_encoding(None, variants) == "identity"
+    assert negotiate_encoding("gzip, br", variants) == "gzip"
+    assert negotiate_encoding("gzip;q=0, *", variants) == "identity"
+    assert negotiate_encoding("br", {**variants, "br": None}) == "br"
+
+
+@pytest.fixture(scope="module")
+def server(vocab):
+    server = make_server(VocabSite(vocab, docs=False), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, **headers):
+    conn = HTTPConnection(*server.server_address)
+    conn.request("GET", path, headers={k.replace("_", "-"): v
+      for k, v in headers.items()})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response, body
+
+
+def test_document(server, vocab):
+    response, body = get(server, "/", Accept="text/turtle")
+    assert response.status == 200
+    assert response.getheader("Content-Type") == \
+      "text/turtle; charset=utf-8"
+    assert body.decode("utf-8") == vocab.ttl()
+    etag = response.getheader("ETag")
+
+    response, body = get(server, "/", Accept="text/turtle",
+      If_None_Match=etag)
+    assert (response.status, body) == (304, b"")
+    assert response.getheader("ETag") == etag
+    # A different representation has a different ETag
+    response, _ = get(server, "/terms.nt", If_None_Match=etag)
+    assert response.status == 200
+    assert response.getheader("ETag") != etag
+
+
+def test_gzip(server, vocab):
+    response, body = get(server, "/", Accept="text/turtle",
+      Accept_Encoding="gzip")
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert gzip.decompress(body).decode("utf-8") == vocab.ttl()
+    etag = response.getheader("ETag")
+    response, _ = get(server, "/", Accept="text/turtle",
+      Accept_Encoding="gzip", If_None_Match=etag)
+    assert response.status == 304
+
+
+def test_term(server):
+    response, body = get(server, "/terms/Person",
+      Accept="application/n-triples")
+    assert response.status == 200
+    assert b"<https://vocab.openownership.org/terms#Person> " in body
+    response, _ = get(server, "/terms/Nobody.ttl")
+    assert response.status == 404
+
+
+def test_not_acceptable(server):
+    # No HTML without the docs
+    response, _ = get(server, "/", Accept="text/html")
+    assert response.status == 406
+    response, _ = get(server, "/terms/Person", Accept="image/png")
+    assert response.status == 406
+    response, _ = get(server, "/", Accept="text/turtle;q=0, text/*")
+    assert response.status == 406
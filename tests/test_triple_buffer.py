@@ -0,0 +1,55 @@
+from rdflib import Graph, Literal, Namespace, RDFS
+
+from helpers import TripleBuffer
+
+EX = Namespace("https://example.org/")
+
+
+def test_last_op_wins():
+    buf = TripleBuffer()
+    a = (EX.a, RDFS.label, Literal("A"))
+    b = (EX.b, RDFS.label, Literal("B"))
+    buf.add(a)
+    buf.add(a)
+    buf.addN([(*b, None)])
+    assert len(buf) == 2
+    buf.remove(a)
+    assert a not in buf
+    assert buf.removed() == [a]
+    buf.update([a], [b])
+    assert [*buf] == [a]
+    assert buf.removed() == [b]
+
+
+def test_flush_same_as_graph():
+    a = (EX.a, RDFS.label, Literal("A"))
+    b = (EX.b, RDFS.label, Literal("B"))
+    c = (EX.c, RDFS.range, EX.C)
+    ops = [("add", a), ("add", b), ("remove", a), ("add", c), ("add", c),
+      ("remove", (EX.old, RDFS.label, Literal("Old"))), ("add", a),
+      ("remove", b)]
+
+    g = Graph()
+    g.add((EX.old, RDFS.label, Literal("Old")))
+    g.add(b)
+    expected = Graph()
+    for triple in g:
+        expected.add(triple)
+    buf = TripleBuffer()
+    for op, triple in ops:
+        getattr(expected, op)(triple)
+        getattr(buf, op)(triple)
+    buf.flush(g)
+    assert set(g) == set(expected) == {a, c}
+    assert len(buf) == 0
+
+
+def test_conflicts():
+    buf = TripleBuffer()
+    buf.add((EX.a, RDFS.label, Literal("A")))
+    buf.add((EX.a, RDFS.label, Literal("Other A")))
+    buf.add((EX.a, RDFS.seeAlso, EX.b))
+    buf.add((EX.a, RDFS.seeAlso, EX.c))
+    buf.add((EX.b, RDFS.label, Literal("B")))
+    assert buf.conflicts() == {
+      (EX.a, RDFS.label): [Literal("A"), Literal("Other A")]}
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from convert import Converter, convert_file
+from unconvert import unconvert_file
+
+
+AWKWARD = "Tab\there \u0007bell \\back 'q' \"dq\"\r\nline é \U0001F600"
+
+STATEMENT = {
+    "statementId": "b9a5a2c6-5e1d-4c0f-8d52-0c1f0b6a1a01",
+    "statementDate": "2020-03-04",
+    "recordId": "c359f58d2977",
+    "recordType": "entity",
+    "recordStatus": "new",
+    "recordDetails": {
+        "entityType": {"type": "registeredEntity",
+          "details": "Private\tlimited \u0007company"},
+        "name": AWKWARD,
+        "alternateNames": ["Short\tname", "Plain"],
+        "jurisdiction": {"name": "United\tKingdom", "code": "GB"},
+        "identifiers": [{"id": "2063384560", "scheme": "GB-COH",
+          "uri": "find-and-update.company-information.service.gov.uk"}],
+    },
+    "publicationDetails": {
+        "publicationDate": "2020-03-04",
+        "bodsVersion": "0.4",
+        "publisher": {"name": "Tab\tLtd"},
+    },
+    "source": {"type": ["selfDeclaration"], "description": AWKWARD},
+}
+
+
+@pytest.mark.parametrize("grouped", [False, True])
+def test_round_trip_control_characters(plan, tmp_path, grouped):
+    second = dict(STATEMENT, statementId="second", recordId="second",
+      recordDetails=dict(STATEMENT["recordDetails"], name="Other\t\u0001"))
+    infile = tmp_path / "in.jsonl"
+    infile.write_text("".join(json.dumps(s) + "\n"
+      for s in [STATEMENT, second]), encoding="utf-8")
+    convert_file(Converter(plan), str(infile), str(tmp_path / "out.nq"))
+
+    outfile = tmp_path / "back.jsonl"
+    count = unconvert_file(plan, str(tmp_path / "out.nq"), str(outfile),
+      grouped=grouped, tmp_dir=str(tmp_path), run_size=3)
+    assert count == 2
+    statements = {s["statementId"]: s for s in
+      map(json.loads, outfile.read_text(encoding="utf-8").splitlines())}
+    assert statements[STATEMENT["statementId"]] == STATEMENT
+    assert statements["second"]["recordDetails"]["name"] == "Other\t\u0001"
+
+
+def test_grouped_needs_a_file(plan, tmp_path):
+    import os
+    import subprocess
+    import sys
+    from conftest import ROOT
+    fifo = str(tmp_path / "in.nq")
+    os.mkfifo(fifo)
+    with pytest.raises(ValueError, match="in.nq isn't a file"):
+        unconvert_file(plan, fifo, str(tmp_path / "out.jsonl"), grouped=True)
+
+    result = subprocess.run([sys.executable,
+      os.path.join(ROOT, "unconvert.py"), "-", str(tmp_path / "out.jsonl"),
+      "--grouped"], input="", capture_output=True, text=True)
+    assert result.returncode == 2
+    assert "--grouped reads the input twice" in result.stderr
@@ -0,0 +1,46 @@
+import pytest
+
+from validate import Validator, parse_quad, parse_term, unescape
+
+
+TABLES = {"properties": {}, "superclasses": {}, "instances": {}}
+
+
+def test_unescape():
+    assert unescape(r"a\tb\"c\'d\\e") == "a\tb\"c'd\\e"
+    assert unescape(r"é\U0001F600\b\f\n\r") == "é\U0001F600\b\f\n\r"
+    assert unescape("raw\ttab\u0007") == "raw\ttab\u0007"
+    with pytest.raises(ValueError):
+        unescape(r"\x41")
+
+
+def test_parse_term():
+    assert parse_term("<https://example.org/a>") == \
+      ("iri", "https://example.org/a")
+    assert parse_term("_:b1") == ("bnode", "_:b1")
+    assert parse_term('"a\tb\\U0001F600"') == ("literal", ("a\tb\U0001F600", None))
+    assert parse_term('"x"@en')[1] == \
+      ("x", "http://www.w3.org/1999/02/22-rdf-syntax-ns#langString")
+    assert parse_term('"1"^^<http://www.w3.org/2001/XMLSchema#float>')[1] == \
+      ("1", "http://www.w3.org/2001/XMLSchema#float")
+
+
+def test_parse_quad():
+    assert parse_quad('<a> <b> "c" <g> .')[3] == ("iri", "g")
+    assert parse_quad('<a> <b> "c" .')[3] is None
+    assert parse_quad('<a> <b> "\\q" .') is None
+    assert parse_quad("not a quad") is None
+
+
+def test_bad_lines_are_syntax_errors():
+    validator = Validator(TABLES)
+    validator.validate([
+        '<a> <b> "bad \\q escape" .\n',
+        '<a> <b> "raw\ttab" .\n',
+        "nonsense\n",
+    ])
+    summary = validator.summary()
+    assert summary["lines"] == 3
+    assert summary["counts"]["syntax"] == 2
+    assert [v["line"] for v in summary["violations"]
+      if v["kind"] == "syntax"] == [1, 3]
@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+
+from rdflib import Graph, Literal, RDF, RDFS, OWL, Namespace
+
+from conftest import ROOT
+from vocabdiff import diff_vocabs, format_diff
+
+BODS = Namespace("https://vocab.openownership.org/terms#")
+
+
+def changed_copy(g):
+    new = Graph()
+    for triple in g:
+        new.add(triple)
+    new.set((BODS.Person, RDFS.label, Literal("Human")))
+    new.add((BODS.Robot, RDF.type, OWL.Class))
+    new.remove((BODS.foundingDate, None, None))
+    return new
+
+
+def test_same_vocab(vocab):
+    assert diff_vocabs(vocab.g, vocab.g) == {}
+
+
+def test_diff(vocab):
+    diff = diff_vocabs(vocab.g, changed_copy(vocab.g))
+    assert diff == {
+      "owl:Class": {
+        "added": ["bods:Robot"],
+        "removed": [],
+        "changed": {"bods:Person": {"rdfs:label": {
+          "added": ['"Human"'],
+          "removed": ['"Person"'],
+        }}},
+      },
+      "rdf:Property": {
+        "added": [],
+        "removed": ["bods:foundingDate"],
+        "changed": {},
+      },
+    }
+    assert format_diff(diff).splitlines() == [
+      "owl:Class:",
+      "  + bods:Robot",
+      "  ~ bods:Person",
+      '      - rdfs:label "Person"',
+      '      + rdfs:label "Human"',
+      "rdf:Property:",
+      "  - bods:foundingDate",
+    ]
+
+
+def test_command(vocab, tmp_path):
+    old, new = str(tmp_path / "old.ttl"), str(tmp_path / "new.nt")
+    vocab.g.serialize(old, format="turtle")
+    changed_copy(vocab.g).serialize(new, format="nt",
+      encoding="utf-8")
+    script = os.path.join(ROOT, "vocabdiff.py")
+
+    same = subprocess.run([sys.executable, script, old, old],
+      capture_output=True, text=True)
+    assert (same.returncode, same.stdout) == (0, "")
+    result = subprocess.run([sys.executable, script, old, new, "--json"],
+      capture_output=True, text=True)
+    assert result.returncode == 1
+    assert json.loads(result.stdout) == diff_vocabs(vocab.g,
+      changed_copy(vocab.g))
@@ -0,0 +1,430 @@
+"""
+Convert RDF using the BODS vocabulary back to BODS v0.4 JSON, the reverse
+of convert.py.
+
+The input is N-Quads with one named graph per statement, as convert.py
+writes it, and the output is a statement per line of JSON Lines. The
+mapping plan is inverted: predicates (including renamed ones) back to
+JSON properties, flattened properties (such as the shares, formedByStatute
+and the politicalExposure details) back into their objects, and codelist
+instances and classes back to codes. Properties the mapping leaves out of
+the vocabulary (such as isComponent) can't be restored.
+
+Nodes in the default graph (the shared jurisdictions, publishers,
+addresses and so on) are kept in an SQLite file while the input is read,
+and the statements' quads are sorted by graph with an external sort, so
+memory use doesn't depend on the size of the input. If the input is
+already grouped by graph (as convert.py writes it), --grouped skips the
+sort.
+
+    python unconvert.py statements.nq statements.jsonl --plan bods-mapping-0.4.0.json
+"""
+import os
+import json
+import sqlite3
+import argparse
+import tempfile
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import groupby
+from urllib.parse import unquote
+
+from rdflib.namespace import RDF, XSD
+
+from helpers import *
+from bodsld import BODS, bods_vocab
+from convert import (DEFAULT_BASE, RUN_SIZE, open_input, load_plan,
+  merged_lines, reduce_shards)
+from validate import parse_term
+from constants import QUAD
+
+
+INSERT_BATCH = 10000
+SHARED_CACHE_SIZE = 1 << 14
+RECENT_GRAPHS = 1 << 16
+
+RDF_TYPE = str(RDF.type)
+# The order of a statement's properties in the schema, including the ones
+# that don't have rules in the plan
+STATEMENT_KEYS = ["statementId", "declaration", "declarationSubject",
+  "statementDate", "annotations", "publicationDetails", "source", "recordId",
+  "recordType", "recordStatus", "recordDetails"]
+
+
+def literal_value(value, datatype):
+    if datatype == str(XSD.boolean):
+        return value in ("true", "1")
+    if datatype in (str(XSD.float), str(XSD.double), str(XSD.decimal),
+      str(XSD.integer)):
+        # Numbers convert.py wrote keep their JSON form, eg. 100 and 12.5
+        try:
+            return json.loads(value)
+        except ValueError:
+            return float(value)
+    return value
+
+
+class SharedNodes:
+    """
+    The triples in the default graph, in an SQLite file, by subject.
+    """
+
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.execute("PRAGMA journal_mode=OFF")
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute(
+          "CREATE TABLE triples (subject TEXT, predicate TEXT, object TEXT)")
+        self.batch = []
+
+    def add(self, s, p, o):
+        self.batch.append((s, p, o))
+        if len(self.batch) >= INSERT_BATCH:
+            self.flush()
+
+    def flush(self):
+        self.db.executemany("INSERT INTO triples VALUES (?, ?, ?)",
+          self.batch)
+        self.batch = []
+
+    def finish(self):
+        self.flush()
+        self.db.execute("CREATE INDEX triples_subject ON triples (subject)")
+        self.db.commit()
+
+    def get(self, subject):
+        """
+        [(predicate, object)] N-Triples text for subject, in input order.
+        """
+        return self.db.execute("SELECT predicate, object FROM triples "
+          "WHERE subject = ? ORDER BY rowid", (subject,)).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+class Unconverter:
+    """
+    Turns the triples of a statement's graph back into a BODS statement,
+    using a plan from BODSVocab.mapping_plan. Record and declaration ids
+    are taken from their URIs under base.
+    """
+
+    def __init__(self, plan, shared, base=DEFAULT_BASE,
+      cache_size=SHARED_CACHE_SIZE):
+        self.plan = plan
+        self.base = base
+        self.shared = shared
+        self.shapes = {name: self.inverse(name) for name in plan["shapes"]}
+        self.record_types = {plan["shapes"][shape]["class"]: record_type
+          for record_type, shape in plan["records"].items()}
+        self.shared_node = lru_cache(cache_size)(self.make_shared_node)
+
+    def inverse(self, name, prefix=()):
+        """
+        For shape name, ({predicate: [(path, rule)]}, {class: (path, code)},
+        {paths that are arrays}), where path is the JSON keys a value goes
+        under (more than one for flattened properties), and code rules
+        have their tables inverted.
+        """
+        predicates, types, arrays = {}, {}, set()
+        shape = self.plan["shapes"][name]
+        arrays.update(prefix + (key,) for key in shape.get("arrays", []))
+        for key, rule in shape["fields"].items():
+            path = prefix + (key,)
+            kind = rule[0]
+            if kind == "flatten":
+                p, t, a = self.inverse(rule[1], path)
+                for pred, rules in p.items():
+                    predicates.setdefault(pred, []).extend(rules)
+                types.update(t)
+                arrays |= a
+            elif kind == "type":
+                for code, cls in rule[1].items():
+                    types[cls] = (path, code)
+            elif kind == "code":
+                codes = {uri: code for code, uri in rule[2].items()}
+                predicates.setdefault(rule[1], []).append(
+                  (path, ("code", rule[1], codes)))
+            else:
+                predicates.setdefault(rule[1], []).append((path, rule))
+        return predicates, types, arrays
+
+    def id_from(self, kind, uri):
+        prefix = f"{self.base}{kind}/"
+        if uri.startswith(prefix):
+            return unquote(uri[len(prefix):])
+        return uri
+
+    def statement(self, graph, lines):
+        """
+        The statement for the N-Triples text of its graph's triples, as
+        (s, p, o) tuples.
+        """
+        triples = {}
+        for s, p, o in lines:
+            triples.setdefault(s, []).append((p, o))
+        statement = {}
+        self.apply(statement, self.plan["statement"], triples.get(graph, []),
+          triples, statement)
+        keys = [k for k in STATEMENT_KEYS if k in statement]
+        return {k: statement[k] for k in keys + [k for k in statement
+          if k not in keys]}
+
+    def node(self, term, shape, triples, keys=None):
+        """
+        The JSON object for node term (N-Triples text) of shape, from the
+        statement's triples or the shared nodes. keys are the properties
+        the object can have, if shape has more than that (eg. Agent, which
+        is publishers with a url and sources' assertedBy with a uri).
+        """
+        keys = tuple(keys) if keys else None
+        pairs = triples.get(term)
+        if pairs is None:
+            return self.shared_node(term, shape, keys)
+        obj = {}
+        self.apply(obj, shape, pairs, triples, None, keys)
+        return obj
+
+    def make_shared_node(self, term, shape, keys):
+        obj = {}
+        self.apply(obj, shape, self.shared.get(term), {}, None, keys)
+        return obj
+
+    def apply(self, obj, shape, pairs, triples, statement, keys=None):
+        predicates, types, arrays = self.shapes[shape]
+        cls = self.plan["shapes"][shape]["class"]
+        for p, o in pairs:
+            kind, value = parse_term(o)
+            if p == f"<{RDF_TYPE}>":
+                if value != cls and value in types:
+                    path, code = types[value]
+                    self.put(obj, path, code, path in arrays)
+                continue
+            for path, rule in predicates.get(p[1:-1], []):
+                if keys and path[0] not in keys:
+                    continue
+                v = self.value(rule, kind, value, o, triples, statement)
+                if v is not None:
+                    self.put(obj, path, v, path in arrays)
+                    break
+        self.order(obj, shape)
+
+    def value(self, rule, kind, value, term, triples, statement):
+        """
+        The JSON value for an object, or None if rule doesn't fit it.
+        """
+        r = rule[0]
+        if r == "literal":
+            return literal_value(*value) if kind == "literal" else None
+        if r == "uri":
+            if kind == "literal" and value[1] == str(XSD.anyURI):
+                return value[0]
+            return value if kind == "iri" else None
+        if r == "code":
+            if kind == "literal":
+                return value[0]
+            return rule[2].get(value, value)
+        if kind == "literal":
+            return
+        if r == "node":
+            return self.node(term, rule[2], triples, rule[3:] and rule[3])
+        if r == "wrap":
+            obj = self.node(term, rule[2], triples)
+            return obj[rule[3]] if set(obj) == {rule[3]} else obj
+        if r == "record":
+            if kind == "bnode" or term in triples:
+                return self.node(term, self.plan["unspecified"], triples)
+            return self.id_from("records", value)
+        if r == "details":
+            pairs = triples.get(term, [])
+            classes = [parse_term(o)[1] for p, o in pairs
+              if p == f"<{RDF_TYPE}>"]
+            record_type = next((self.record_types[c] for c in classes
+              if c in self.record_types), None)
+            if record_type is None:
+                return
+            statement["recordType"] = record_type
+            statement.setdefault("recordId", self.id_from("records", value))
+            obj = {}
+            self.apply(obj, self.plan["records"][record_type], pairs,
+              triples, None)
+            return obj
+        if r == "declaration":
+            for p, o in triples.get(term, []):
+                if p == f"<{BODS.declarationSubject}>":
+                    statement["declarationSubject"] = self.id_from("records",
+                      parse_term(o)[1])
+            return self.id_from("declarations", value)
+
+    def put(self, obj, path, value, array):
+        for key in path[:-1]:
+            obj = obj.setdefault(key, {})
+        if array:
+            obj.setdefault(path[-1], []).append(value)
+        else:
+            obj[path[-1]] = value
+
+    def order(self, obj, shape):
+        """
+        Put obj's keys (and those of its flattened objects) in the order
+        of the schema.
+        """
+        fields = self.plan["shapes"][shape]["fields"]
+        keys = [k for k in fields if k in obj] + \
+          [k for k in obj if k not in fields]
+        for key in keys:
+            value = obj.pop(key)
+            rule = fields.get(key)
+            if rule and rule[0] == "flatten":
+                self.order(value, rule[1])
+            obj[key] = value
+
+
+def split_line(line):
+    """
+    The N-Triples text of a line's terms, or None for blank lines and
+    comments.
+    """
+    m = QUAD.match(line)
+    if not m:
+        if line.strip() and not line.lstrip().startswith("#"):
+            raise ValueError(f"not a triple or quad: {line.strip()[:200]}")
+        return
+    return m.groups()
+
+
+def graph_runs(quads, run_dir, run_size=RUN_SIZE):
+    """
+    Write (s, p, o, g) to sorted runs of run_size quads in run_dir, as
+    lines that sort by graph, then their place in the input.
+    Returns the runs' filenames.
+    """
+    runs = []
+    lines = []
+
+    def spill():
+        fn = os.path.join(run_dir, f"run-{len(runs):06d}.txt")
+        lines.sort()
+        with open(fn, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        runs.append(fn)
+
+    for seq, (s, p, o, g) in enumerate(quads):
+        lines.append(f"{g}\t{seq:012d}\t{s}\t{p}\t{o}\n")
+        if len(lines) >= run_size:
+            spill()
+            lines = []
+    if lines:
+        spill()
+    return runs
+
+
+def grouped_quads(infile, recent=RECENT_GRAPHS):
+    """
+    Yield (graph, [(s, p, o)]) for the named graphs in infile, which must
+    be grouped by graph. A graph that turns up again after others (within
+    the last recent graphs) is an error.
+    """
+    finished = OrderedDict()
+    with open_input(infile) as f:
+        quads = (q for q in map(split_line, f) if q and q[3])
+        for g, group in groupby(quads, key=lambda q: q[3]):
+            if g in finished:
+                raise ValueError(f"{infile} isn't grouped by graph "
+                  f"({g} turns up more than once)")
+            finished[g] = True
+            if len(finished) > recent:
+                finished.popitem(last=False)
+            yield g, [q[:3] for q in group]
+
+
+def unconvert_file(plan, infile, outfile, base=DEFAULT_BASE, grouped=False,
+  tmp_dir=None, run_size=RUN_SIZE):
+    """
+    Write the statements in the N-Quads file infile to outfile as JSON
+    Lines. Returns the number of statements.
+    With grouped, infile is read twice (first for the shared nodes, which
+    can come after the statements that use them), so it has to be a file,
+    not a pipe; raises ValueError if it isn't.
+    """
+    if grouped and not os.path.isfile(infile):
+        raise ValueError(f"{infile} isn't a file, and --grouped needs to "
+          "read it twice; leave out --grouped to sort it in one pass")
+    count = 0
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as work_dir:
+        shared = SharedNodes(os.path.join(work_dir, "shared.sqlite"))
+
+        def named(f):
+            for quad in map(split_line, f):
+                if quad is None:
+                    continue
+                if quad[3] is None:
+                    shared.add(*quad[:3])
+                else:
+                    yield quad
+
+        with open_input(infile) as f:
+            if grouped:
+                for _ in named(f):
+                    pass
+                runs = None
+            else:
+                runs = graph_runs(named(f), work_dir, run_size)
+        shared.finish()
+
+        if grouped:
+            graphs = grouped_quads(infile)
+        else:
+            # Only the object can have tabs in it (in a literal)
+            lines = (l.rstrip("\n").split("\t", 4)
+              for l in merged_lines(reduce_shards(runs)))
+            graphs = ((g, [q[2:] for q in group])
+              for g, group in groupby(lines, key=lambda q: q[0]))
+
+        unconverter = Unconverter(plan, shared, base)
+        with open(outfile, "w", encoding="utf-8") as out:
+            for graph, triples in graphs:
+                statement = unconverter.statement(graph, triples)
+                out.write(json.dumps(statement, ensure_ascii=False) + "\n")
+                count += 1
+        shared.close()
+    return count
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+      description="Convert N-Quads using the BODS vocabulary back to BODS "
+        "v0.4 JSON Lines.")
+    parser.add_argument("input",
+      help="N-Quads file, with a named graph for each statement")
+    parser.add_argument("output", help="JSON Lines file to write")
+    parser.add_argument("--base", default=DEFAULT_BASE,
+      help="base URI that record and declaration URIs are under")
+    parser.add_argument("--schema-dir", default="schemas")
+    parser.add_argument("--plan",
+      help="mapping plan written by bodsld.py, instead of building the "
+        "vocabulary from the schemas")
+    parser.add_argument("--grouped", action="store_true",
+      help="the input's quads are already grouped by graph, so don't sort "
+        "them")
+    parser.add_argument("--tmp-dir",
+      help="where the shared nodes and sorted quads are kept")
+    args = parser.parse_args()
+
+    if args.grouped and not os.path.isfile(args.input):
+        parser.error("--grouped reads the input twice, so it needs a file, "
+          "not a pipe; leave out --grouped to sort it in one pass")
+
+    if args.plan:
+        plan = load_plan(args.plan)
+    else:
+        schemas, codelists = get_schemas_and_codelists(args.schema_dir)
+        vocab = bods_vocab(schemas, codelists)
+        vocab.make_graph()
+        plan = vocab.mapping_plan()
+
+    count = unconvert_file(plan, args.input, args.output, args.base,
+      args.grouped, args.tmp_dir)
+    print(f"{count} statements.")
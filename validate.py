@@ -0,0 +1,326 @@
+"""
+Check converted BODS data against the domains and ranges in the vocabulary.
+
+The vocabulary graph is compiled once into tables (the domain and range of
+each property, each class's superclasses and the codelist instances), and
+N-Quads or N-Triples are read a block of lines at a time and checked against
+them, so memory use doesn't depend on the size of the input. The types of
+nodes seen are kept in a bounded cache, so a node can be typed in an earlier
+block (eg. a record) and used later. Domains and ranges can't be checked
+for nodes whose types haven't been seen by the end of the block they're
+used in, and these are counted as unchecked.
+
+Reported problems are:
+  unknown-predicate  a predicate that isn't in the vocabulary
+  unknown-class      an rdf:type that isn't a class in the vocabulary
+  unknown-code       a codelist URI that isn't in the vocabulary
+  wrong-datatype     a literal whose datatype isn't the property's range,
+                     or a literal where a node was expected, or the reverse
+  wrong-class        a node whose types aren't in the property's range
+  wrong-domain       a subject whose types aren't in the property's domain
+  syntax             a line that isn't a triple or quad
+"""
+import re
+import sys
+import json
+import argparse
+from collections import Counter, OrderedDict
+
+from rdflib import Graph
+from rdflib.namespace import RDF, RDFS, OWL, XSD
+
+from helpers import *
+from bodsld import CODES, bods_vocab
+from constants import QUAD
+
+
+BLOCK_SIZE = 10000
+TYPE_CACHE_SIZE = 1 << 20
+MAX_VIOLATIONS = 1000
+
+ESCAPE = re.compile(r"\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)")
+ECHARS = {"t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f", '"': '"',
+  "'": "'", "\\": "\\"}
+
+RDF_TYPE = str(RDF.type)
+LITERAL_RANGES = {str(RDFS.Literal), str(XSD.string)}
+LEXICAL_CHECKS = {
+    str(XSD.boolean): lambda v: v in ("true", "false", "1", "0"),
+    str(XSD.float): lambda v: bool(re.fullmatch(
+      r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|[+-]?INF|NaN", v)),
+}
+
+
+def constraint_tables(g):
+    """
+    Tables for checking data against vocabulary graph g, as plain dicts of
+    URI strings:
+      properties    {property: {"domain": [classes], "range": [classes]}}
+      superclasses  {class: [the class and all its superclasses]}
+      instances     {codelist instance: [classes]}
+    """
+    properties = {}
+    for p in set(g.subjects(RDFS.domain, None)) | \
+      set(g.subjects(RDFS.range, None)) | \
+      set(g.subjects(RDF.type, RDF.Property)) | \
+      set(g.subjects(RDF.type, OWL.ObjectProperty)) | \
+      set(g.subjects(RDF.type, OWL.DatatypeProperty)):
+        properties[str(p)] = {
+            "domain": sorted(map(str, g.objects(p, RDFS.domain))),
+            "range": sorted(map(str, g.objects(p, RDFS.range))),
+        }
+
+    classes = set(g.subjects(RDF.type, OWL.Class)) | \
+      set(g.subjects(RDF.type, RDFS.Class))
+    superclasses = {}
+    for c in classes:
+        superclasses[str(c)] = sorted(map(str,
+          g.transitive_objects(c, RDFS.subClassOf)))
+
+    instances = {}
+    for c in classes:
+        for i in g.subjects(RDF.type, c):
+            instances.setdefault(str(i), []).append(str(c))
+    return {
+        "properties": properties,
+        "superclasses": superclasses,
+        "instances": {i: sorted(cs) for i, cs in instances.items()},
+    }
+
+
+def unescape(text):
+    """
+    text with its N-Triples escapes (ECHAR and UCHAR) replaced. Raises
+    ValueError for anything else after a backslash.
+    """
+    if "\\" not in text:
+        return text
+
+    def replace(m):
+        escape = m.group(1)
+        if escape in ECHARS:
+            return ECHARS[escape]
+        if escape[0] in "uU" and len(escape) > 1:
+            return chr(int(escape[1:], 16))
+        raise ValueError(f"\\{escape} isn't an N-Triples escape")
+    return ESCAPE.sub(replace, text)
+
+
+def parse_term(text):
+    """
+    ("iri", uri), ("bnode", label) or ("literal", (value, datatype)).
+    Raises ValueError for bad escapes.
+    """
+    if text[0] == "<":
+        return "iri", unescape(text[1:-1])
+    if text[0] == "_":
+        return "bnode", text
+    end = text.rindex('"')
+    value = unescape(text[1:end])
+    rest = text[end + 1:]
+    if rest.startswith("^^"):
+        return "literal", (value, rest[3:-1])
+    if rest.startswith("@"):
+        return "literal", (value, str(RDF.langString))
+    return "literal", (value, None)
+
+
+def parse_quad(line):
+    """
+    The parsed terms of a line (see parse_term), with None for the graph
+    of a triple, or None if the line isn't a triple or quad.
+    """
+    m = QUAD.match(line)
+    if not m:
+        return
+    try:
+        return tuple(parse_term(t) if t else None for t in m.groups())
+    except ValueError:
+        return
+
+
+class Validator:
+    """
+    Checks quads against tables from constraint_tables, collecting counts
+    of each kind of problem and the first max_violations of them.
+    """
+
+    def __init__(self, tables, max_violations=MAX_VIOLATIONS,
+      type_cache_size=TYPE_CACHE_SIZE):
+        self.properties = tables["properties"]
+        self.superclasses = {c: set(s)
+          for c, s in tables["superclasses"].items()}
+        self.instances = tables["instances"]
+        self.types = OrderedDict()
+        self.type_cache_size = type_cache_size
+        self.counts = Counter()
+        self.unchecked = 0
+        self.violations = []
+        self.max_violations = max_violations
+        self.lines = 0
+
+    def report(self, kind, line, message):
+        self.counts[kind] += 1
+        if len(self.violations) < self.max_violations:
+            self.violations.append({"kind": kind, "line": line,
+              "message": message})
+
+    def add_type(self, node, cls):
+        types = self.types.get(node)
+        if types is None:
+            types = self.types[node] = set()
+            if len(self.types) > self.type_cache_size:
+                self.types.popitem(last=False)
+        else:
+            self.types.move_to_end(node)
+        types.add(cls)
+
+    def node_classes(self, node, kind):
+        """
+        All the classes node is known to be in, or None if it isn't known.
+        """
+        types = self.types.get(node) if kind != "literal" else None
+        if types is None and kind == "iri":
+            types = self.instances.get(node)
+        if types is None:
+            return
+        classes = set()
+        for t in types:
+            classes |= self.superclasses.get(t, {t})
+        return classes
+
+    def validate(self, lines):
+        """
+        Check an iterable of N-Quads or N-Triples lines, a block at a time.
+        """
+        block = []
+        for line in lines:
+            block.append(line)
+            if len(block) >= BLOCK_SIZE:
+                self.block(block)
+                block = []
+        if block:
+            self.block(block)
+
+    def block(self, lines):
+        quads = []
+        for line in lines:
+            self.lines += 1
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            quad = parse_quad(line)
+            if quad is None:
+                self.report("syntax", self.lines, line.strip()[:200])
+                continue
+            quads.append((self.lines, quad))
+            s, p, o, _ = quad
+            if p[1] == RDF_TYPE and o[0] == "iri":
+                self.add_type(s[1], o[1])
+        for n, quad in quads:
+            self.check(n, *quad[:3])
+
+    def check(self, n, s, p, o):
+        if p[1] == RDF_TYPE:
+            if o[0] != "iri" or o[1] not in self.superclasses:
+                self.report("unknown-class", n, f"{o[1]} isn't a class")
+            return
+
+        prop = self.properties.get(p[1])
+        if prop is None:
+            self.report("unknown-predicate", n, f"{p[1]} isn't a property")
+            return
+
+        if o[0] == "iri" and o[1].startswith(str(CODES)) and \
+          o[1] not in self.instances:
+            self.report("unknown-code", n, f"{o[1]} isn't a code")
+
+        if prop["domain"]:
+            classes = self.node_classes(s[1], s[0])
+            if classes is None:
+                self.unchecked += 1
+            elif classes.isdisjoint(prop["domain"]):
+                self.report("wrong-domain", n,
+                  f"{s[1]} isn't in the domain of {p[1]}")
+
+        if prop["range"]:
+            self.check_range(n, p[1], prop["range"], o)
+
+    def check_range(self, n, p, ranges, o):
+        datatypes = [r for r in ranges if r.startswith(str(XSD)) or
+          r in LITERAL_RANGES]
+        if o[0] == "literal":
+            value, datatype = o[1]
+            if any(r in LITERAL_RANGES for r in datatypes):
+                return
+            if datatype in datatypes:
+                check = LEXICAL_CHECKS.get(datatype)
+                if check and not check(value):
+                    self.report("wrong-datatype", n,
+                      f"{value!r} isn't a valid {datatype}")
+                return
+            expected = ", ".join(ranges)
+            self.report("wrong-datatype", n,
+              f"{p} has a {datatype or 'plain'} literal, not {expected}")
+            return
+
+        if str(RDFS.Resource) in ranges:
+            return
+        classes = [r for r in ranges if r not in datatypes]
+        if not classes:
+            self.report("wrong-datatype", n,
+              f"{p} has a node, not a {', '.join(ranges)} literal")
+            return
+        known = self.node_classes(o[1], o[0])
+        if known is None:
+            self.unchecked += 1
+        elif known.isdisjoint(classes):
+            self.report("wrong-class", n,
+              f"{o[1]} isn't a {', '.join(classes)} for {p}")
+
+    def summary(self):
+        return {
+            "lines": self.lines,
+            "unchecked": self.unchecked,
+            "counts": dict(sorted(self.counts.items())),
+            "violations": sorted(self.violations, key=lambda v: v["line"]),
+        }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+      description="Check N-Quads or N-Triples against the BODS vocabulary.")
+    parser.add_argument("input", help="N-Quads or N-Triples file")
+    parser.add_argument("--vocab",
+      help="vocabulary file to check against, instead of building the "
+        "vocabulary from the schemas")
+    parser.add_argument("--schema-dir", default="schemas")
+    parser.add_argument("--max-violations", type=int, default=MAX_VIOLATIONS,
+      help="how many problems to list (all of them are counted)")
+    parser.add_argument("--json", action="store_true",
+      help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.vocab:
+        g = Graph().parse(args.vocab)
+    else:
+        schemas, codelists = get_schemas_and_codelists(args.schema_dir)
+        vocab = bods_vocab(schemas, codelists)
+        vocab.make_graph()
+        g = vocab.g
+
+    validator = Validator(constraint_tables(g), args.max_violations)
+    with open(args.input, encoding="utf-8") as f:
+        validator.validate(f)
+
+    summary = validator.summary()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for v in summary["violations"]:
+            print(f"{args.input}:{v['line']}: {v['kind']}: {v['message']}")
+        print(f"{summary['lines']} lines, "
+          f"{summary['unchecked']} domains/ranges unchecked, "
+          f"{sum(summary['counts'].values())} problems "
+          f"{summary['counts'] or ''}".rstrip())
+    sys.exit(1 if summary["counts"] else 0)
@@ -0,0 +1,142 @@
+"""
+Compare two generated vocabularies term by term.
+
+Each side is a vocabulary file (any format rdflib can read) or a schema
+directory to build one from. Terms are indexed by subject and predicate,
+so the comparison is a dict lookup per term rather than a graph
+isomorphism, and the report lists the terms that were added or removed
+and, for terms in both, the values that changed, grouped by the terms'
+types (owl:Class, rdf:Property and so on):
+
+    python vocabdiff.py old/bods-vocabulary-0.4.0.ttl bods-vocabulary-0.4.0.ttl
+    python vocabdiff.py schemas-main schemas --json
+"""
+import sys
+import json
+import argparse
+import contextlib
+
+from rdflib import Graph, URIRef, Literal
+from rdflib.namespace import RDF
+
+from helpers import *
+from bodsld import NAMESPACES, bods_vocab
+
+
+def load_vocab(path):
+    """
+    The graph for a vocabulary file, or for the vocabulary built from the
+    schemas in a directory.
+    """
+    if os.path.isdir(path):
+        schemas, codelists = get_schemas_and_codelists(path)
+        with contextlib.redirect_stdout(sys.stderr):
+            vocab = bods_vocab(schemas, codelists)
+            vocab.make_graph()
+        return vocab.g
+    return Graph().parse(path)
+
+
+def index_terms(g):
+    """
+    {term: {predicate: {values}}} for each URI subject in g.
+    """
+    terms = {}
+    for s, p, o in g:
+        if isinstance(s, URIRef):
+            terms.setdefault(s, {}).setdefault(p, set()).add(o)
+    return terms
+
+
+def compact(term):
+    for prefix, ns in NAMESPACES.items():
+        if str(term).startswith(str(ns)):
+            return f"{prefix}:{str(term)[len(str(ns)):]}"
+    return str(term)
+
+
+def value_text(term):
+    if isinstance(term, Literal):
+        text = json.dumps(str(term), ensure_ascii=False)
+        if term.language:
+            return f"{text}@{term.language}"
+        if term.datatype:
+            return f"{text}^^{compact(term.datatype)}"
+        return text
+    return compact(term)
+
+
+def term_group(props):
+    types = props.get(RDF.type)
+    return ", ".join(sorted(map(compact, types))) if types else "(untyped)"
+
+
+def diff_vocabs(old, new):
+    """
+    Compare two graphs, returning {group: {"added": [terms],
+    "removed": [terms], "changed": {term: {predicate: {"added": [values],
+    "removed": [values]}}}}}, where group is the terms' types (from the
+    new graph, or the old one for removed terms). Everything is compacted
+    to CURIEs and sorted, so the result can be written out as JSON.
+    """
+    old, new = index_terms(old), index_terms(new)
+    groups = {}
+
+    def group(name):
+        return groups.setdefault(name, {"added": [], "removed": [],
+          "changed": {}})
+
+    for term in sorted(old.keys() | new.keys()):
+        if term not in old:
+            group(term_group(new[term]))["added"].append(compact(term))
+        elif term not in new:
+            group(term_group(old[term]))["removed"].append(compact(term))
+        elif old[term] != new[term]:
+            changes = {}
+            for p in sorted(old[term].keys() | new[term].keys()):
+                before = old[term].get(p, set())
+                after = new[term].get(p, set())
+                if before != after:
+                    changes[compact(p)] = {
+                        "added": sorted(map(value_text, after - before)),
+                        "removed": sorted(map(value_text, before - after)),
+                    }
+            group(term_group(new[term]))["changed"][compact(term)] = changes
+    return dict(sorted(groups.items()))
+
+
+def format_diff(diff):
+    lines = []
+    for name, group in diff.items():
+        lines.append(f"{name}:")
+        for term in group["added"]:
+            lines.append(f"  + {term}")
+        for term in group["removed"]:
+            lines.append(f"  - {term}")
+        for term, changes in group["changed"].items():
+            lines.append(f"  ~ {term}")
+            for p, values in changes.items():
+                for v in values["removed"]:
+                    lines.append(f"      - {p} {v}")
+                for v in values["added"]:
+                    lines.append(f"      + {p} {v}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+      description="Show the terms that differ between two vocabularies.")
+    parser.add_argument("old", help="vocabulary file or schema directory")
+    parser.add_argument("new", help="vocabulary file or schema directory")
+    parser.add_argument("--json", action="store_true",
+      help="write the differences as JSON")
+    args = parser.parse_args()
+
+    diff = diff_vocabs(load_vocab(args.old), load_vocab(args.new))
+    if args.json:
+        print(json.dumps(diff, indent=2))
+    elif diff:
+        print(format_diff(diff))
+    # Like diff, exit with 1 if there are differences
+    sys.exit(1 if diff else 0)